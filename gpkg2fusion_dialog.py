@@ -1,20 +1,15 @@
 # -*- coding: utf-8 -*-
-from qgis.PyQt import uic
+import os
 from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QMessageBox
-from qgis.PyQt.QtCore import QObject, pyqtSignal
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsApplication
 from pathlib import Path
-from .gpkg2fusion_tool import fusionar_vectores
-import os
-
-# Cargar el UI
-FORM_CLASS, _ = uic.loadUiType(os.path.join(
-    os.path.dirname(__file__), 'gpkg2fusion_dialog.ui'))
+from .gpkg_perfiles import PERFILES_SQLITE, PERFIL_POR_DEFECTO
+from .gpkg_escaneo import patrones_desde_texto
+from .gpkg_log import CanalLog
+from .gpkg_ui import clase_formulario
 
-
-class LoggerEmitter(QObject):
-    """Objeto que emite señales de log para ser conectadas al QTextEdit en el hilo GUI."""
-    signal = pyqtSignal(str)
+# Cargar el UI (compilado en caché)
+FORM_CLASS, _ = clase_formulario('gpkg2fusion_dialog')
 
 
 class Gpkg2FusionDialog(QDialog, FORM_CLASS):
@@ -22,8 +17,9 @@ class Gpkg2FusionDialog(QDialog, FORM_CLASS):
         super().__init__(parent)
         self.setupUi(self)
 
-        self._log_emitter = LoggerEmitter()
-        self._log_emitter.signal.connect(self._append_log_threadsafe)
+        # La tarea escribe el log desde su hilo; el canal lo vuelca al widget en el hilo GUI
+        self.canal_log = CanalLog(self.logTextEdit, etiqueta=self.progresoLabel)
+        self.canal_log.enlazar(self.filtroLogComboBox, self.buscarLogLineEdit)
 
         # Conectar botones
         self.inputBrowseButton.clicked.connect(self.select_input_folder)
@@ -33,10 +29,13 @@ class Gpkg2FusionDialog(QDialog, FORM_CLASS):
 
         self.task = None
         self.task_active = False
-        self.logTextEdit.append("📦 Herramienta de fusión de GPKG")
 
-    def _append_log_threadsafe(self, msg: str):
-        self.logTextEdit.append(msg)
+        # Perfiles SQLite disponibles
+        for clave, perfil in PERFILES_SQLITE.items():
+            self.perfilComboBox.addItem(perfil["etiqueta"], clave)
+        self.perfilComboBox.setCurrentIndex(self.perfilComboBox.findData(PERFIL_POR_DEFECTO))
+        self.procesosSpinBox.setValue(os.cpu_count() or 1)
+        self.canal_log.escribir("📦 Herramienta de fusión de GPKG")
 
     def select_input_folder(self):
         folder = QFileDialog.getExistingDirectory(self, "Seleccionar carpeta de entrada")
@@ -83,33 +82,57 @@ class Gpkg2FusionDialog(QDialog, FORM_CLASS):
                 return
 
         # Limpiar log
-        self.logTextEdit.clear()
-        self.logTextEdit.append("📦 Iniciando proceso de fusión...\n")
+        self.canal_log.limpiar()
+        self.canal_log.escribir("📦 Iniciando proceso de fusión...\n")
 
         # Crear tarea y agregar al task manager
         self.task = GpkgToFusionTask(
             input_path,
             output_path,
-            log_emitter=self._log_emitter,
-            dialog=self
+            canal_log=self.canal_log,
+            dialog=self,
+            opciones=self.leer_opciones()
         )
         self.task_active = True
         self.runButton.setEnabled(False)
+        self.progressBar.setValue(0)
+        self.task.progressChanged.connect(lambda valor: self.progressBar.setValue(int(valor)))
         QgsApplication.taskManager().addTask(self.task)
 
+    def leer_opciones(self):
+        """Devuelve las opciones del motor de fusión elegidas en el diálogo."""
+        return {
+            "modo_lote": self.loteCheckBox.isChecked(),
+            "capas_por_lote": self.loteSpinBox.value(),
+            "indice_diferido": self.indiceDiferidoCheckBox.isChecked(),
+            "motor_sql": self.motorSqlCheckBox.isChecked(),
+            "union": self.unionCheckBox.isChecked(),
+            "perfil_sqlite": self.perfilComboBox.currentData(),
+            "paralelo": self.paraleloCheckBox.isChecked(),
+            "procesos": self.procesosSpinBox.value(),
+            "incremental": self.incrementalCheckBox.isChecked(),
+            "reanudar": self.reanudarCheckBox.isChecked(),
+            "memoria_max_mb": self.memoriaSpinBox.value() or None,
+            "escaneo": {
+                "excluir": patrones_desde_texto(self.excluirLineEdit.text()),
+                "profundidad_max": None if self.profundidadSpinBox.value() < 0 else self.profundidadSpinBox.value(),
+            },
+        }
+
     def cancel_task(self):
         if self.task_active and self.task:
             self.task.cancel()
-            self.logTextEdit.append("⏹ Cancelando tarea...")
+            self.canal_log.escribir("⏹ Cancelando tarea...")
 
 
 # ----------------------------------------------------
 class GpkgToFusionTask(QgsTask):
-    def __init__(self, input_path, output_path, log_emitter: LoggerEmitter, dialog):
+    def __init__(self, input_path, output_path, canal_log: CanalLog, dialog, opciones=None):
         super().__init__("Fusión de GPKG")
         self.input_path = input_path
         self.output_path = output_path
-        self.log_emitter = log_emitter
+        self.opciones = opciones or {}
+        self.canal_log = canal_log
         self.dialog = dialog
         self.cancelled_flag = False
 
@@ -123,15 +146,25 @@ class GpkgToFusionTask(QgsTask):
 
         def log_cb(msg):
             QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
-            if self.log_emitter:
-                self.log_emitter.signal.emit(msg)
+            if self.canal_log:
+                self.canal_log.escribir(msg)
+
+        # Callback de progreso: barra de la tarea y línea de estado del diálogo
+        def progreso_cb(progreso):
+            self.setProgress(progreso.porcentaje)
+            if self.canal_log:
+                self.canal_log.estado(progreso.describir())
 
         try:
+            # El motor se importa al lanzar la tarea, no al abrir el diálogo
+            from .gpkg2fusion_tool import fusionar_vectores
             fusionar_vectores(
                 self.input_path,
                 self.output_path,
                 log_cb=log_cb,
-                cancel_cb=cancel_cb
+                cancel_cb=cancel_cb,
+                progreso_cb=progreso_cb,
+                **self.opciones
             )
         except Exception as e:
             log_cb(f"❌ Error durante la fusión: {e}")
@@ -141,7 +174,10 @@ class GpkgToFusionTask(QgsTask):
     def finished(self, result):
         if self.dialog:
             self.dialog.task_active = False
+            if not self.cancelled_flag and hasattr(self.dialog, "progressBar"):
+                self.dialog.progressBar.setValue(100)
             if hasattr(self.dialog, "runButton"):
                 self.dialog.runButton.setEnabled(True)
-        if self.log_emitter:
-            self.log_emitter.signal.emit("✅ Tarea finalizada.")
+        if self.canal_log:
+            self.canal_log.escribir("✅ Tarea finalizada.")
+            self.canal_log.volcar()
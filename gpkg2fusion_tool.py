@@ -1,7 +1,23 @@
 # -*- coding: utf-8 -*-
+import json
+import shutil
+import tempfile
+import time
+from concurrent.futures import wait
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
 from osgeo import ogr
 from qgis.core import QgsMessageLog, Qgis
+from .gpkg_utils import (DiarioReanudacion, LineasEnDisco, PresupuestoMemoria, aplicar_perfil_sqlite, capas_gpkg,
+                         consultar_sql, describir_perfil, ejecutar_sql, hash_archivo)
+from .gpkg_copia_sql import CopiaSQLNoSoportada, adjuntar, copiar_tabla_sql, separar
+from .gpkg_paralelo import crear_pool, copiar_a_staging, numero_procesos, repartir
+from .gpkg_escaneo import escanear
+from .gpkg_tuberia import en_segundo_plano, etapa
+from .gpkg_progreso import Progreso
+
+TABLA_MANIFIESTO = "gpkg_tools_manifiesto"
+CAMPO_ORIGEN = "archivo_origen"
 
 def obtener_nombre_unico(base, existentes):
     """Genera un nombre único basado en 'base' que no exista en 'existentes'."""
@@ -13,55 +29,688 @@ def obtener_nombre_unico(base, existentes):
     existentes.add(nombre)
     return nombre
 
-def abrir_gpkg(path):
-    ds = ogr.Open(str(path))
+def abrir_gpkg(path, perfil_sqlite=None, cache_max_kb=None):
+    with aplicar_perfil_sqlite(perfil_sqlite, lectura=True, cache_max_kb=cache_max_kb):
+        ds = ogr.Open(str(path))
     if not ds:
         raise RuntimeError(f"No se pudo abrir: {path}")
     return ds
 
-def copiar_capa(in_layer, out_ds, nombre_capa):
+def copiar_capa(in_layer, out_ds, nombre_capa, opciones_capa=None):
     """Copia la capa sin reproyectar, retorna el EPSG original de la capa."""
     srs = in_layer.GetSpatialRef()
     epsg = srs.GetAttrValue("AUTHORITY", 1) if srs else "Sin CRS"
-    out_layer = out_ds.CopyLayer(in_layer, nombre_capa)
+    out_layer = out_ds.CopyLayer(in_layer, nombre_capa, opciones_capa or [])
     if not out_layer:
         raise RuntimeError(f"Error copiando capa {nombre_capa}")
     return out_layer, epsg
 
-def procesar_gpkg(ruta, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb=None, cancel_cb=None):
-    """Procesa todas las capas de un GPKG y las añade al GPKG de salida."""
-    in_ds = abrir_gpkg(ruta)
-    for i in range(in_ds.GetLayerCount()):
-        if cancel_cb and cancel_cb():
+class LoteTransacciones:
+    """
+    Agrupa las copias de capas en transacciones explícitas sobre el GPKG de salida,
+    confirmando cada 'capas_por_lote' capas o 'entidades_por_lote' entidades.
+    'al_confirmar()' se llama tras cada confirmación.
+    """
+
+    def __init__(self, out_ds, capas_por_lote=100, entidades_por_lote=None, al_confirmar=None):
+        self.out_ds = out_ds
+        self.capas_por_lote = capas_por_lote
+        self.entidades_por_lote = entidades_por_lote
+        self.al_confirmar = al_confirmar
+        self.capas = 0
+        self.entidades = 0
+        self.commits = 0
+        self.activa = False
+
+    def iniciar(self):
+        if not self.activa:
+            if self.out_ds.StartTransaction() != ogr.OGRERR_NONE:
+                raise RuntimeError("No se pudo iniciar la transacción en el GPKG de salida")
+            self.activa = True
+
+    def registrar(self, entidades):
+        """Contabiliza una capa copiada y confirma el lote si se alcanzó algún límite."""
+        self.capas += 1
+        self.entidades += entidades
+        if (self.capas_por_lote and self.capas >= self.capas_por_lote) or \
+                (self.entidades_por_lote and self.entidades >= self.entidades_por_lote):
+            self.confirmar()
+
+    def confirmar(self):
+        if self.activa:
+            if self.out_ds.CommitTransaction() != ogr.OGRERR_NONE:
+                raise RuntimeError("No se pudo confirmar la transacción en el GPKG de salida")
+            self.activa = False
+            self.commits += 1
+        self.capas = 0
+        self.entidades = 0
+        if self.al_confirmar:
+            self.al_confirmar()
+
+def tipo_comun(a, b):
+    """Tipo de campo OGR que admite valores de los tipos 'a' y 'b' (numérico más amplio o texto)."""
+    if a == b:
+        return a
+    numericos = [ogr.OFTInteger, ogr.OFTInteger64, ogr.OFTReal]
+    if a in numericos and b in numericos:
+        return max(a, b, key=numericos.index)
+    return ogr.OFTString
+
+class UnionCapas:
+    """
+    Fusión por unión: las capas con el mismo nombre, tipo de geometría y CRS se
+    añaden a una sola tabla del GPKG de salida, con la unión de sus campos y el
+    campo CAMPO_ORIGEN con la ruta relativa del GPKG de origen. Las tablas se crean
+    sin índice espacial (se construye uno por tabla al final) y guardan el nombre
+    original de la capa en su descripción, para reconocerlas al reanudar.
+    """
+
+    def __init__(self, out_ds, carpeta, capas_existentes):
+        self.out_ds = out_ds
+        self.carpeta = carpeta
+        self.capas_existentes = capas_existentes
+        self.tablas = {}
+        for i in range(out_ds.GetLayerCount()):
+            layer = out_ds.GetLayerByIndex(i)
+            nombre_original = layer.GetMetadataItem("DESCRIPTION")
+            if nombre_original and layer.GetLayerDefn().GetFieldIndex(CAMPO_ORIGEN) >= 0:
+                self.tablas.setdefault(self._clave(layer, nombre_original), layer.GetName())
+
+    @staticmethod
+    def _clave(layer, nombre_original):
+        srs = layer.GetSpatialRef()
+        if srs is None:
+            crs = ""
+        elif srs.GetAuthorityName(None) and srs.GetAuthorityCode(None):
+            crs = f"{srs.GetAuthorityName(None)}:{srs.GetAuthorityCode(None)}"
+        else:
+            crs = srs.ExportToWkt()
+        return nombre_original.lower(), layer.GetGeomType(), crs
+
+    def nombre_tabla(self, in_layer, nombre_original):
+        """Nombre de la tabla de salida del grupo de 'in_layer' (reservado, aunque aún no exista)."""
+        clave = self._clave(in_layer, nombre_original)
+        if clave not in self.tablas:
+            self.tablas[clave] = obtener_nombre_unico(nombre_original, self.capas_existentes)
+        return self.tablas[clave]
+
+    def _tabla(self, in_layer, nombre_original, nombre, opciones_capa=None):
+        out_layer = self.out_ds.GetLayerByName(nombre)
+        if out_layer:
+            return out_layer
+        opciones = [o for o in opciones_capa or [] if not o.upper().startswith("SPATIAL_INDEX=")]
+        opciones += ["SPATIAL_INDEX=NO", f"DESCRIPTION={nombre_original}"]
+        if in_layer.GetGeometryColumn():
+            opciones.append(f"GEOMETRY_NAME={in_layer.GetGeometryColumn()}")
+        out_layer = self.out_ds.CreateLayer(nombre, in_layer.GetSpatialRef(), in_layer.GetGeomType(), opciones)
+        if not out_layer or out_layer.CreateField(ogr.FieldDefn(CAMPO_ORIGEN, ogr.OFTString)) != ogr.OGRERR_NONE:
+            raise RuntimeError(f"No se pudo crear la tabla {nombre}")
+        return out_layer
+
+    @staticmethod
+    def _unir_campos(in_layer, out_layer):
+        """Añade a 'out_layer' los campos de 'in_layer' que no tiene y amplía el tipo de los que difieren."""
+        in_defn = in_layer.GetLayerDefn()
+        for i in range(in_defn.GetFieldCount()):
+            campo = in_defn.GetFieldDefn(i)
+            out_defn = out_layer.GetLayerDefn()
+            j = out_defn.GetFieldIndex(campo.GetName())
+            if j < 0:
+                if out_layer.CreateField(campo) != ogr.OGRERR_NONE:
+                    raise RuntimeError(f"No se pudo añadir el campo {campo.GetName()}")
+                continue
+            actual = out_defn.GetFieldDefn(j)
+            tipo = tipo_comun(actual.GetType(), campo.GetType())
+            if tipo != actual.GetType():
+                if out_layer.AlterFieldDefn(j, ogr.FieldDefn(actual.GetName(), tipo),
+                                            ogr.ALTER_TYPE_FLAG) != ogr.OGRERR_NONE:
+                    raise RuntimeError(f"No se pudo ampliar el tipo del campo {actual.GetName()}")
+
+    def anadir(self, ruta, in_layer, nombre_original, nombre, opciones_capa=None):
+        """
+        Añade las entidades de 'in_layer' (del GPKG 'ruta') a la tabla 'nombre'.
+        Debe llamarse dentro de una transacción: si falla una entidad, se borran las
+        de esta capa y la tabla queda como estaba.
+        Retorna las entidades añadidas.
+        """
+        out_layer = self._tabla(in_layer, nombre_original, nombre, opciones_capa)
+        self._unir_campos(in_layer, out_layer)
+        defn = out_layer.GetLayerDefn()
+        i_origen = defn.GetFieldIndex(CAMPO_ORIGEN)
+        origen = ruta.relative_to(self.carpeta).as_posix()
+
+        fids = []
+        try:
+            in_layer.ResetReading()
+            for in_feat in in_layer:
+                out_feat = ogr.Feature(defn)
+                out_feat.SetFrom(in_feat)
+                out_feat.SetGeometry(in_feat.GetGeometryRef())
+                out_feat.SetFID(-1)
+                out_feat.SetField(i_origen, origen)
+                if out_layer.CreateFeature(out_feat) != ogr.OGRERR_NONE:
+                    raise RuntimeError(f"No se pudo añadir la entidad {in_feat.GetFID()}")
+                fids.append(out_feat.GetFID())
+        except Exception:
+            self._deshacer(out_layer, fids)
+            raise
+        return len(fids)
+
+    def _deshacer(self, out_layer, fids):
+        """
+        Borra las entidades 'fids' recién añadidas a 'out_layer'. Se borran con OGR (no con
+        ROLLBACK TO) para que GDAL descuente el recuento que guarda en gpkg_ogr_contents,
+        y la extensión se recalcula porque OGR solo la amplía.
+        """
+        for fid in reversed(fids):
+            if out_layer.DeleteFeature(fid) != ogr.OGRERR_NONE:
+                raise RuntimeError(f"No se pudo deshacer la entidad {fid} de {out_layer.GetName()}")
+        # Comando SQL propio del controlador GPKG de GDAL: el nombre va sin comillas
+        ejecutar_sql(self.out_ds, f"RECOMPUTE EXTENT ON {out_layer.GetName()}")
+
+def limpiar_union(out_ds, completados, log_cb=None, trozo=10000):
+    """
+    Al reanudar una fusión por unión, borra de las tablas unidas las entidades de los
+    archivos que no figuran en 'completados' (rutas relativas), es decir, las que
+    quedaron confirmadas de archivos fusionados a medias. Se borran con OGR, para que
+    GDAL descuente el recuento de gpkg_ogr_contents, en transacciones de 'trozo' entidades.
+    """
+    for i in range(out_ds.GetLayerCount()):
+        layer = out_ds.GetLayerByIndex(i)
+        if layer.GetLayerDefn().GetFieldIndex(CAMPO_ORIGEN) < 0:
+            continue
+        tabla = layer.GetName().replace('"', '""')
+        origenes = consultar_sql(out_ds, f'SELECT DISTINCT "{CAMPO_ORIGEN}" FROM "{tabla}"')
+        if origenes is None:
+            raise RuntimeError(f"No se pudieron leer los orígenes de {layer.GetName()}")
+        borradas = 0
+        for (origen,) in origenes:
+            if origen not in completados:
+                borradas += _borrar_origen(out_ds, layer, origen, trozo)
+        if borradas:
+            # Comando SQL propio del controlador GPKG de GDAL: el nombre va sin comillas
+            ejecutar_sql(out_ds, f"RECOMPUTE EXTENT ON {layer.GetName()}")
             if log_cb:
-                log_cb("⏹ Cancelación detectada, deteniendo fusión...")
-            return
+                log_cb(f"🧹 {layer.GetName()}: eliminadas {borradas} entidades de archivos fusionados a medias")
 
-        in_layer = in_ds.GetLayerByIndex(i)
-        if in_layer.GetFeatureCount() == 0:
-            msg = f"⚠️ {ruta.name} → {in_layer.GetName()}: vacía, ignorada"
-            resumen.append(msg)
+def _borrar_origen(out_ds, layer, origen, trozo):
+    """Borra de 'layer' las entidades con CAMPO_ORIGEN 'origen', por trozos de FID crecientes."""
+    condicion = f'"{CAMPO_ORIGEN}" IS NULL' if origen is None else f'"{CAMPO_ORIGEN}" = {_sql_texto(origen)}'
+    campo_fid = (layer.GetFIDColumn() or "fid").replace('"', '""')
+    defn = layer.GetLayerDefn()
+    # Solo hacen falta los FID: no se leen atributos ni geometrías
+    layer.SetIgnoredFields([defn.GetFieldDefn(j).GetName() for j in range(defn.GetFieldCount())]
+                           + ["OGR_GEOMETRY"])
+    borradas, ultimo = 0, None
+    try:
+        while True:
+            filtro = condicion if ultimo is None else f'({condicion}) AND "{campo_fid}" > {ultimo}'
+            layer.SetAttributeFilter(filtro)
+            fids = []
+            for feat in layer:
+                fids.append(feat.GetFID())
+                if len(fids) >= trozo:
+                    break
+            if not fids:
+                return borradas
+            out_ds.StartTransaction()
+            try:
+                for fid in fids:
+                    if layer.DeleteFeature(fid) != ogr.OGRERR_NONE:
+                        raise RuntimeError(f"No se pudo borrar la entidad {fid} de {layer.GetName()}")
+            except Exception:
+                out_ds.RollbackTransaction()
+                raise
+            out_ds.CommitTransaction()
+            borradas += len(fids)
+            ultimo = max(fids)
+    finally:
+        layer.SetAttributeFilter(None)
+        layer.SetIgnoredFields([])
+
+def construir_indices_espaciales(out_ds, log_cb=None, cancel_cb=None):
+    """
+    Construye en una sola pasada el R-tree de todas las capas con geometría del GPKG
+    de salida que no lo tengan. Las capas en las que falla se informan con ❌ y no se
+    cuentan. Retorna (capas indexadas, segundos empleados).
+    """
+    inicio = time.perf_counter()
+    indexadas = 0
+    for i in range(out_ds.GetLayerCount()):
+        if cancel_cb and cancel_cb():
+            if log_cb: log_cb("⏹ Cancelación detectada, índices espaciales incompletos")
+            break
+        layer = out_ds.GetLayerByIndex(i)
+        columna = layer.GetGeometryColumn()
+        if layer.GetGeomType() == ogr.wkbNone or not columna:
+            continue
+        tabla = layer.GetName().replace("'", "''")
+        columna = columna.replace("'", "''")
+        filas = consultar_sql(out_ds, f"SELECT HasSpatialIndex('{tabla}', '{columna}')")
+        if filas and filas[0][0]:
+            continue
+        filas = consultar_sql(out_ds, f"SELECT CreateSpatialIndex('{tabla}', '{columna}')")
+        if not filas or not filas[0][0]:
+            msg = f"❌ {layer.GetName()}: no se pudo construir el índice espacial"
             if log_cb: log_cb(msg)
-            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Warning)
+            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
             continue
+        indexadas += 1
+    return indexadas, time.perf_counter() - inicio
 
-        nombre_capa_salida = obtener_nombre_unico(f"{ruta.stem}_{in_layer.GetName()}", capas_existentes)
-        try:
-            out_layer, epsg = copiar_capa(in_layer, out_ds, nombre_capa_salida)
+@contextmanager
+def origen_adjunto(out_ds, ruta, lote=None, log_cb=None):
+    """
+    Adjunta el GPKG 'ruta' a la conexión del GPKG de salida para copiar sus tablas
+    con SQL. ATTACH y DETACH no se permiten dentro de una transacción, así que el
+    lote en curso se confirma antes de adjuntar y antes de separar. Genera los
+    contadores de copia_sql para fusionar_capa, o None si no se pudo adjuntar.
+    """
+    if lote:
+        lote.confirmar()
+    try:
+        adjuntar(out_ds, ruta)
+    except CopiaSQLNoSoportada as e:
+        if log_cb: log_cb(f"⚠️ {ruta.name}: copia con SQL no disponible ({e}), se copia con OGR")
+        yield None
+        return
+    try:
+        yield {"sql": 0, "ogr": 0}
+    finally:
+        if lote:
+            lote.confirmar()
+        separar(out_ds)
+
+def tablas_gpkg(out_ds, nombres):
+    """
+    Cuáles de los 'nombres' son tablas registradas en gpkg_contents (incluidas las
+    copiadas con SQL, que OGR aún no ve). Solo consulta esos nombres, no toda la tabla.
+    """
+    nombres = [n for n in nombres if n]
+    if not nombres:
+        return set()
+    lista = ", ".join(_sql_texto(n) for n in nombres)
+    return {fila[0] for fila in consultar_sql(out_ds, f"SELECT table_name FROM gpkg_contents "
+                                                      f"WHERE table_name IN ({lista})") or []}
+
+def fusionar_capa(ruta, in_layer, nombre_original, n_entidades, out_ds, capas_existentes, resumen, capas_sin_crs,
+                  log_cb=None, lote=None, opciones_capa=None, error=None, copia_sql=None, union=None,
+                  progreso=None):
+    """
+    Copia una capa de 'ruta' al GPKG de salida con un nombre único y registra el resultado.
+    'n_entidades' puede ser None si se sabe que la capa no está vacía pero no cuántas tiene.
+    'error' permite registrar una capa que ya falló antes de llegar aquí (p. ej. en un proceso hijo).
+    Si el GPKG de origen está adjuntado (ver origen_adjunto), 'copia_sql' son sus contadores
+    y la tabla se copia con gpkg_copia_sql; si no lo admite, se copia con CopyLayer.
+    Con 'union' (UnionCapas) las entidades se añaden a la tabla del grupo de la capa.
+    Si se indica, la capa (y sus entidades) se anota en 'progreso' (gpkg_progreso.Progreso).
+    Retorna el nombre asignado en el GPKG de salida (None si la capa estaba vacía).
+    """
+    if n_entidades == 0:
+        msg = f"⚠️ {ruta.name} → {nombre_original}: vacía, ignorada"
+        resumen.append(msg)
+        if log_cb: log_cb(msg)
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Warning)
+        if progreso:
+            progreso.capa_terminada(ruta)
+        return None
+
+    if union and in_layer:
+        nombre_capa_salida = union.nombre_tabla(in_layer, nombre_original)
+    else:
+        nombre_capa_salida = obtener_nombre_unico(f"{ruta.stem}_{nombre_original}", capas_existentes)
+    try:
+        if error:
+            raise RuntimeError(error)
+        if lote:
+            lote.iniciar()
+        copiadas = None
+        if union:
+            copiadas = union.anadir(ruta, in_layer, nombre_original, nombre_capa_salida, opciones_capa)
+            srs = in_layer.GetSpatialRef()
+            epsg = srs.GetAttrValue("AUTHORITY", 1) if srs else "Sin CRS"
+        elif copia_sql is not None:
+            try:
+                copiadas = copiar_tabla_sql(out_ds, in_layer.GetName(), nombre_capa_salida)
+                srs = in_layer.GetSpatialRef()
+                epsg = srs.GetAttrValue("AUTHORITY", 1) if srs else "Sin CRS"
+                copia_sql["sql"] += 1
+            except CopiaSQLNoSoportada as e:
+                if log_cb: log_cb(f"ℹ️ {ruta.name} → {nombre_original}: se copia con OGR ({e})")
+                copia_sql["ogr"] += 1
+        if copiadas is None:
+            out_layer, epsg = copiar_capa(in_layer, out_ds, nombre_capa_salida, opciones_capa)
+            # El recuento de la capa recién escrita lo mantiene GDAL, no recorre la tabla
+            copiadas = n_entidades if n_entidades is not None else out_layer.GetFeatureCount()
+        if lote:
+            lote.registrar(copiadas)
+        if progreso:
+            progreso.capa_terminada(ruta, copiadas)
+        if union:
+            msg = f"✅ {ruta.name} → {nombre_original}: {copiadas} entidades añadidas a {nombre_capa_salida}"
+        else:
             msg = f"✅ {ruta.name} → {nombre_capa_salida} fusionada (EPSG: {epsg})"
-            resumen.append(msg)
-            if not epsg or epsg == "None":
-                capas_sin_crs.append(nombre_capa_salida)
-            if log_cb: log_cb(msg)
-            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
-        except Exception as e:
-            msg = f"❌ {ruta.name} → {nombre_capa_salida}: {e}"
+        resumen.append(msg)
+        if (not epsg or epsg == "None") and nombre_capa_salida not in capas_sin_crs:
+            capas_sin_crs.append(nombre_capa_salida)
+        if log_cb: log_cb(msg)
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
+    except Exception as e:
+        msg = f"❌ {ruta.name} → {nombre_capa_salida}: {e}"
+        resumen.append(msg)
+        if log_cb: log_cb(msg)
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
+        if nombre_capa_salida not in capas_sin_crs:
+            capas_sin_crs.append(nombre_capa_salida)
+        if progreso:
+            progreso.capa_terminada(ruta)
+    return nombre_capa_salida
+
+def inspeccionar_gpkg(ruta, perfil_sqlite=None, cache_max_kb=None):
+    """
+    Abre un GPKG de entrada y lista sus capas con su recuento de entidades según
+    gpkg_utils.capas_gpkg (etapa de inspección, puede ejecutarse en otro hilo).
+    Retorna (in_ds, [(in_layer, nombre, entidades o None), ...]).
+    """
+    in_ds = abrir_gpkg(ruta, perfil_sqlite, cache_max_kb)
+    return in_ds, capas_gpkg(in_ds)
+
+def procesar_gpkg(ruta, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb=None, cancel_cb=None,
+                  lote=None, opciones_capa=None, perfil_sqlite=None, inspeccion=None, copia_sql=None,
+                  union=None, progreso=None):
+    """
+    Procesa todas las capas de un GPKG y las añade al GPKG de salida.
+    Si se indica 'lote' (LoteTransacciones), las copias se agrupan en transacciones.
+    'opciones_capa' se pasa como opciones de creación a CopyLayer.
+    'inspeccion' es el resultado de inspeccionar_gpkg si ya se obtuvo en otra etapa.
+    Con 'copia_sql' (contadores que se acumulan) las tablas se copian con SQL, adjuntando el GPKG.
+    Con 'union' (UnionCapas) las capas se añaden a las tablas unidas.
+    'progreso' (gpkg_progreso.Progreso) recibe las capas del GPKG y cada capa terminada.
+    Retorna los nombres de las capas creadas en el GPKG de salida.
+    """
+    in_ds, capas = inspeccion or inspeccionar_gpkg(ruta, perfil_sqlite)
+    if progreso:
+        progreso.capas_encontradas(ruta, len(capas))
+    if copia_sql is None or not any(n != 0 for _, _, n in capas):
+        return _procesar_capas(ruta, capas, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb, cancel_cb,
+                               lote, opciones_capa, union=union, progreso=progreso)
+    with origen_adjunto(out_ds, ruta, lote, log_cb) as contadores:
+        creadas = _procesar_capas(ruta, capas, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb, cancel_cb,
+                                  lote, opciones_capa, contadores, progreso=progreso)
+    if contadores:
+        for clave, valor in contadores.items():
+            copia_sql[clave] += valor
+    return creadas
+
+def _procesar_capas(ruta, capas, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb, cancel_cb, lote,
+                    opciones_capa, copia_sql=None, union=None, progreso=None):
+    creadas = []
+    for in_layer, nombre_original, n_entidades in capas:
+        if cancel_cb and cancel_cb():
+            if log_cb:
+                log_cb("⏹ Cancelación detectada, deteniendo fusión...")
+            return creadas
+
+        nombre = fusionar_capa(ruta, in_layer, nombre_original, n_entidades, out_ds,
+                               capas_existentes, resumen, capas_sin_crs, log_cb, lote, opciones_capa,
+                               copia_sql=copia_sql, union=union, progreso=progreso)
+        if nombre and nombre not in creadas:
+            creadas.append(nombre)
+    return creadas
+
+def fusionar_staging(archivos, resultados, ruta_staging, out_ds, capas_existentes, resumen, capas_sin_crs,
+                     log_cb=None, lote=None, opciones_capa=None, archivo_cb=None, copia_sql=None, progreso=None):
+    """
+    Copia al GPKG de salida las capas de un GPKG temporal creado por
+    gpkg_paralelo.copiar_a_staging, en el mismo orden (y con los mismos nombres)
+    que el modo secuencial. Si se indica, 'archivo_cb(ruta, capas creadas, líneas
+    del resumen, capas sin CRS)' se llama al terminar cada archivo.
+    Con 'copia_sql' (contadores) el GPKG temporal se adjunta y sus tablas se copian con SQL.
+    'progreso' (gpkg_progreso.Progreso) recibe las capas de cada archivo y cada capa terminada.
+    Retorna (procesados, fallidos).
+    """
+    staging_ds = abrir_gpkg(ruta_staging)
+    if copia_sql is None:
+        resultado = _fusionar_staging(archivos, resultados, staging_ds, out_ds, capas_existentes, resumen,
+                                      capas_sin_crs, log_cb, lote, opciones_capa, archivo_cb, progreso=progreso)
+    else:
+        with origen_adjunto(out_ds, Path(ruta_staging), lote, log_cb) as contadores:
+            resultado = _fusionar_staging(archivos, resultados, staging_ds, out_ds, capas_existentes, resumen,
+                                          capas_sin_crs, log_cb, lote, opciones_capa, archivo_cb, contadores,
+                                          progreso)
+        if contadores:
+            for clave, valor in contadores.items():
+                copia_sql[clave] += valor
+    staging_ds = None
+    return resultado
+
+def _fusionar_staging(archivos, resultados, staging_ds, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb,
+                      lote, opciones_capa, archivo_cb, copia_sql=None, progreso=None):
+    procesados = fallidos = 0
+    for ruta, archivo in zip(archivos, resultados):
+        if archivo["error"]:
+            msg = f"❌ {ruta.name}: {archivo['error']}"
             resumen.append(msg)
             if log_cb: log_cb(msg)
             QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
-            capas_sin_crs.append(nombre_capa_salida)
+            fallidos += 1
+            if progreso:
+                progreso.archivo_terminado(ruta)
+            continue
+
+        creadas = []
+        inicio_resumen, inicio_sin_crs = len(resumen), len(capas_sin_crs)
+        if progreso:
+            progreso.capas_encontradas(ruta, len(archivo["capas"]))
+        for capa in archivo["capas"]:
+            in_layer = staging_ds.GetLayerByName(capa["staging"]) if capa["staging"] else None
+            nombre = fusionar_capa(ruta, in_layer, capa["nombre"], capa["entidades"], out_ds, capas_existentes,
+                                   resumen, capas_sin_crs, log_cb, lote, opciones_capa, error=capa["error"],
+                                   copia_sql=copia_sql, progreso=progreso)
+            if nombre:
+                creadas.append(nombre)
+        if archivo_cb:
+            archivo_cb(ruta, creadas, resumen[inicio_resumen:], capas_sin_crs[inicio_sin_crs:])
+        procesados += 1
+    return procesados, fallidos
 
-def generar_resumen(salida, carpeta, resumen, capas_sin_crs, total_archivos, procesados, fallidos):
+def procesar_en_paralelo(archivos, salida, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb=None,
+                         cancel_cb=None, lote=None, opciones_capa=None, procesos=None, archivos_por_tarea=None,
+                         archivo_cb=None, copia_sql=None, progreso=None):
+    """
+    Reparte 'archivos' entre procesos que los copian a GPKG temporales y luego
+    los fusiona, tarea por tarea y en orden, en el GPKG de salida.
+    'copia_sql' y 'progreso' se pasan a fusionar_staging.
+    Retorna (total_archivos, procesados, fallidos).
+    """
+    total_archivos = procesados = fallidos = 0
+    tareas = repartir(archivos, procesos, archivos_por_tarea)
+    carpeta_staging = Path(tempfile.mkdtemp(prefix=f".{salida.stem}_staging_", dir=salida.parent))
+    if log_cb:
+        log_cb(f"🚀 Fusión en paralelo: {len(archivos)} archivos en {len(tareas)} tareas "
+               f"con {numero_procesos(procesos)} procesos")
+
+    pool = crear_pool(procesos)
+    futuros = []
+    try:
+        futuros = [
+            pool.submit(copiar_a_staging, [str(r) for r in tarea], str(carpeta_staging / f"staging_{n}.gpkg"))
+            for n, tarea in enumerate(tareas)
+        ]
+        for n, (tarea, futuro) in enumerate(zip(tareas, futuros)):
+            while not futuro.done():
+                if cancel_cb and cancel_cb():
+                    if log_cb: log_cb("⏹ Cancelación detectada, deteniendo fusión...")
+                    return total_archivos, procesados, fallidos
+                wait([futuro], timeout=0.5)
+
+            total_archivos += len(tarea)
+            try:
+                resultados = futuro.result()
+            except Exception as e:
+                for ruta in tarea:
+                    msg = f"❌ {ruta.name}: {e}"
+                    resumen.append(msg)
+                    if log_cb: log_cb(msg)
+                    QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
+                    if progreso:
+                        progreso.archivo_terminado(ruta)
+                fallidos += len(tarea)
+                continue
+
+            ruta_staging = carpeta_staging / f"staging_{n}.gpkg"
+            ok, error = fusionar_staging(tarea, resultados, ruta_staging, out_ds, capas_existentes, resumen,
+                                         capas_sin_crs, log_cb, lote, opciones_capa, archivo_cb, copia_sql,
+                                         progreso)
+            procesados += ok
+            fallidos += error
+            ruta_staging.unlink()
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+        pool.shutdown(wait=True)
+        shutil.rmtree(carpeta_staging, ignore_errors=True)
+    return total_archivos, procesados, fallidos
+
+def _sql_texto(valor):
+    """Literal SQL de texto (o NULL)."""
+    if valor is None:
+        return "NULL"
+    return "'" + str(valor).replace("'", "''") + "'"
+
+def leer_manifiesto(out_ds):
+    """
+    Lee el manifiesto de la fusión incremental guardado en el GPKG de salida.
+    Retorna {ruta relativa: {"tamano", "mtime", "hash", "capas"}} o None si no existe.
+    """
+    res = out_ds.ExecuteSQL(
+        f"SELECT name FROM sqlite_master WHERE type = 'table' AND name = '{TABLA_MANIFIESTO}'")
+    existe = bool(res and res.GetFeatureCount() > 0)
+    if res:
+        out_ds.ReleaseResultSet(res)
+    if not existe:
+        return None
+
+    manifiesto = {}
+    res = out_ds.ExecuteSQL(f"SELECT ruta, tamano, mtime, hash, capas FROM {TABLA_MANIFIESTO}")
+    if res:
+        for feat in res:
+            manifiesto[feat.GetField("ruta")] = {
+                "tamano": feat.GetField("tamano"),
+                "mtime": feat.GetField("mtime"),
+                "hash": feat.GetField("hash"),
+                "capas": json.loads(feat.GetField("capas") or "[]"),
+            }
+        out_ds.ReleaseResultSet(res)
+    return manifiesto
+
+def crear_manifiesto(out_ds):
+    out_ds.ExecuteSQL(
+        f"CREATE TABLE IF NOT EXISTS {TABLA_MANIFIESTO} ("
+        "ruta TEXT PRIMARY KEY, tamano INTEGER, mtime REAL, hash TEXT, capas TEXT)")
+
+def guardar_manifiesto(out_ds, entradas, eliminados):
+    """Inserta/actualiza las 'entradas' {ruta: {...}} y borra las rutas 'eliminados' del manifiesto."""
+    out_ds.StartTransaction()
+    for ruta in eliminados:
+        out_ds.ExecuteSQL(f"DELETE FROM {TABLA_MANIFIESTO} WHERE ruta = {_sql_texto(ruta)}")
+    for ruta, e in entradas.items():
+        out_ds.ExecuteSQL(
+            f"INSERT OR REPLACE INTO {TABLA_MANIFIESTO} (ruta, tamano, mtime, hash, capas) VALUES ("
+            f"{_sql_texto(ruta)}, {int(e['tamano'])}, {float(e['mtime'])}, {_sql_texto(e['hash'])}, "
+            f"{_sql_texto(json.dumps(e['capas'], ensure_ascii=False))})")
+    out_ds.CommitTransaction()
+
+def eliminar_capa(out_ds, nombre):
+    """Elimina la capa 'nombre' del GPKG de salida si existe."""
+    for i in range(out_ds.GetLayerCount()):
+        if out_ds.GetLayerByIndex(i).GetName() == nombre:
+            out_ds.DeleteLayer(i)
+            return True
+    return False
+
+def descartar_archivos(out_ds, manifiesto, rutas):
+    """
+    Elimina las capas de los archivos 'rutas' (rutas relativas del manifiesto) y sus
+    filas del manifiesto en una misma transacción, para que el manifiesto nunca nombre
+    capas ya eliminadas (otro archivo podría recibir ese nombre y perder sus capas en
+    la siguiente ejecución). También las quita de 'manifiesto'.
+    """
+    if not rutas:
+        return
+    out_ds.StartTransaction()
+    try:
+        for rel in rutas:
+            for nombre in manifiesto.pop(rel)["capas"]:
+                eliminar_capa(out_ds, nombre)
+            ejecutar_sql(out_ds, f"DELETE FROM {TABLA_MANIFIESTO} WHERE ruta = {_sql_texto(rel)}")
+    except Exception:
+        out_ds.RollbackTransaction()
+        raise
+    out_ds.CommitTransaction()
+
+def clasificar_archivos(carpeta, archivos, manifiesto):
+    """
+    Compara los GPKG 'archivos' de 'carpeta' con el manifiesto (tamaño y fecha; si difieren, huella SHA-1).
+    Retorna (pendientes, cambiados, eliminados, entradas):
+    - pendientes: rutas de archivos nuevos o modificados a fusionar
+    - cambiados: rutas relativas cuyas capas anteriores deben eliminarse
+    - eliminados: rutas relativas que ya no existen en la carpeta
+    - entradas: {ruta relativa: entrada del manifiesto} para los archivos vigentes
+    """
+    pendientes, cambiados, entradas = [], [], {}
+    vistos = set()
+    for file in archivos:
+        rel = file.relative_to(carpeta).as_posix()
+        vistos.add(rel)
+        st = file.stat()
+        anterior = manifiesto.get(rel)
+        if anterior and anterior["tamano"] == st.st_size and anterior["mtime"] == st.st_mtime:
+            continue
+        huella = hash_archivo(file)
+        entradas[rel] = {"tamano": st.st_size, "mtime": st.st_mtime, "hash": huella, "capas": []}
+        if anterior and anterior["hash"] == huella:
+            # Solo cambió la fecha: se conservan las capas ya fusionadas
+            entradas[rel]["capas"] = anterior["capas"]
+            continue
+        if anterior:
+            cambiados.append(rel)
+        pendientes.append(file)
+    eliminados = [rel for rel in manifiesto if rel not in vistos]
+    return pendientes, cambiados, eliminados, entradas
+
+def recuperar_reanudacion(out_ds, diario, manifiesto=None, log_cb=None, union=False):
+    """
+    Prepara el GPKG de salida para reanudar una fusión: olvida del diario los archivos
+    cuyas capas no llegaron a confirmarse y elimina las capas que no pertenecen a ningún
+    archivo completado (ni al manifiesto), es decir, las de archivos fusionados a medias.
+    Con 'union' también se borran de las tablas unidas las entidades de esos archivos.
+    Retorna {ruta relativa: datos del diario} de los archivos completados.
+    """
+    existentes = {out_ds.GetLayerByIndex(i).GetName() for i in range(out_ds.GetLayerCount())}
+    completados = {}
+    for rel, datos in diario.completados().items():
+        if set(datos["capas"]) <= existentes:
+            completados[rel] = datos
+        else:
+            diario.olvidar(rel)
+
+    conservadas = {TABLA_MANIFIESTO}
+    for datos in completados.values():
+        conservadas.update(datos["capas"])
+    for entrada in (manifiesto or {}).values():
+        conservadas.update(entrada["capas"])
+    huerfanas = existentes - conservadas
+    for nombre in huerfanas:
+        eliminar_capa(out_ds, nombre)
+    if huerfanas and log_cb:
+        log_cb(f"🧹 Eliminadas {len(huerfanas)} capas de archivos fusionados a medias")
+    if union:
+        limpiar_union(out_ds, completados, log_cb)
+    return completados
+
+def generar_resumen(salida, carpeta, resumen, capas_sin_crs, total_archivos, procesados, fallidos,
+                    opciones=None):
     resumen_path = salida.with_name(salida.stem + "_resumen.txt")
     with open(resumen_path, "w", encoding="utf-8") as f:
         f.write("📘 RESUMEN DE FUSIÓN DE GPKG\n\n")
@@ -70,53 +719,319 @@ def generar_resumen(salida, carpeta, resumen, capas_sin_crs, total_archivos, pro
         f.write(f"Total de archivos GPKG procesados: {total_archivos}\n")
         f.write(f"Archivos fusionados correctamente: {procesados}\n")
         f.write(f"Archivos con errores: {fallidos}\n\n")
+        if opciones:
+            f.write("⚙️ Opciones de ejecución:\n")
+            f.write("\n".join(opciones) + "\n\n")
         if capas_sin_crs:
             f.write("⚠️ Capas sin CRS detectadas:\n")
             f.write("\n".join(capas_sin_crs) + "\n")
         f.write("\n--- Detalle de ejecución ---\n")
-        f.write("\n".join(resumen))
+        # Línea a línea: el detalle puede venir de un archivo (gpkg_utils.LineasEnDisco)
+        for i, linea in enumerate(resumen):
+            f.write(("\n" if i else "") + linea)
     return resumen_path
 
-def fusionar_vectores(carpeta, salida, log_cb=None, cancel_cb=None):
-    """Fusiona todos los GPKG de una carpeta y sus subcarpetas en un único GPKG."""
+def fusionar_vectores(carpeta, salida, log_cb=None, cancel_cb=None,
+                      modo_lote=False, capas_por_lote=100, entidades_por_lote=None,
+                      indice_diferido=False, perfil_sqlite=None,
+                      paralelo=False, procesos=None, archivos_por_tarea=None, incremental=False,
+                      reanudar=False, escaneo=None, motor_sql=False, union=False, memoria_max_mb=None,
+                      progreso_cb=None):
+    """
+    Fusiona todos los GPKG de una carpeta y sus subcarpetas en un único GPKG.
+    Con 'modo_lote' las copias se agrupan en transacciones de 'capas_por_lote'
+    capas o 'entidades_por_lote' entidades (lo que ocurra primero).
+    Con 'indice_diferido' las capas se crean sin índice espacial y todos los
+    R-tree se construyen al final en una sola pasada.
+    'perfil_sqlite' elige el perfil de PRAGMAs (ver gpkg_utils.PERFILES_SQLITE).
+    Con 'paralelo' los archivos se copian en 'procesos' procesos a GPKG temporales
+    y después se fusionan en orden, con los mismos nombres de capa que el modo secuencial.
+    Con 'incremental' se conserva el GPKG de salida y, según el manifiesto guardado
+    en él, solo se fusionan los archivos nuevos o modificados y se eliminan las
+    capas de los archivos modificados o borrados.
+    Cada archivo fusionado se anota (una vez confirmadas sus capas) en un diario de
+    reanudación; con 'reanudar' se conserva el GPKG de una ejecución cancelada o
+    interrumpida, se eliminan las capas de los archivos que quedaron a medias y se
+    continúa con los archivos pendientes.
+    Los GPKG se buscan con gpkg_escaneo.escanear ('escaneo' son sus opciones:
+    incluir, excluir, profundidad_max, enlaces, hilos) en un hilo propio. En modo secuencial,
+    la búsqueda, la inspección de cada GPKG (apertura y recuento de entidades) y la
+    escritura en el GPKG de salida corren a la vez como etapas de una tubería con
+    colas acotadas, de modo que la fusión empieza con el primer GPKG encontrado.
+    Con 'motor_sql' cada GPKG de entrada (o temporal, en paralelo) se adjunta a la
+    conexión SQLite del GPKG de salida y sus tablas se copian con INSERT ... SELECT
+    (gpkg_copia_sql), sin pasar por entidades de OGR; las capas que no admite se
+    copian con CopyLayer. Cada archivo se confirma por separado y los R-tree de las
+    tablas copiadas con SQL se construyen al final.
+    Con 'union' las capas con el mismo nombre (y tipo de geometría y CRS) se unen en
+    una sola tabla con la unión de sus campos y el campo CAMPO_ORIGEN (ver UnionCapas);
+    no se combina con 'incremental', 'paralelo' ni 'motor_sql', que se ignoran.
+    Con 'memoria_max_mb' la fusión se ajusta a un presupuesto de memoria (ver
+    gpkg_utils.PresupuestoMemoria): limita las cachés de GDAL y SQLite, inspecciona
+    un solo GPKG por adelantado, vuelca el detalle del resumen a disco a medida que
+    avanza y, si la RSS se acerca al límite, confirma el lote en curso y vacía las
+    cachés antes de seguir. El pico de RSS se anota en el resumen.
+    'progreso_cb(progreso)' recibe periódicamente el avance (gpkg_progreso.Progreso):
+    archivos, capas y entidades fusionadas, porcentaje por tamaño y ETA.
+    """
+    presupuesto = PresupuestoMemoria(memoria_max_mb) if memoria_max_mb else None
+    # El presupuesto (y el resumen temporal) se liberan también si la fusión falla
+    with ExitStack() as limpieza:
+        if presupuesto:
+            limpieza.enter_context(presupuesto)
+        return _fusionar_vectores(
+            limpieza, presupuesto, carpeta, salida, log_cb=log_cb, cancel_cb=cancel_cb,
+            modo_lote=modo_lote, capas_por_lote=capas_por_lote, entidades_por_lote=entidades_por_lote,
+            indice_diferido=indice_diferido, perfil_sqlite=perfil_sqlite, paralelo=paralelo, procesos=procesos,
+            archivos_por_tarea=archivos_por_tarea, incremental=incremental, reanudar=reanudar, escaneo=escaneo,
+            motor_sql=motor_sql, union=union, progreso_cb=progreso_cb)
+
+def _fusionar_vectores(limpieza, presupuesto, carpeta, salida, *, log_cb, cancel_cb,
+                       modo_lote, capas_por_lote, entidades_por_lote, indice_diferido, perfil_sqlite,
+                       paralelo, procesos, archivos_por_tarea, incremental, reanudar, escaneo,
+                       motor_sql, union, progreso_cb):
+    """Cuerpo de fusionar_vectores; 'limpieza' (ExitStack) cierra lo que deba cerrarse al salir."""
+    progreso = Progreso(progreso_cb)
+    cache_kb = presupuesto.cache_sqlite_kb if presupuesto else None
     carpeta = Path(carpeta)
     salida = Path(salida)
 
     if salida.is_dir() or salida.suffix.lower() != ".gpkg":
         salida.mkdir(parents=True, exist_ok=True)
         salida = salida / "fusion.gpkg"
-    if salida.exists():
-        salida.unlink()
 
-    driver = ogr.GetDriverByName("GPKG")
-    out_ds = driver.CreateDataSource(str(salida))
-    if not out_ds:
-        raise RuntimeError(f"No se pudo crear el GeoPackage de salida: {salida}")
+    if union and (incremental or paralelo or motor_sql):
+        if log_cb:
+            log_cb("⚠️ La unión de capas no admite la fusión incremental, en paralelo "
+                   "ni la copia con SQL: se ignoran")
+        incremental = paralelo = motor_sql = False
+
+    diario = DiarioReanudacion(salida.with_name(salida.stem + "_reanudar.sqlite"),
+                               {"herramienta": "fusion", "entrada": carpeta, "incremental": incremental,
+                                "union": union},
+                               reanudar)
+    if diario.error and log_cb:
+        log_cb(f"⚠️ No se pudo abrir el diario de reanudación ({diario.error}): se continúa sin él")
+    reanudando = diario.reanudado and salida.exists()
 
+    out_ds = None
+    manifiesto = None
+    if (incremental or reanudando) and salida.exists():
+        with aplicar_perfil_sqlite(perfil_sqlite, cache_max_kb=cache_kb):
+            out_ds = ogr.Open(str(salida), 1)
+        if incremental:
+            manifiesto = leer_manifiesto(out_ds) if out_ds else None
+            if manifiesto is None:
+                if log_cb: log_cb("⚠️ El GPKG de salida no tiene manifiesto de fusión: se regenera completo")
+                out_ds = None
+
+    if out_ds is None:
+        if salida.exists():
+            salida.unlink()
+        driver = ogr.GetDriverByName("GPKG")
+        with aplicar_perfil_sqlite(perfil_sqlite, cache_max_kb=cache_kb):
+            out_ds = driver.CreateDataSource(str(salida))
+        if not out_ds:
+            raise RuntimeError(f"No se pudo crear el GeoPackage de salida: {salida}")
+        if incremental:
+            crear_manifiesto(out_ds)
+            manifiesto = {}
+        # GPKG nuevo: nada de lo anotado en el diario sigue en la salida
+        diario.vaciar()
+        reanudando = False
+
+    if reanudar and log_cb:
+        log_cb("↩️ Reanudando la fusión anterior" if reanudando else
+               "⚠️ No hay una fusión anterior que reanudar: se fusionan todos los archivos")
+
+    # Con presupuesto de memoria, el detalle del resumen se va volcando a un archivo temporal
     resumen = []
+    if presupuesto:
+        resumen = LineasEnDisco(salida.with_name(salida.stem + "_resumen.tmp"))
+        limpieza.callback(resumen.cerrar)
     capas_existentes = set()
     capas_sin_crs = []
+    opciones = [f"Perfil SQLite: {describir_perfil(perfil_sqlite)}"]
     total_archivos = procesados = fallidos = 0
 
-    for file in carpeta.rglob("*.gpkg"):
-        if cancel_cb and cancel_cb():
-            if log_cb: log_cb("⏹ Cancelación detectada, deteniendo fusión...")
-            break
-        if not file.is_file():
-            continue
+    # Archivos terminados cuyas capas aún no se han confirmado en el GPKG de salida
+    pendientes_diario = []
 
-        total_archivos += 1
-        try:
-            procesar_gpkg(file, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb, cancel_cb)
+    def volcar_diario():
+        for rel, datos in pendientes_diario:
+            diario.registrar(rel, **datos)
+        pendientes_diario.clear()
+        diario.confirmar()
+
+    lote = None
+    if modo_lote:
+        lote = LoteTransacciones(out_ds, capas_por_lote, entidades_por_lote, volcar_diario)
+    elif union:
+        # La unión añade entidades una a una: al menos una transacción por capa
+        lote = LoteTransacciones(out_ds, 1, None, volcar_diario)
+    opciones_capa = ["SPATIAL_INDEX=NO"] if indice_diferido else None
+    copia_sql = {"sql": 0, "ogr": 0} if motor_sql else None
+
+    capas_por_archivo = {}
+
+    def archivo_terminado(ruta, creadas, lineas, sin_crs):
+        capas_por_archivo[ruta] = creadas
+        tablas = tablas_gpkg(out_ds, creadas)
+        pendientes_diario.append((ruta.relative_to(carpeta).as_posix(), {
+            "capas": [nombre for nombre in creadas if nombre in tablas],
+            "lineas": lineas,
+            "sin_crs": sin_crs,
+        }))
+        if not (lote and lote.activa):
+            volcar_diario()
+        progreso.archivo_terminado(ruta)
+        if presupuesto:
+            controlar_memoria()
+
+    def controlar_memoria():
+        """Vuelca el resumen y, si la RSS se acerca al límite, confirma el lote y vacía las cachés."""
+        resumen.volcar()
+        if not presupuesto.presion():
+            return
+        if lote:
+            lote.confirmar()
+        rss = presupuesto.vaciar(out_ds)
+        if log_cb and presupuesto.vaciados == 1:
+            log_cb(f"💾 Memoria cerca del límite ({presupuesto.describir()}): "
+                   f"se confirman las escrituras y se vacían las cachés" +
+                   (f" (RSS tras vaciar: {rss / (1024 * 1024):.0f} MB)" if rss else ""))
+
+    salida_real = salida.resolve()
+    archivos = en_segundo_plano(progreso.encontrados(
+        file for file in escanear(carpeta, tipos=("*.gpkg",), **(escaneo or {}))
+        if file.name != salida.name or file.resolve() != salida_real))
+    if incremental:
+        archivos, cambiados, eliminados, entradas = clasificar_archivos(carpeta, archivos, manifiesto)
+        progreso.omitir_pendientes(archivos)
+        descartar_archivos(out_ds, manifiesto, cambiados + eliminados)
+        detalle = (f"{len(archivos) - len(cambiados)} nuevos, {len(cambiados)} modificados, "
+                   f"{len(eliminados)} eliminados")
+        opciones.append(f"Fusión incremental: {detalle}")
+        if log_cb: log_cb(f"🔁 Fusión incremental: {detalle}")
+
+    if reanudando:
+        reanudados = recuperar_reanudacion(out_ds, diario, manifiesto, log_cb, union)
+        restantes = []
+        for file in archivos:
+            datos = reanudados.get(file.relative_to(carpeta).as_posix()) if file.is_file() else None
+            if datos is None:
+                restantes.append(file)
+                continue
+            resumen.extend(datos["lineas"])
+            capas_sin_crs.extend(datos["sin_crs"])
+            capas_por_archivo[file] = datos["capas"]
+            progreso.archivo_terminado(file, omitido=True)
+            total_archivos += 1
             procesados += 1
-        except Exception as e:
-            msg = f"❌ {file.name}: {e}"
-            resumen.append(msg)
-            if log_cb: log_cb(msg)
-            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
-            fallidos += 1
+        archivos = restantes
+        opciones.append(f"Reanudación: {procesados} archivos ya fusionados en la ejecución anterior")
+        if log_cb: log_cb(f"↩️ {procesados} archivos ya fusionados en la ejecución anterior")
+
+    if incremental or reanudando:
+        capas_existentes.update(out_ds.GetLayerByIndex(i).GetName() for i in range(out_ds.GetLayerCount()))
+    unidas = UnionCapas(out_ds, carpeta, capas_existentes) if union else None
+
+    if paralelo:
+        archivos = [file for file in archivos if file.is_file()]
+        total, ok, error = procesar_en_paralelo(
+            archivos, salida, out_ds, capas_existentes, resumen, capas_sin_crs, log_cb, cancel_cb,
+            lote, opciones_capa, procesos, archivos_por_tarea, archivo_terminado, copia_sql, progreso)
+        total_archivos += total
+        procesados += ok
+        fallidos += error
+        opciones.append(f"Fusión en paralelo: {numero_procesos(procesos)} procesos")
+    else:
+        # Tubería: búsqueda (hilo propio) → inspección (hilos) → escritura (este hilo, único escritor)
+        # Con presupuesto de memoria, un solo GPKG abierto por adelantado
+        inspeccionados = etapa(lambda file: inspeccionar_gpkg(file, perfil_sqlite, cache_kb),
+                               (file for file in archivos if file.is_file()),
+                               hilos=1 if presupuesto else 2, maximo=1 if presupuesto else None)
+        for file, inspeccion, error in inspeccionados:
+            if cancel_cb and cancel_cb():
+                if log_cb: log_cb("⏹ Cancelación detectada, deteniendo fusión...")
+                break
+
+            total_archivos += 1
+            try:
+                if error:
+                    raise error
+                inicio_resumen, inicio_sin_crs = len(resumen), len(capas_sin_crs)
+                creadas = procesar_gpkg(file, out_ds, capas_existentes, resumen, capas_sin_crs,
+                                        log_cb, cancel_cb, lote, opciones_capa, perfil_sqlite, inspeccion,
+                                        copia_sql, unidas, progreso)
+                if cancel_cb and cancel_cb():
+                    # Archivo a medias: no se anota en el diario y se marca para rehacerlo en la próxima ejecución
+                    capas_por_archivo[file] = creadas
+                    if incremental:
+                        entradas[file.relative_to(carpeta).as_posix()].update(mtime=-1, hash=None)
+                else:
+                    archivo_terminado(file, creadas, resumen[inicio_resumen:], capas_sin_crs[inicio_sin_crs:])
+                procesados += 1
+            except Exception as e:
+                msg = f"❌ {file.name}: {e}"
+                resumen.append(msg)
+                if log_cb: log_cb(msg)
+                QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
+                fallidos += 1
+                progreso.archivo_terminado(file)
+            inspeccion = None  # libera el GPKG de entrada
+        inspeccionados.close()
+
+    if lote:
+        lote.confirmar()
+    if modo_lote:
+        opciones.append(f"Escritura por lotes: {capas_por_lote or '-'} capas / "
+                        f"{entidades_por_lote or '-'} entidades por transacción ({lote.commits} commits)")
+    volcar_diario()
+
+    if incremental:
+        for file, capas in capas_por_archivo.items():
+            entradas[file.relative_to(carpeta).as_posix()]["capas"] = capas
+        # Los archivos que fallaron no se anotan, para reintentarlos en la próxima ejecución
+        procesadas = {file.relative_to(carpeta).as_posix() for file in capas_por_archivo}
+        pendientes = {file.relative_to(carpeta).as_posix() for file in archivos}
+        guardar_manifiesto(out_ds, {rel: e for rel, e in entradas.items()
+                                    if rel in procesadas or rel not in pendientes}, eliminados)
+
+    if copia_sql is not None:
+        opciones.append(f"Copia directa con SQL: {copia_sql['sql']} tablas "
+                        f"({copia_sql['ogr']} copiadas con OGR por no admitirla)")
+        if copia_sql["sql"]:
+            # Las tablas copiadas con SQL no están en la lista de capas de OGR hasta reabrir el GPKG
+            out_ds = None
+            with aplicar_perfil_sqlite(perfil_sqlite, cache_max_kb=cache_kb):
+                out_ds = ogr.Open(str(salida), 1)
+            if not out_ds:
+                raise RuntimeError(f"No se pudo reabrir el GeoPackage de salida: {salida}")
+
+    if unidas:
+        opciones.append(f"Unión de capas: {len(unidas.tablas)} tablas con el campo {CAMPO_ORIGEN}")
+
+    if indice_diferido or unidas or (copia_sql and copia_sql["sql"]):
+        if log_cb: log_cb("🗂️ Construyendo índices espaciales...")
+        indexadas, segundos = construir_indices_espaciales(out_ds, log_cb, cancel_cb)
+        msg = f"🗂️ Índices espaciales construidos: {indexadas} capas en {segundos:.2f} s"
+        opciones.append(f"Índice espacial diferido: {indexadas} capas indexadas en {segundos:.2f} s")
+        if log_cb: log_cb(msg)
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
+
+    if presupuesto:
+        presupuesto.medir()
+        opciones.append(f"Presupuesto de memoria: {presupuesto.describir()}")
+        if log_cb: log_cb(f"💾 Presupuesto de memoria: {presupuesto.describir()}")
+
+    progreso.terminar()
+
+    # Si la fusión se canceló, el diario se conserva para poder reanudarla
+    diario.cerrar(terminado=not (cancel_cb and cancel_cb()))
 
-    resumen_path = generar_resumen(salida, carpeta, resumen, capas_sin_crs, total_archivos, procesados, fallidos)
+    resumen_path = generar_resumen(salida, carpeta, resumen, capas_sin_crs, total_archivos, procesados, fallidos,
+                                   opciones)
 
     if log_cb:
         log_cb(f"✅ Fusión completada en: {salida}")
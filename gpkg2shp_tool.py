@@ -1,34 +1,290 @@
 # -*- coding: utf-8 -*-
+import threading
+import time
 from pathlib import Path
 from qgis.core import (
     QgsVectorLayer,
-    QgsCoordinateReferenceSystem,
     QgsVectorFileWriter,
     QgsProject,
-    QgsCoordinateTransform,
     QgsFeature,
     QgsWkbTypes
 )
 from osgeo import ogr
+from .gpkg_utils import DiarioReanudacion, ManifiestoConversion, aplicar_perfil_sqlite, describir_perfil
+from .gpkg_paralelo import crear_pool, convertir_capas_ogr, esperar_resultados, numero_procesos
+from .gpkg_reproyeccion import CACHE_TRANSFORMACIONES
+from .gpkg_escaneo import escanear
+from .gpkg_progreso import Progreso
+from .gpkg_tuberia import en_segundo_plano, etapa
+
+def copiar_entidades_por_lotes(layer, proveedor, obtener_transformador=None, tamano_lote=10000, log_callback=None,
+                               etiqueta=""):
+    """
+    Copia las entidades de 'layer' al proveedor de datos 'proveedor' en lotes de
+    'tamano_lote' (un addFeatures por lote). Si se indica 'obtener_transformador'
+    (función que crea un TransformadorLotes), las geometrías
+    de cada lote se reproyectan juntas en un hilo aparte mientras se lee el lote
+    siguiente y se escribe el anterior.
+    Informa en el log del rendimiento de cada lote. Retorna el total de entidades copiadas.
+    """
+    total = 0
+    inicio_lote = time.perf_counter()
+
+    def leer_lotes():
+        lote = []
+        for feat in layer.getFeatures():
+            new_feat = QgsFeature()
+            new_feat.setGeometry(feat.geometry())
+            new_feat.setAttributes(feat.attributes())
+            lote.append(new_feat)
+            if len(lote) >= tamano_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    # Un transformador por hilo de la etapa y solo durante esta copia: OSR no es seguro entre hilos
+    por_hilo = threading.local()
+
+    def transformar(lote):
+        if not hasattr(por_hilo, "transformador"):
+            por_hilo.transformador = obtener_transformador()
+        geometrias = por_hilo.transformador.transformar([feat.geometry() for feat in lote])
+        for feat, geom in zip(lote, geometrias):
+            feat.setGeometry(geom)
+        return lote
+
+    def volcar(lote):
+        nonlocal total, inicio_lote
+        ok, _ = proveedor.addFeatures(lote)
+        if not ok:
+            raise Exception(f"Error añadiendo entidades: {'; '.join(proveedor.errors())}")
+        total += len(lote)
+        segundos = time.perf_counter() - inicio_lote
+        if log_callback:
+            log_callback(f"   ↳ {etiqueta}: {total} entidades ({len(lote) / max(segundos, 1e-6):,.0f} ent/s)")
+        inicio_lote = time.perf_counter()
+
+    if not obtener_transformador:
+        for lote in leer_lotes():
+            volcar(lote)
+        return total
+
+    # Tubería lectura → reproyección → escritura, con como mucho dos lotes en vuelo
+    for _, lote, error in etapa(transformar, leer_lotes(), hilos=1, maximo=2):
+        if error:
+            raise error
+        volcar(lote)
+    return total
+
+def convertir_capa(ruta_gpkg, nombre_original, carpeta_entrada, carpeta_salida, epsg_destino, transform_context,
+                   log_callback=None, perfil_sqlite=None, tamano_lote=10000):
+    """
+    Exporta la capa 'nombre_original' de 'ruta_gpkg' como shapefile dentro de
+    'carpeta_salida', respetando su subcarpeta. Si hay que reproyectar, las entidades
+    se copian en lotes de 'tamano_lote'. Retorna la línea del resumen.
+    """
+    nombre_export = nombre_original
+    try:
+        mensaje_extra = ""
+
+        # Construir URI seguro para cargar capa
+        uri = f"{ruta_gpkg}|layername={nombre_original}"
+        with aplicar_perfil_sqlite(perfil_sqlite, lectura=True):
+            layer = QgsVectorLayer(uri, nombre_export, "ogr")
+        if not layer.isValid():
+            raise Exception(f"No se pudo cargar la capa '{nombre_original}' desde {ruta_gpkg.name}")
+
+        # Determinar CRS destino
+        if epsg_destino:
+            crs_destino = CACHE_TRANSFORMACIONES.crs_epsg(epsg_destino)
+        elif layer.crs().isValid():
+            crs_destino = layer.crs()
+        else:
+            crs_destino = CACHE_TRANSFORMACIONES.crs_epsg(4326)
+
+        if not layer.crs().isValid():
+            mensaje_extra += f" (CRS indefinido → EPSG:{crs_destino.postgisSrid()})"
+            msg = f"⚠️ {ruta_gpkg.stem}:{nombre_export} → CRS indefinido, asignado EPSG:{crs_destino.postgisSrid()}"
+            if log_callback:
+                log_callback(msg)
+            # Se asigna el CRS destino sin reproyectar
+            layer.setCrs(crs_destino)
+
+        if layer.crs() == crs_destino:
+            # Ruta rápida: sin reproyección, la capa original va directa al escritor
+            export_layer = layer
+            mensaje_extra += " [copia directa]"
+        else:
+            # Crear capa en memoria con geometría correcta
+            geom_type = QgsWkbTypes.displayString(layer.wkbType())
+            mem_layer = QgsVectorLayer(f"{geom_type}?crs={crs_destino.authid()}", nombre_export, "memory")
+            mem_layer_data = mem_layer.dataProvider()
+            mem_layer_data.addAttributes(layer.fields())
+            mem_layer.updateFields()
+
+            # Transformar geometrías
+            crs_origen = layer.crs()
+
+            def obtener_transformador():
+                return CACHE_TRANSFORMACIONES.transformador(crs_origen, crs_destino, transform_context)
+
+            mensaje_extra += f" (Reproyectado a EPSG:{crs_destino.postgisSrid()})"
+
+            copiar_entidades_por_lotes(layer, mem_layer_data, obtener_transformador, tamano_lote, log_callback,
+                                       f"{ruta_gpkg.stem}:{nombre_export}")
+
+            export_layer = mem_layer
+
+        # Ruta de salida
+        ruta_relativa = ruta_gpkg.relative_to(carpeta_entrada).parent
+        ruta_salida = carpeta_salida / ruta_relativa / f"{nombre_export}.shp"
+        ruta_salida.parent.mkdir(parents=True, exist_ok=True)
+
+        # Eliminar SHP existente
+        for ext in [".shp", ".shx", ".dbf", ".prj", ".cpg"]:
+            f = ruta_salida.with_suffix(ext)
+            if f.exists():
+                f.unlink()
+
+        # Guardar SHP
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "ESRI Shapefile"
+        options.fileEncoding = "UTF-8"
+
+        result, error_message = QgsVectorFileWriter.writeAsVectorFormatV2(
+            export_layer,
+            str(ruta_salida),
+            transform_context,
+            options
+        )
+        if result != QgsVectorFileWriter.NoError:
+            raise Exception(error_message)
+
+        if log_callback:
+            log_callback(f"✅ {ruta_gpkg.stem}:{nombre_export} → convertido{mensaje_extra}")
+        return f"{ruta_gpkg.stem}:{nombre_export} → convertido{mensaje_extra}"
+
+    except Exception as e:
+        if log_callback:
+            log_callback(f"❌ {ruta_gpkg.stem}:{nombre_export} → fallido → {e}")
+        return f"{ruta_gpkg.stem}:{nombre_export} → fallido → {e}"
+
+def convertir_en_paralelo(trabajos, resumen, carpeta_entrada, carpeta_salida, epsg_destino=None,
+                          cancel_callback=None, log_callback=None, perfil_sqlite=None, procesos=None,
+                          resultado_callback=None):
+    """
+    Exporta las capas de 'trabajos' [(posición en resumen, ruta_gpkg, nombre_capa), ...]
+    en 'procesos' procesos. Las capas que escriben el mismo shapefile se exportan
+    en orden dentro de una misma tarea, de modo que el resultado no depende del
+    orden en que terminan los procesos. Cada línea se escribe en su posición de 'resumen'.
+    'resultado_callback(ruta_gpkg, nombre_capa, linea)' se llama al terminar cada capa.
+    """
+    grupos = {}
+    for posicion, ruta_gpkg, nombre_capa in trabajos:
+        destino = (ruta_gpkg.relative_to(carpeta_entrada).parent / nombre_capa).as_posix().lower()
+        grupos.setdefault(destino, []).append((posicion, ruta_gpkg, nombre_capa))
+
+    if log_callback:
+        log_callback(f"🚀 Exportando {len(trabajos)} capas en paralelo con {numero_procesos(procesos)} procesos")
+
+    with crear_pool(procesos) as pool:
+        futuros = {
+            pool.submit(convertir_capas_ogr, [(str(ruta), nombre) for _, ruta, nombre in grupo],
+                        str(carpeta_entrada), str(carpeta_salida), epsg_destino, perfil_sqlite): grupo
+            for grupo in grupos.values()
+        }
+        for futuro in esperar_resultados(futuros, cancel_callback):
+            if futuro.cancelled():
+                continue
+            grupo = futuros[futuro]
+            try:
+                resultados = futuro.result()
+            except Exception as e:
+                resultados = [(f"{ruta.stem}:{nombre} → fallido → {e}",
+                               [("critical", f"❌ {ruta.stem}:{nombre} → fallido → {e}")])
+                              for _, ruta, nombre in grupo]
+            for (posicion, ruta_gpkg, nombre_capa), (linea, mensajes) in zip(grupo, resultados):
+                resumen[posicion] = linea
+                if resultado_callback:
+                    resultado_callback(ruta_gpkg, nombre_capa, linea)
+                for _, msg in mensajes:
+                    if log_callback:
+                        log_callback(msg)
 
 def convertir_gpkg_a_shp(carpeta_entrada, carpeta_salida, epsg_destino=None,
-                         cancel_callback=None, log_callback=None):
+                         cancel_callback=None, log_callback=None, perfil_sqlite=None,
+                         paralelo=False, procesos=None, tamano_lote=10000, omitir_sin_cambios=False,
+                         reanudar=False, escaneo=None, progreso_callback=None):
     """
     Convierte todas las capas de GeoPackages a shapefiles usando PyQGIS.
     Cada capa se exporta como un SHP independiente.
     Se respeta la estructura de subcarpetas y se sobrescriben archivos existentes.
     Capas sin nombre se omiten y se reportan en log/resumen con contador.
+    'perfil_sqlite' elige el perfil de PRAGMAs con el que se leen los GPKG.
+    Con 'paralelo' cada capa se exporta con OGR en uno de 'procesos' procesos
+    (por defecto, uno por CPU); el resumen mantiene el orden del modo secuencial.
+    'tamano_lote' es el número de entidades por lote al reproyectar.
+    Con 'omitir_sin_cambios' se omiten los GPKG que no han cambiado desde la
+    última exportación al mismo EPSG (según el manifiesto de la carpeta de salida).
+    Las capas exportadas se anotan en un diario de reanudación; con 'reanudar'
+    se omiten las que ya completó una ejecución anterior cancelada o interrumpida.
+    Los GPKG se buscan con gpkg_escaneo.escanear ('escaneo' son sus opciones:
+    incluir, excluir, profundidad_max, enlaces, hilos). La búsqueda, la inspección de cada GPKG
+    (manifiesto y lista de capas) y la exportación corren a la vez como etapas de una
+    tubería con colas acotadas, de modo que la exportación empieza con el primer GPKG.
+    'progreso_callback(progreso)' recibe periódicamente el gpkg_progreso.Progreso de la ejecución.
     """
     carpeta_entrada = Path(carpeta_entrada)
     carpeta_salida = Path(carpeta_salida)
     carpeta_salida.mkdir(parents=True, exist_ok=True)
 
-    geopackages = list(carpeta_entrada.rglob("*.gpkg"))
-    resumen = []
+    resumen = [f"Perfil SQLite (lectura): {describir_perfil(perfil_sqlite, lectura=True)}"]
+    contadores_cache = CACHE_TRANSFORMACIONES.contadores()
 
     transform_context = QgsProject.instance().transformContext()
+    trabajos = []
+    manifiesto = ManifiestoConversion(carpeta_entrada, carpeta_salida) if omitir_sin_cambios else None
+    exportados = []  # (ruta_gpkg, [(posición en resumen, nombre_capa), ...]) para el manifiesto
+    diario = DiarioReanudacion(carpeta_salida / "gpkg_tools_reanudar.sqlite",
+                               {"herramienta": "gpkg2shp", "entrada": carpeta_entrada, "epsg": epsg_destino},
+                               reanudar)
+    if diario.error and log_callback:
+        log_callback(f"⚠️ No se pudo abrir el diario de reanudación ({diario.error}): se continúa sin él")
+    reanudadas = 0
+    progreso = Progreso(progreso_callback)
+    if reanudar and log_callback:
+        log_callback("↩️ Reanudando la exportación anterior" if diario.reanudado else
+                     "⚠️ No hay una exportación anterior que reanudar: se exportan todas las capas")
 
-    for ruta_gpkg in geopackages:
+    def clave_capa(ruta_gpkg, nombre_capa):
+        return f"{ruta_gpkg.relative_to(carpeta_entrada).as_posix()}|{nombre_capa}"
+
+    def registrar(ruta_gpkg, nombre_capa, linea):
+        progreso.capa_terminada(ruta_gpkg)
+        if linea.startswith(f"{ruta_gpkg.stem}:{nombre_capa} → convertido"):
+            salida = ruta_gpkg.relative_to(carpeta_entrada).parent / f"{nombre_capa}.shp"
+            diario.registrar(clave_capa(ruta_gpkg, nombre_capa), linea=linea, salidas=[salida.as_posix()])
+
+    def inspeccionar(ruta_gpkg):
+        """
+        Etapa de inspección (en otro hilo): retorna (entrada vigente del manifiesto, None)
+        si el GPKG no ha cambiado o (None, nombres de sus capas).
+        """
+        entrada = manifiesto.vigente(ruta_gpkg, epsg_destino) if manifiesto else None
+        if entrada:
+            return entrada, None
+        with aplicar_perfil_sqlite(perfil_sqlite, lectura=True):
+            ds = ogr.Open(str(ruta_gpkg))
+        if ds is None:
+            raise Exception("No se pudo abrir el GPKG con OGR.")
+        return None, [ds.GetLayerByIndex(i).GetName() for i in range(ds.GetLayerCount())]
+
+    # Tubería: búsqueda (hilo propio) → inspección (hilos) → exportación (este hilo o procesos)
+    encontrados = progreso.encontrados(escanear(carpeta_entrada, tipos=("*.gpkg",), **(escaneo or {})))
+    geopackages = etapa(inspeccionar, en_segundo_plano(encontrados), hilos=2)
+
+    for ruta_gpkg, inspeccion, error in geopackages:
         if cancel_callback and cancel_callback():
             msg = "⏹ Conversión cancelada por el usuario."
             if log_callback:
@@ -36,114 +292,89 @@ def convertir_gpkg_a_shp(carpeta_entrada, carpeta_salida, epsg_destino=None,
             resumen.append("Cancelado por el usuario.")
             break
 
-        try:
-            ds = ogr.Open(str(ruta_gpkg))
-            if ds is None:
-                raise Exception("No se pudo abrir el GPKG con OGR.")
-
-            capas_nombres = [ds.GetLayerByIndex(i).GetName() for i in range(ds.GetLayerCount())]
+        entrada, capas_nombres = inspeccion or (None, None)
+        if entrada:
+            manifiesto.omitidos += 1
+            progreso.archivo_terminado(ruta_gpkg, omitido=True)
+            resumen.extend(f"{ruta_gpkg.stem}:{nombre} → sin cambios (omitido)" for nombre in entrada["capas"])
             if log_callback:
-                log_callback(f"📦 Procesando GPKG: {ruta_gpkg.name} → {len(capas_nombres)} capas encontradas")
+                log_callback(f"⏭️ {ruta_gpkg.name}: sin cambios, omitido")
+            continue
 
-        except Exception as e:
-            msg = f"❌ {ruta_gpkg.name}: fallo al listar capas → {e}"
+        if error:
+            msg = f"❌ {ruta_gpkg.name}: fallo al listar capas → {error}"
             if log_callback:
                 log_callback(msg)
             resumen.append(msg)
+            progreso.archivo_terminado(ruta_gpkg)
             continue
+        if log_callback:
+            log_callback(f"📦 Procesando GPKG: {ruta_gpkg.name} → {len(capas_nombres)} capas encontradas")
+        progreso.capas_encontradas(ruta_gpkg, sum(1 for nombre in capas_nombres if nombre))
 
         contador_sin_nombre = 1
+        exportados.append((ruta_gpkg, []))
         for nombre_original in capas_nombres:
-            nombre_export = None
-            try:
-                if not nombre_original:
-                    msg = f"⚠️ {ruta_gpkg.stem}: capa sin nombre #{contador_sin_nombre} → omitida."
-                    contador_sin_nombre += 1
-                    resumen.append(msg)
-                    if log_callback:
-                        log_callback(msg)
-                    continue
-
-                nombre_export = nombre_original
-                mensaje_extra = ""
-
-                # Construir URI seguro para cargar capa
-                uri = f"{ruta_gpkg}|layername={nombre_original}"
-                layer = QgsVectorLayer(uri, nombre_export, "ogr")
-                if not layer.isValid():
-                    raise Exception(f"No se pudo cargar la capa '{nombre_original}' desde {ruta_gpkg.name}")
-
-                # Determinar CRS destino
-                if epsg_destino:
-                    crs_destino = QgsCoordinateReferenceSystem.fromEpsgId(epsg_destino)
-                elif layer.crs().isValid():
-                    crs_destino = layer.crs()
-                else:
-                    crs_destino = QgsCoordinateReferenceSystem.fromEpsgId(4326)
-
-                if not layer.crs().isValid():
-                    mensaje_extra += f" (CRS indefinido → EPSG:{crs_destino.postgisSrid()})"
-                    msg = f"⚠️ {ruta_gpkg.stem}:{nombre_export} → CRS indefinido, asignado EPSG:{crs_destino.postgisSrid()}"
-                    if log_callback:
-                        log_callback(msg)
-
-                # Crear capa en memoria con geometría correcta
-                geom_type = QgsWkbTypes.displayString(layer.wkbType())
-                mem_layer = QgsVectorLayer(f"{geom_type}?crs={crs_destino.authid()}", nombre_export, "memory")
-                mem_layer_data = mem_layer.dataProvider()
-                mem_layer_data.addAttributes(layer.fields())
-                mem_layer.updateFields()
-
-                # Transformar geometrías si es necesario
-                xform = None
-                if layer.crs() != crs_destino:
-                    xform = QgsCoordinateTransform(layer.crs(), crs_destino, transform_context)
-                    mensaje_extra += f" (Reproyectado a EPSG:{crs_destino.postgisSrid()})"
-
-                for feat in layer.getFeatures():
-                    geom = feat.geometry()
-                    if geom and xform:
-                        geom.transform(xform)
-                    new_feat = QgsFeature()
-                    new_feat.setGeometry(geom)
-                    new_feat.setAttributes(feat.attributes())
-                    mem_layer_data.addFeature(new_feat)
-
-                export_layer = mem_layer
-
-                # Ruta de salida
-                ruta_relativa = ruta_gpkg.relative_to(carpeta_entrada).parent
-                ruta_salida = carpeta_salida / ruta_relativa / f"{nombre_export}.shp"
-                ruta_salida.parent.mkdir(parents=True, exist_ok=True)
-
-                # Eliminar SHP existente
-                for ext in [".shp", ".shx", ".dbf", ".prj", ".cpg"]:
-                    f = ruta_salida.with_suffix(ext)
-                    if f.exists():
-                        f.unlink()
-
-                # Guardar SHP
-                options = QgsVectorFileWriter.SaveVectorOptions()
-                options.driverName = "ESRI Shapefile"
-                options.fileEncoding = "UTF-8"
-
-                result, error_message = QgsVectorFileWriter.writeAsVectorFormatV2(
-                    export_layer,
-                    str(ruta_salida),
-                    transform_context,
-                    options
-                )
-                if result != QgsVectorFileWriter.NoError:
-                    raise Exception(error_message)
-
-                resumen.append(f"{ruta_gpkg.stem}:{nombre_export} → convertido{mensaje_extra}")
+            if not nombre_original:
+                msg = f"⚠️ {ruta_gpkg.stem}: capa sin nombre #{contador_sin_nombre} → omitida."
+                contador_sin_nombre += 1
+                resumen.append(msg)
                 if log_callback:
-                    log_callback(f"✅ {ruta_gpkg.stem}:{nombre_export} → convertido{mensaje_extra}")
+                    log_callback(msg)
+                continue
 
-            except Exception as e:
-                resumen.append(f"{ruta_gpkg.stem}:{nombre_export} → fallido → {e}")
+            exportados[-1][1].append((len(resumen), nombre_original))
+            hecha = diario.reanudado and diario.completado(clave_capa(ruta_gpkg, nombre_original), carpeta_salida)
+            if hecha:
+                reanudadas += 1
+                progreso.capa_terminada(ruta_gpkg, omitida=True)
+                resumen.append(hecha["linea"])
+                msg = f"↩️ {ruta_gpkg.stem}:{nombre_original} → ya exportada en la ejecución anterior"
                 if log_callback:
-                    log_callback(f"❌ {ruta_gpkg.stem}:{nombre_export} → fallido → {e}")
+                    log_callback(msg)
+            elif paralelo:
+                trabajos.append((len(resumen), ruta_gpkg, nombre_original))
+                resumen.append(None)
+            else:
+                linea = convertir_capa(ruta_gpkg, nombre_original, carpeta_entrada, carpeta_salida,
+                                       epsg_destino, transform_context, log_callback, perfil_sqlite, tamano_lote)
+                resumen.append(linea)
+                registrar(ruta_gpkg, nombre_original, linea)
+
+    geopackages.close()
+
+    if trabajos and not (cancel_callback and cancel_callback()):
+        convertir_en_paralelo(trabajos, resumen, carpeta_entrada, carpeta_salida, epsg_destino,
+                              cancel_callback, log_callback, perfil_sqlite, procesos, registrar)
+
+    progreso.terminar()
+    cancelado = bool(cancel_callback and cancel_callback())
+    diario.cerrar(terminado=not cancelado)
+    if manifiesto:
+        # Solo se anotan los GPKG con todas sus capas exportadas
+        for ruta_gpkg, capas in exportados:
+            if all((resumen[pos] or "").startswith(f"{ruta_gpkg.stem}:{nombre} → convertido")
+                   for pos, nombre in capas):
+                carpeta = ruta_gpkg.relative_to(carpeta_entrada).parent
+                manifiesto.registrar(ruta_gpkg, epsg_destino, [carpeta / f"{nombre}.shp" for _, nombre in capas],
+                                     capas=[nombre for _, nombre in capas])
+        manifiesto.guardar(completo=not cancelado)
+
+    if None in resumen:
+        # Capas que no llegaron a exportarse por cancelación
+        resumen = [linea for linea in resumen if linea is not None]
+        if "Cancelado por el usuario." not in resumen:
+            if log_callback:
+                log_callback("⏹ Conversión cancelada por el usuario.")
+            resumen.append("Cancelado por el usuario.")
+
+    directas = sum(1 for linea in resumen if "[copia directa]" in linea)
+    resumen.append(f"Capas exportadas por copia directa (sin reproyección): {directas}")
+    if manifiesto:
+        resumen.append(f"GPKG omitidos sin cambios: {manifiesto.omitidos}")
+    if reanudar:
+        resumen.append(f"Capas ya exportadas en la ejecución anterior: {reanudadas}")
+    resumen.append(CACHE_TRANSFORMACIONES.describir(contadores_cache))
 
     # Guardar resumen
     ruta_resumen = carpeta_salida / "resumen_conversion.txt"
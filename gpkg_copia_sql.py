@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Copia de tablas entre GeoPackages a nivel de SQLite: el GPKG de origen se
+adjunta (ATTACH) a la conexión del GPKG de salida y cada tabla se copia con
+INSERT INTO ... SELECT, sin pasar por objetos de entidad de OGR. Las filas de
+metadatos (gpkg_contents, gpkg_geometry_columns, gpkg_spatial_ref_sys y
+gpkg_ogr_contents) se escriben a mano. Solo usa OGR/GDAL.
+"""
+from .gpkg_utils import consultar_sql, ejecutar_sql
+
+# Extensiones de tabla que no impiden la copia (el índice espacial se reconstruye aparte)
+EXTENSIONES_ADMITIDAS = {"gpkg_rtree_index"}
+
+
+class CopiaSQLNoSoportada(Exception):
+    """La tabla no se puede copiar con SQL y debe copiarse con OGR (CopyLayer)."""
+
+
+def _id(nombre):
+    """Identificador SQL entre comillas dobles."""
+    return '"' + str(nombre).replace('"', '""') + '"'
+
+
+def _texto(valor):
+    """Literal SQL de texto (o NULL)."""
+    if valor is None:
+        return "NULL"
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def _valor(valor):
+    """Literal SQL de un valor leído de una tabla (número, texto o NULL)."""
+    if valor is None or isinstance(valor, (int, float)):
+        return "NULL" if valor is None else repr(valor)
+    return _texto(valor)
+
+
+def adjuntar(out_ds, ruta, alias="fuente"):
+    """Adjunta el GPKG 'ruta' a la conexión de 'out_ds' como 'alias'. Lanza CopiaSQLNoSoportada si no es posible."""
+    try:
+        ejecutar_sql(out_ds, f"ATTACH DATABASE {_texto(str(ruta))} AS {_id(alias)}")
+    except RuntimeError as e:
+        raise CopiaSQLNoSoportada(f"ATTACH no disponible: {e}")
+    if not consultar_sql(out_ds, f"SELECT 1 FROM {_id(alias)}.sqlite_master LIMIT 1"):
+        separar(out_ds, alias)
+        raise CopiaSQLNoSoportada(f"ATTACH no disponible para {ruta}")
+
+
+def separar(out_ds, alias="fuente"):
+    """Separa (DETACH) el GPKG adjuntado como 'alias'."""
+    try:
+        ejecutar_sql(out_ds, f"DETACH DATABASE {_id(alias)}")
+    except RuntimeError:
+        pass
+
+
+def _fila(out_ds, sql):
+    filas = consultar_sql(out_ds, sql)
+    return filas[0] if filas else None
+
+
+def _preparar_srs(out_ds, alias, srs_id):
+    """
+    Comprueba que el srs_id de la tabla de origen significa lo mismo en el GPKG de
+    salida (las geometrías GPKG lo llevan en su cabecera) y, si no existe, lo copia.
+    """
+    if srs_id is None or srs_id in (0, -1):
+        return
+    columnas = "srs_name, srs_id, organization, organization_coordsys_id, definition, description"
+    origen = _fila(out_ds, f"SELECT {columnas} FROM {_id(alias)}.gpkg_spatial_ref_sys WHERE srs_id = {int(srs_id)}")
+    if not origen:
+        raise CopiaSQLNoSoportada(f"srs_id {srs_id} no definido en el origen")
+    destino = _fila(out_ds, f"SELECT {columnas} FROM main.gpkg_spatial_ref_sys WHERE srs_id = {int(srs_id)}")
+    if destino is None:
+        ejecutar_sql(out_ds, f"INSERT INTO main.gpkg_spatial_ref_sys ({columnas}) "
+                             f"VALUES ({', '.join(_valor(v) for v in origen)})")
+    elif not _mismo_srs(origen, destino):
+        raise CopiaSQLNoSoportada(f"srs_id {srs_id} tiene otro significado en el GPKG de salida")
+
+
+def _mismo_srs(origen, destino):
+    """
+    True si dos filas de gpkg_spatial_ref_sys describen el mismo CRS. Con autoridad
+    basta el código; los CRS sin autoridad (organization NONE, con el srs_id como
+    código, p. ej. 100000 en todos los GPKG) solo coinciden si su definición es la misma.
+    """
+    organizacion = str(origen[2] or "").lower()
+    if (organizacion, origen[3]) != (str(destino[2] or "").lower(), destino[3]):
+        return False
+    if organizacion not in ("", "none", "undefined"):
+        return True
+    return " ".join(str(origen[4] or "").split()) == " ".join(str(destino[4] or "").split())
+
+
+def _definicion_columnas(out_ds, alias, tabla):
+    """Columnas de la tabla de origen como lista de (nombre, definición SQL)."""
+    filas = consultar_sql(out_ds, f"SELECT name, type, \"notnull\", dflt_value, pk "
+                                  f"FROM pragma_table_info({_texto(tabla)}, {_texto(alias)})")
+    if not filas:
+        raise CopiaSQLNoSoportada("no se pudieron leer las columnas")
+    claves = [f for f in filas if f[4]]
+    if len(claves) != 1 or str(claves[0][1]).upper() != "INTEGER":
+        raise CopiaSQLNoSoportada("clave primaria no compatible")
+    columnas = []
+    for nombre, tipo, no_nulo, defecto, clave in filas:
+        if clave:
+            definicion = f"{_id(nombre)} INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL"
+        else:
+            definicion = f"{_id(nombre)} {tipo or ''}".rstrip()
+            if no_nulo:
+                definicion += " NOT NULL"
+            if defecto is not None:
+                definicion += f" DEFAULT {defecto}"
+        columnas.append((nombre, definicion))
+    return columnas
+
+
+def copiar_tabla_sql(out_ds, tabla, nombre_destino, alias="fuente"):
+    """
+    Copia la tabla 'tabla' del GPKG adjuntado como 'alias' a la tabla nueva
+    'nombre_destino' del GPKG de salida, con sus filas de metadatos y los
+    disparadores de recuento de OGR. Todo ocurre dentro de un SAVEPOINT, de modo
+    que si algo falla no queda nada a medias. No crea el índice espacial.
+    Retorna el número de entidades copiadas. Lanza CopiaSQLNoSoportada si la tabla
+    necesita la copia con OGR.
+    """
+    origen = _id(alias)
+    contenido = _fila(out_ds, f"SELECT table_name, data_type, description, min_x, min_y, max_x, max_y, srs_id "
+                              f"FROM {origen}.gpkg_contents WHERE lower(table_name) = lower({_texto(tabla)})")
+    if not contenido or contenido[1] not in ("features", "attributes"):
+        raise CopiaSQLNoSoportada("tabla no registrada como capa vectorial")
+    tabla = contenido[0]
+
+    extensiones = consultar_sql(out_ds, f"SELECT extension_name FROM {origen}.gpkg_extensions "
+                                        f"WHERE lower(table_name) = lower({_texto(tabla)})") or []
+    otras = {fila[0] for fila in extensiones} - EXTENSIONES_ADMITIDAS
+    if otras:
+        raise CopiaSQLNoSoportada(f"extensiones no admitidas: {', '.join(sorted(otras))}")
+
+    geometria = None
+    if contenido[1] == "features":
+        geometria = _fila(out_ds, f"SELECT column_name, geometry_type_name, srs_id, z, m "
+                                  f"FROM {origen}.gpkg_geometry_columns "
+                                  f"WHERE lower(table_name) = lower({_texto(tabla)})")
+        if not geometria:
+            raise CopiaSQLNoSoportada("sin fila en gpkg_geometry_columns")
+    columnas = _definicion_columnas(out_ds, alias, tabla)
+    lista = ", ".join(_id(nombre) for nombre, _ in columnas)
+    destino = _id(nombre_destino)
+
+    ejecutar_sql(out_ds, "SAVEPOINT copia_sql")
+    try:
+        if geometria:
+            _preparar_srs(out_ds, alias, geometria[2])
+        ejecutar_sql(out_ds, f"CREATE TABLE main.{destino} ({', '.join(d for _, d in columnas)})")
+        ejecutar_sql(out_ds, f"INSERT INTO main.{destino} ({lista}) SELECT {lista} FROM {origen}.{_id(tabla)}")
+        # changes() no es fiable aquí: OGR puede ejecutar otras sentencias entre medias
+        recuento = _fila(out_ds, f"SELECT feature_count FROM {origen}.gpkg_ogr_contents "
+                                 f"WHERE lower(table_name) = lower({_texto(tabla)})")
+        if not recuento or recuento[0] is None:
+            recuento = _fila(out_ds, f"SELECT count(*) FROM main.{destino}")
+        entidades = int(recuento[0]) if recuento else 0
+
+        _, data_type, descripcion, min_x, min_y, max_x, max_y, srs_id = contenido
+        ejecutar_sql(out_ds, "INSERT INTO main.gpkg_contents (table_name, data_type, identifier, description, "
+                             "last_change, min_x, min_y, max_x, max_y, srs_id) VALUES ("
+                             f"{_texto(nombre_destino)}, {_texto(data_type)}, {_texto(nombre_destino)}, "
+                             f"{_texto(descripcion or '')}, strftime('%Y-%m-%dT%H:%M:%fZ', 'now'), "
+                             f"{', '.join(_valor(v) for v in (min_x, min_y, max_x, max_y, srs_id))})")
+        if geometria:
+            columna, tipo, srs_geom, z, m = geometria
+            ejecutar_sql(out_ds, "INSERT INTO main.gpkg_geometry_columns (table_name, column_name, "
+                                 "geometry_type_name, srs_id, z, m) VALUES ("
+                                 f"{_texto(nombre_destino)}, {_texto(columna)}, {_texto(tipo)}, "
+                                 f"{_valor(srs_geom)}, {_valor(z)}, {_valor(m)})")
+
+        if consultar_sql(out_ds, "SELECT 1 FROM main.sqlite_master WHERE name = 'gpkg_ogr_contents'"):
+            # Mismo recuento y disparadores que crea OGR para sus capas
+            ejecutar_sql(out_ds, f"INSERT INTO main.gpkg_ogr_contents (table_name, feature_count) "
+                                 f"VALUES ({_texto(nombre_destino)}, {entidades})")
+            condicion = f"lower(table_name) = lower({_texto(nombre_destino)})"
+            for evento, cambio in (("insert", "+ 1"), ("delete", "- 1")):
+                ejecutar_sql(out_ds, f"CREATE TRIGGER main.{_id(f'trigger_{evento}_feature_count_{nombre_destino}')} "
+                                     f"AFTER {evento.upper()} ON {destino} BEGIN UPDATE gpkg_ogr_contents SET "
+                                     f"feature_count = feature_count {cambio} WHERE {condicion}; END")
+    except Exception:
+        ejecutar_sql(out_ds, "ROLLBACK TO copia_sql")
+        ejecutar_sql(out_ds, "RELEASE copia_sql")
+        raise
+    ejecutar_sql(out_ds, "RELEASE copia_sql")
+    return entidades
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Exploración de carpetas para las herramientas de GPKG Tools: recorre los
+subdirectorios con os.scandir en varios hilos (solo metadatos, sin abrir los
+archivos) y entrega los archivos en un orden fijo a medida que los encuentra,
+sin esperar a listar todo el árbol.
+"""
+import fnmatch
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+# Políticas de enlaces simbólicos:
+# - "ignorar": se omiten los archivos y carpetas enlazados
+# - "archivos": se incluyen los archivos enlazados, sin entrar en carpetas enlazadas (como Path.rglob)
+# - "seguir": también se recorren las carpetas enlazadas (cada carpeta real una sola vez)
+ENLACES = ("ignorar", "archivos", "seguir")
+
+
+def patrones_desde_texto(texto):
+    """Convierte 'a*.gpkg; tmp, */copias/*' en una lista de patrones."""
+    return [p.strip() for p in re.split(r"[;,]", texto or "") if p.strip()]
+
+
+def _coincide(nombre, ruta_relativa, patrones):
+    """True si el nombre o la ruta relativa coinciden (sin distinguir mayúsculas) con algún patrón."""
+    nombre, ruta_relativa = nombre.lower(), ruta_relativa.lower()
+    return any(fnmatch.fnmatchcase(nombre, p) or fnmatch.fnmatchcase(ruta_relativa, p) for p in patrones)
+
+
+def _listar(carpeta):
+    """Retorna (archivos, subcarpetas, error) de 'carpeta' como os.DirEntry."""
+    archivos, carpetas = [], []
+    try:
+        with os.scandir(carpeta) as entradas:
+            for entrada in entradas:
+                try:
+                    if entrada.is_dir():
+                        carpetas.append(entrada)
+                    elif entrada.is_file():
+                        archivos.append(entrada)
+                except OSError:
+                    continue
+    except OSError as e:
+        return archivos, carpetas, e
+    return archivos, carpetas, None
+
+
+def escanear(carpeta, incluir=("*",), excluir=(), profundidad_max=None, enlaces="archivos", hilos=8,
+             error_cb=None, tipos=("*",)):
+    """
+    Genera las rutas (Path) de los archivos de 'carpeta' y sus subcarpetas que
+    coinciden con algún patrón de 'tipos' (el tipo de archivo que busca cada
+    herramienta) y con alguno de 'incluir' (el filtro del usuario), y que no
+    coinciden con 'excluir' (por nombre o por ruta relativa; las carpetas excluidas
+    no se recorren).
+    'profundidad_max' limita los niveles de subcarpetas (0: solo 'carpeta'; None: sin límite).
+    'enlaces' es la política de enlaces simbólicos (ver ENLACES).
+    Las carpetas se listan en 'hilos' hilos, pero los archivos se entregan siempre en
+    el mismo orden: en profundidad, primero los de cada carpeta y luego sus subcarpetas,
+    todo ordenado por nombre (las carpetas listadas antes de tiempo esperan su turno).
+    'error_cb(ruta, error)' recibe las carpetas que no se pudieron leer.
+    """
+    if enlaces not in ENLACES:
+        raise ValueError(f"Política de enlaces desconocida: {enlaces}")
+    raiz = str(Path(carpeta))
+    tipos = [p.lower() for p in tipos]
+    incluir = [p.lower() for p in incluir or ("*",)]
+    excluir = [p.lower() for p in excluir]
+    visitadas = set()
+
+    def nueva_carpeta(ruta):
+        """Con 'seguir', evita recorrer dos veces la misma carpeta real (ciclos de enlaces)."""
+        if enlaces != "seguir":
+            return True
+        try:
+            st = os.stat(ruta)
+        except OSError:
+            return False
+        clave = (st.st_dev, st.st_ino)
+        if clave in visitadas:
+            return False
+        visitadas.add(clave)
+        return True
+
+    nueva_carpeta(raiz)
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as pool:
+        # Cada carpeta es [relativa, nivel, listado, archivos, subcarpetas, error]; el listado
+        # se pide en cuanto se descubre la carpeta y su resultado queda en espera hasta que le
+        # toca entregarse en profundidad (archivos, luego subcarpetas, todo ordenado por nombre)
+        sin_listar = {}
+
+        def pedir(ruta, relativa, nivel):
+            nodo = [relativa, nivel, pool.submit(_listar, ruta), None, None, None]
+            sin_listar[nodo[2]] = nodo
+            return nodo
+
+        def expandir(nodo):
+            """Guarda el listado de 'nodo' y pide ya el de sus subcarpetas."""
+            relativa, nivel, futuro = nodo[:3]
+            archivos, carpetas, error = futuro.result()
+            hijos = []
+            if profundidad_max is None or nivel < profundidad_max:
+                for sub in sorted(carpetas, key=lambda e: e.name):
+                    relativa_sub = relativa + sub.name
+                    if excluir and _coincide(sub.name, relativa_sub, excluir):
+                        continue
+                    if sub.is_symlink() and enlaces != "seguir":
+                        continue
+                    if nueva_carpeta(sub.path):
+                        hijos.append(pedir(sub.path, relativa_sub + "/", nivel + 1))
+            nodo[3:] = [sorted(archivos, key=lambda e: e.name), hijos, error]
+
+        pila = [pedir(raiz, "", 0)]
+        try:
+            while pila:
+                nodo = pila.pop()
+                # Mientras la carpeta siguiente no esté listada, se expanden las que van terminando
+                while nodo[2] in sin_listar:
+                    hechos, _ = wait(list(sin_listar), return_when=FIRST_COMPLETED)
+                    for futuro in hechos:
+                        expandir(sin_listar.pop(futuro))
+
+                relativa, _, _, archivos, hijos, error = nodo
+                if error and error_cb:
+                    error_cb(Path(raiz, relativa), error)
+                for archivo in archivos:
+                    if enlaces == "ignorar" and archivo.is_symlink():
+                        continue
+                    relativa_archivo = relativa + archivo.name
+                    if not _coincide(archivo.name, relativa_archivo, tipos):
+                        continue
+                    if not _coincide(archivo.name, relativa_archivo, incluir):
+                        continue
+                    if excluir and _coincide(archivo.name, relativa_archivo, excluir):
+                        continue
+                    yield Path(archivo.path)
+                pila.extend(reversed(hijos))
+        finally:
+            # Si se deja de consumir el generador (p. ej. al cancelar), no se listan más carpetas
+            for futuro in sin_listar:
+                futuro.cancel()
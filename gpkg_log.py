@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Canal de log compartido por los diálogos de GPKG Tools: las tareas escriben
+desde su hilo de trabajo sin tocar la GUI y el hilo GUI vuelca los mensajes
+acumulados al widget de log a una frecuencia fija, en un solo bloque.
+El log completo se guarda en un archivo temporal; el widget (QPlainTextEdit)
+muestra como mucho las últimas líneas que pasan el filtro de severidad y la
+búsqueda, de modo que la memoria no crece con el tamaño de la ejecución.
+"""
+import tempfile
+import threading
+from collections import deque
+from qgis.PyQt.QtCore import QObject, QTimer
+from qgis.PyQt.QtGui import QTextCursor
+
+# Filtros del log: (etiqueta, severidades visibles o None para todas)
+FILTROS_LOG = [
+    ("Todos los mensajes", None),
+    ("✅ Correctos", {"ok"}),
+    ("⚠️ Avisos y errores", {"aviso", "error"}),
+    ("❌ Solo errores", {"error"}),
+]
+
+
+def severidad(linea):
+    """Severidad de una línea de log según su emoji inicial: 'error', 'aviso', 'ok' o 'info'."""
+    linea = linea.lstrip()
+    if linea.startswith("❌"):
+        return "error"
+    if linea.startswith("⚠"):
+        return "aviso"
+    if linea.startswith("✅"):
+        return "ok"
+    return "info"
+
+
+class CanalLog(QObject):
+    """
+    Cola de mensajes entre los hilos de trabajo y el widget de log del diálogo.
+    'escribir(msg)' es seguro desde cualquier hilo: solo encola el mensaje. Un
+    QTimer del hilo GUI vuelca cada 1/'fps' segundos todo lo acumulado al archivo
+    de log y, con un único append, las líneas visibles al widget. Si se acumulan
+    más de 'max_lineas' mensajes entre dos volcados se descartan los más antiguos,
+    y el widget conserva como mucho 'max_lineas' líneas. 'estado(texto)' actualiza,
+    con el mismo volcado, la etiqueta de estado 'etiqueta' (p. ej. el progreso de
+    la tarea). 'filtrar' (o los controles enlazados con 'enlazar') vuelve a leer el
+    archivo de log y muestra solo las líneas de las severidades y el texto elegidos.
+    """
+
+    def __init__(self, widget, fps=10, max_lineas=5000, parent=None, etiqueta=None):
+        super().__init__(parent or widget)
+        self.widget = widget
+        self.etiqueta = etiqueta
+        self.max_lineas = max_lineas
+        self.severidades = None
+        self.texto = ""
+        self._pendientes = deque(maxlen=max_lineas)
+        self._descartados = 0
+        self._estado = None
+        self._lock = threading.Lock()
+        self._archivo = tempfile.TemporaryFile("w+", encoding="utf-8", prefix="gpkgtools_log_")
+        self.widget.setMaximumBlockCount(max_lineas)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(max(1, int(1000 / fps)))
+        self._timer.timeout.connect(self.volcar)
+        self._timer.start()
+
+    def escribir(self, msg):
+        """Encola 'msg' para el widget (desde cualquier hilo)."""
+        with self._lock:
+            if len(self._pendientes) == self._pendientes.maxlen:
+                self._descartados += 1
+            self._pendientes.append(str(msg))
+
+    def estado(self, texto):
+        """Fija el texto de la etiqueta de estado (desde cualquier hilo); se muestra en el próximo volcado."""
+        with self._lock:
+            self._estado = texto
+
+    def volcar(self):
+        """Guarda los mensajes pendientes en el archivo de log y añade al widget los visibles (solo hilo GUI)."""
+        with self._lock:
+            estado, self._estado = self._estado, None
+            mensajes = list(self._pendientes)
+            self._pendientes.clear()
+            descartados, self._descartados = self._descartados, 0
+        if estado is not None and self.etiqueta is not None:
+            self.etiqueta.setText(estado)
+        if not mensajes:
+            return
+        if descartados:
+            mensajes.insert(0, f"⚠️ {descartados} mensajes omitidos en el log (ver el registro de QGIS)")
+        lineas = "\n".join(mensajes).split("\n")
+        self._archivo.write("\n".join(lineas) + "\n")
+        self._archivo.flush()
+        visibles = [linea for linea in lineas if self._visible(linea)]
+        if visibles:
+            self.widget.appendPlainText("\n".join(visibles[-self.max_lineas:]))
+
+    def _visible(self, linea):
+        if self.severidades is not None and severidad(linea) not in self.severidades:
+            return False
+        return not self.texto or self.texto in linea.casefold()
+
+    def filtrar(self, severidades=None, texto=""):
+        """
+        Muestra solo las líneas de 'severidades' (None: todas) que contienen 'texto'
+        (sin distinguir mayúsculas), leyendo el archivo de log (solo hilo GUI).
+        """
+        self.volcar()
+        self.severidades = set(severidades) if severidades is not None else None
+        self.texto = (texto or "").strip().casefold()
+        self._archivo.seek(0)
+        visibles = deque((linea.rstrip("\n") for linea in self._archivo if self._visible(linea)),
+                         maxlen=self.max_lineas)
+        self._archivo.seek(0, 2)
+        self.widget.setPlainText("\n".join(visibles))
+        self.widget.moveCursor(QTextCursor.End)
+
+    def enlazar(self, combo, buscador, espera_ms=300):
+        """Rellena 'combo' con FILTROS_LOG y filtra el log al cambiarlo o al escribir en 'buscador'."""
+        for etiqueta, _ in FILTROS_LOG:
+            combo.addItem(etiqueta)
+        retardo = QTimer(self)
+        retardo.setSingleShot(True)
+        retardo.setInterval(espera_ms)
+
+        def aplicar():
+            self.filtrar(FILTROS_LOG[max(combo.currentIndex(), 0)][1], buscador.text())
+
+        retardo.timeout.connect(aplicar)
+        combo.currentIndexChanged.connect(aplicar)
+        buscador.textChanged.connect(lambda _texto: retardo.start())
+
+    def limpiar(self):
+        """Vacía el widget, el archivo de log y los mensajes pendientes (solo desde el hilo GUI)."""
+        with self._lock:
+            self._pendientes.clear()
+            self._descartados = 0
+            self._estado = None
+        self._archivo.seek(0)
+        self._archivo.truncate()
+        self.widget.clear()
+        if self.etiqueta is not None:
+            self.etiqueta.clear()
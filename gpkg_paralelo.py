@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Ejecución en procesos paralelos para las herramientas de GPKG Tools.
+Las funciones de este módulo se ejecutan en procesos hijos, por lo que solo
+pueden usar OGR/GDAL (nunca qgis.core).
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from osgeo import gdal, ogr, osr
+from .gpkg_utils import aplicar_perfil_sqlite, capas_gpkg
+
+
+def ejecutable_python():
+    """
+    Devuelve el intérprete de Python para lanzar los procesos hijos.
+    Dentro de QGIS sys.executable apunta a qgis(.exe), no a python.
+    """
+    exe = Path(sys.executable or "")
+    if exe.name.lower().startswith("python"):
+        return str(exe)
+    prefijo = Path(sys.exec_prefix)
+    for carpeta in (prefijo, prefijo / "bin"):
+        for nombre in ("python3.exe", "python.exe", "python3", "python"):
+            candidato = carpeta / nombre
+            if candidato.exists():
+                return str(candidato)
+    return shutil.which("python3") or shutil.which("python") or str(exe)
+
+
+def numero_procesos(procesos=None):
+    """Número de procesos a usar; por defecto, uno por CPU."""
+    return max(1, procesos or os.cpu_count() or 1)
+
+
+def crear_pool(procesos=None):
+    """Crea un ProcessPoolExecutor con procesos 'spawn' lanzados con Python (no con QGIS)."""
+    contexto = multiprocessing.get_context("spawn")
+    contexto.set_executable(ejecutable_python())
+    return ProcessPoolExecutor(max_workers=numero_procesos(procesos), mp_context=contexto)
+
+
+def repartir(elementos, procesos, por_tarea=None):
+    """Divide 'elementos' en tareas consecutivas (varias por proceso para equilibrar la carga)."""
+    if not por_tarea:
+        por_tarea = max(1, len(elementos) // (numero_procesos(procesos) * 4))
+    return [elementos[i:i + por_tarea] for i in range(0, len(elementos), por_tarea)]
+
+
+def esperar_resultados(futuros, cancel_cb=None, intervalo=0.5):
+    """
+    Genera los futuros a medida que terminan. Si cancel_cb() se activa,
+    cancela los pendientes y deja de generar.
+    """
+    pendientes = set(futuros)
+    while pendientes:
+        if cancel_cb and cancel_cb():
+            for futuro in pendientes:
+                futuro.cancel()
+            return
+        hechos, pendientes = wait(pendientes, timeout=intervalo, return_when=FIRST_COMPLETED)
+        yield from hechos
+
+
+# ----------------------------------------------------
+# Fusión de GPKG
+# ----------------------------------------------------
+def copiar_a_staging(rutas, ruta_staging, perfil_sqlite="rapido"):
+    """
+    Copia las capas no vacías de los GPKG 'rutas' a un GPKG temporal 'ruta_staging'.
+    Retorna, por archivo y en el mismo orden, las capas encontradas con el nombre
+    que recibieron en el GPKG temporal (o el error producido).
+    """
+    driver = ogr.GetDriverByName("GPKG")
+    with aplicar_perfil_sqlite(perfil_sqlite):
+        staging_ds = driver.CreateDataSource(str(ruta_staging))
+    if not staging_ds:
+        raise RuntimeError(f"No se pudo crear el GeoPackage temporal: {ruta_staging}")
+
+    resultados = []
+    staging_ds.StartTransaction()
+    for n_archivo, ruta in enumerate(rutas):
+        archivo = {"ruta": str(ruta), "capas": [], "error": None}
+        try:
+            in_ds = ogr.Open(str(ruta))
+            if not in_ds:
+                raise RuntimeError(f"No se pudo abrir: {ruta}")
+            for i, (in_layer, nombre, entidades) in enumerate(capas_gpkg(in_ds)):
+                capa = {"nombre": nombre, "entidades": entidades, "staging": None, "error": None}
+                if entidades != 0:
+                    nombre_staging = f"f{n_archivo}_c{i}"
+                    copia = staging_ds.CopyLayer(in_layer, nombre_staging, ["SPATIAL_INDEX=NO"])
+                    if copia:
+                        capa["staging"] = nombre_staging
+                        # Recuento de la copia: lo mantiene GDAL, sin recorrer la tabla
+                        capa["entidades"] = copia.GetFeatureCount()
+                    else:
+                        capa["error"] = f"Error copiando capa {nombre}"
+                archivo["capas"].append(capa)
+            in_ds = None
+        except Exception as e:
+            archivo["error"] = str(e)
+        resultados.append(archivo)
+    staging_ds.CommitTransaction()
+    staging_ds = None
+    return resultados
+
+
+# ----------------------------------------------------
+# Shapefile → GPKG
+# ----------------------------------------------------
+def convertir_shapefile_ogr(ruta, carpeta_entrada, carpeta_salida, epsg_destino=None, perfil_sqlite=None):
+    """
+    Convierte un shapefile a GPKG con OGR (equivalente a shp2gpkg_tool.convertir_shapefile).
+    Retorna (línea del resumen, [(nivel, mensaje), ...]) para que el proceso
+    principal escriba el log.
+    """
+    ruta = Path(ruta)
+    mensajes = []
+    try:
+        in_ds = ogr.Open(str(ruta))
+        if not in_ds:
+            raise Exception("No se pudo cargar la capa.")
+        in_layer = in_ds.GetLayer(0)
+        srs_origen = in_layer.GetSpatialRef()
+
+        srs_destino = osr.SpatialReference()
+        if epsg_destino:
+            if srs_destino.ImportFromEPSG(int(epsg_destino)) != 0:
+                raise Exception(f"EPSG inválido: {epsg_destino}")
+        elif srs_origen:
+            srs_destino = srs_origen.Clone()
+        else:
+            srs_destino.ImportFromEPSG(4326)
+        epsg_texto = srs_destino.GetAuthorityCode(None) or "?"
+
+        mensaje_extra = ""
+        opciones = {"format": "GPKG", "layerName": ruta.stem}
+        if ogr.GT_Flatten(in_layer.GetGeomType()) in (ogr.wkbPolygon, ogr.wkbLineString):
+            # Los shapefiles mezclan partes simples y múltiples (QGIS los escribe como Multi*)
+            opciones["geometryType"] = "PROMOTE_TO_MULTI"
+        if not srs_origen:
+            # Sin CRS de origen solo se asigna el CRS destino
+            mensaje_extra = f" (CRS indefinido → EPSG:{epsg_texto})"
+            mensajes.append(("warning", f"⚠️ {ruta.stem}: CRS indefinido → EPSG:{epsg_texto}"))
+            opciones.update(dstSRS=srs_destino.ExportToWkt(), reproject=False)
+        elif not srs_origen.IsSame(srs_destino):
+            mensaje_extra = f" (Reproyectado a EPSG:{epsg_texto})"
+            opciones.update(dstSRS=srs_destino.ExportToWkt(), reproject=True)
+        in_layer = None
+        in_ds = None
+
+        carpeta_salida_completa = Path(carpeta_salida) / ruta.relative_to(carpeta_entrada).parent
+        carpeta_salida_completa.mkdir(parents=True, exist_ok=True)
+        ruta_salida = carpeta_salida_completa / (ruta.stem + ".gpkg")
+        if ruta_salida.exists():
+            ruta_salida.unlink()
+
+        with aplicar_perfil_sqlite(perfil_sqlite):
+            out_ds = gdal.VectorTranslate(str(ruta_salida), str(ruta),
+                                          options=gdal.VectorTranslateOptions(**opciones))
+        if out_ds is None:
+            raise Exception(gdal.GetLastErrorMsg() or "Error escribiendo el GeoPackage")
+        out_ds = None
+
+        mensajes.append(("info", f"✅ {ruta.stem}: convertido{mensaje_extra}"))
+        return f"{ruta.stem}: convertido{mensaje_extra}", mensajes
+
+    except Exception as e:
+        mensajes.append(("critical", f"❌ {ruta.stem}: fallido → {e}"))
+        return f"{ruta.stem}: fallido → {e}", mensajes
+
+
+# ----------------------------------------------------
+# GPKG → Shapefile
+# ----------------------------------------------------
+def convertir_capa_ogr(ruta_gpkg, nombre_capa, carpeta_entrada, carpeta_salida, epsg_destino=None,
+                       perfil_sqlite=None):
+    """
+    Exporta una capa de un GPKG como shapefile con OGR (equivalente a
+    gpkg2shp_tool.convertir_capa). Retorna (línea del resumen, [(nivel, mensaje), ...]).
+    """
+    ruta_gpkg = Path(ruta_gpkg)
+    etiqueta = f"{ruta_gpkg.stem}:{nombre_capa}"
+    mensajes = []
+    try:
+        with aplicar_perfil_sqlite(perfil_sqlite, lectura=True):
+            in_ds = ogr.Open(str(ruta_gpkg))
+        in_layer = in_ds.GetLayerByName(nombre_capa) if in_ds else None
+        if not in_layer:
+            raise Exception(f"No se pudo cargar la capa '{nombre_capa}' desde {ruta_gpkg.name}")
+        srs_origen = in_layer.GetSpatialRef()
+
+        srs_destino = osr.SpatialReference()
+        if epsg_destino:
+            if srs_destino.ImportFromEPSG(int(epsg_destino)) != 0:
+                raise Exception(f"EPSG inválido: {epsg_destino}")
+        elif srs_origen:
+            srs_destino = srs_origen.Clone()
+        else:
+            srs_destino.ImportFromEPSG(4326)
+        epsg_texto = srs_destino.GetAuthorityCode(None) or "?"
+
+        mensaje_extra = ""
+        opciones = {"format": "ESRI Shapefile", "layers": [nombre_capa],
+                    "layerCreationOptions": ["ENCODING=UTF-8"]}
+        if not srs_origen:
+            mensaje_extra = f" (CRS indefinido → EPSG:{epsg_texto})"
+            mensajes.append(("warning", f"⚠️ {etiqueta} → CRS indefinido, asignado EPSG:{epsg_texto}"))
+            opciones.update(dstSRS=srs_destino.ExportToWkt(), reproject=False)
+        elif not srs_origen.IsSame(srs_destino):
+            mensaje_extra = f" (Reproyectado a EPSG:{epsg_texto})"
+            opciones.update(dstSRS=srs_destino.ExportToWkt(), reproject=True)
+        if not opciones.get("reproject"):
+            mensaje_extra += " [copia directa]"
+        in_layer = None
+
+        ruta_salida = Path(carpeta_salida) / ruta_gpkg.relative_to(carpeta_entrada).parent / f"{nombre_capa}.shp"
+        ruta_salida.parent.mkdir(parents=True, exist_ok=True)
+        for ext in [".shp", ".shx", ".dbf", ".prj", ".cpg"]:
+            f = ruta_salida.with_suffix(ext)
+            if f.exists():
+                f.unlink()
+
+        out_ds = gdal.VectorTranslate(str(ruta_salida), in_ds, options=gdal.VectorTranslateOptions(**opciones))
+        if out_ds is None:
+            raise Exception(gdal.GetLastErrorMsg() or "Error escribiendo el shapefile")
+        out_ds = None
+        in_ds = None
+
+        mensajes.append(("info", f"✅ {etiqueta} → convertido{mensaje_extra}"))
+        return f"{etiqueta} → convertido{mensaje_extra}", mensajes
+
+    except Exception as e:
+        mensajes.append(("critical", f"❌ {etiqueta} → fallido → {e}"))
+        return f"{etiqueta} → fallido → {e}", mensajes
+
+
+def convertir_capas_ogr(trabajos, carpeta_entrada, carpeta_salida, epsg_destino=None, perfil_sqlite=None):
+    """Exporta en orden una lista de capas [(ruta_gpkg, nombre_capa), ...] con convertir_capa_ogr."""
+    return [convertir_capa_ogr(ruta_gpkg, nombre_capa, carpeta_entrada, carpeta_salida, epsg_destino, perfil_sqlite)
+            for ruta_gpkg, nombre_capa in trabajos]
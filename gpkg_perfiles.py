@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""
+Perfiles de PRAGMAs de SQLite de GPKG Tools. Están en un módulo aparte, sin
+dependencias, para que los diálogos puedan listarlos sin importar GDAL.
+"""
+
+# Perfiles de PRAGMAs de SQLite aplicados a los GeoPackages que abre GDAL.
+# 'escritura' se aplica a los GPKG creados; 'lectura' a los GPKG que solo se leen.
+PERFILES_SQLITE = {
+    "seguro": {
+        "etiqueta": "🛡️ Seguro (valores por defecto de SQLite)",
+        "escritura": ["journal_mode=DELETE", "synchronous=FULL"],
+        "lectura": [],
+    },
+    "rapido": {
+        "etiqueta": "⚡ Escritura rápida (sin garantías ante cortes)",
+        "escritura": ["page_size=65536", "journal_mode=MEMORY", "synchronous=OFF",
+                      "cache_size=-262144", "temp_store=MEMORY"],
+        "lectura": ["cache_size=-262144", "temp_store=MEMORY", "mmap_size=268435456"],
+    },
+}
+
+PERFIL_POR_DEFECTO = "seguro"
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Modelo de progreso de las herramientas de GPKG Tools: los motores anotan los
+archivos encontrados, las capas y entidades procesadas y los archivos
+terminados; el modelo calcula el porcentaje (ponderado por el tamaño de los
+archivos) y la hora estimada de fin a partir del caudal en bytes por segundo.
+"""
+import threading
+import time
+
+
+def _tamano_legible(n):
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}" if unidad == "B" else f"{n:.1f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _duracion(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+
+
+class Progreso:
+    """
+    Progreso de una ejecución, seguro entre hilos (la búsqueda anota desde su hilo).
+    Cada archivo pesa lo que ocupa en disco; si tiene varias capas, su peso se reparte
+    entre ellas a medida que terminan. Mientras la búsqueda no termina, el total crece
+    y no se da ETA. Los archivos omitidos cuentan para el porcentaje pero no para el
+    caudal. 'callback(progreso)' se llama como mucho cada 'intervalo' segundos.
+    """
+
+    def __init__(self, callback=None, intervalo=0.5):
+        self.callback = callback
+        self.intervalo = intervalo
+        self.archivos_total = 0
+        self.archivos = 0
+        self.capas_total = 0
+        self.capas = 0
+        self.entidades = 0
+        self.bytes_total = 0
+        self.bytes_hechos = 0
+        self.bytes_procesados = 0
+        self.busqueda_terminada = False
+        self._pendientes = {}  # ruta: [bytes sin acreditar, capas sin terminar]
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._ultimo_aviso = 0.0
+        self._ultimo_porcentaje = 0.0
+
+    def encontrados(self, rutas, tamano=None):
+        """
+        Envuelve el generador de rutas de la búsqueda y anota cada archivo encontrado
+        ('tamano(ruta)' da su tamaño en bytes; por defecto, el del propio archivo).
+        """
+        for ruta in rutas:
+            try:
+                n = tamano(ruta) if tamano else ruta.stat().st_size
+            except OSError:
+                n = 0
+            with self._lock:
+                self.archivos_total += 1
+                self.bytes_total += n
+                self._pendientes[ruta] = [n, 0]
+            yield ruta
+        self.busqueda_terminada = True
+        self._avisar()
+
+    def capas_encontradas(self, ruta, n):
+        """
+        Anota que el archivo 'ruta' tiene 'n' capas por procesar; el archivo queda
+        terminado al terminar su última capa (o ya, si no tiene ninguna).
+        """
+        with self._lock:
+            self.capas_total += n
+            if ruta in self._pendientes:
+                self._pendientes[ruta][1] += n
+                if not self._pendientes[ruta][1]:
+                    self._terminar_archivo(ruta)
+        self._avisar()
+
+    def capa_terminada(self, ruta, entidades=0, omitida=False):
+        """Anota una capa terminada de 'ruta' (y sus entidades); acredita su parte del tamaño del archivo."""
+        with self._lock:
+            self.capas += 1
+            self.entidades += entidades or 0
+            pendiente = self._pendientes.get(ruta)
+            if pendiente and pendiente[1] > 0:
+                parte = pendiente[0] // pendiente[1]
+                pendiente[0] -= parte
+                pendiente[1] -= 1
+                self._acreditar(parte, omitida)
+                if not pendiente[1]:
+                    self._terminar_archivo(ruta)
+        self._avisar()
+
+    def archivo_terminado(self, ruta, omitido=False):
+        """Anota el archivo 'ruta' como terminado (convertido, fallido u omitido), si no lo estaba ya."""
+        with self._lock:
+            self._terminar_archivo(ruta, omitido)
+        self._avisar()
+
+    def omitir_pendientes(self, excepto=()):
+        """Da por omitidos todos los archivos encontrados que aún no han terminado, salvo los de 'excepto'."""
+        excepto = set(excepto)
+        with self._lock:
+            for ruta in [r for r in self._pendientes if r not in excepto]:
+                self._terminar_archivo(ruta, omitido=True)
+        self._avisar()
+
+    def _terminar_archivo(self, ruta, omitido=False):
+        pendiente = self._pendientes.pop(ruta, None)
+        if pendiente is not None:
+            self.archivos += 1
+            self._acreditar(pendiente[0], omitido)
+
+    def _acreditar(self, n, omitido=False):
+        self.bytes_hechos += n
+        if not omitido:
+            self.bytes_procesados += n
+
+    @property
+    def porcentaje(self):
+        """Porcentaje (0-100) ponderado por tamaño; nunca retrocede aunque el total crezca."""
+        if self.bytes_total:
+            actual = 100.0 * self.bytes_hechos / self.bytes_total
+        elif self.archivos_total:
+            actual = 100.0 * self.archivos / self.archivos_total
+        else:
+            actual = 0.0
+        self._ultimo_porcentaje = max(self._ultimo_porcentaje, min(actual, 100.0))
+        return self._ultimo_porcentaje
+
+    @property
+    def caudal(self):
+        """Bytes procesados por segundo (sin contar los archivos omitidos), o None."""
+        if not self.bytes_procesados:
+            return None
+        return self.bytes_procesados / max(time.perf_counter() - self._inicio, 1e-6)
+
+    @property
+    def eta(self):
+        """Segundos estimados hasta terminar, o None mientras la búsqueda sigue o no hay caudal."""
+        caudal = self.caudal
+        if not self.busqueda_terminada or not caudal:
+            return None
+        return max(self.bytes_total - self.bytes_hechos, 0) / caudal
+
+    def describir(self):
+        """Texto de una línea para el diálogo."""
+        partes = [f"{self.archivos}/{self.archivos_total}{'' if self.busqueda_terminada else '+'} archivos"]
+        if self.capas_total:
+            partes.append(f"{self.capas}/{self.capas_total} capas")
+        if self.entidades:
+            partes.append(f"{self.entidades:,} entidades")
+        partes.append(f"{_tamano_legible(self.bytes_hechos)} de {_tamano_legible(self.bytes_total)}")
+        if self.caudal:
+            partes.append(f"{_tamano_legible(self.caudal)}/s")
+        eta = self.eta
+        partes.append(f"ETA {_duracion(eta)}" if eta is not None else "ETA calculando…")
+        return f"{self.porcentaje:.1f} % · " + " · ".join(partes)
+
+    def _avisar(self, forzar=False):
+        if not self.callback:
+            return
+        ahora = time.perf_counter()
+        if not forzar and ahora - self._ultimo_aviso < self.intervalo:
+            return
+        self._ultimo_aviso = ahora
+        self.callback(self)
+
+    def terminar(self):
+        """Llama a 'callback' con el estado final."""
+        self._avisar(forzar=True)
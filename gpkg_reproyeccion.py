@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Reproyección de geometrías por lotes para las herramientas de GPKG Tools."""
+import struct
+import threading
+from collections import OrderedDict
+from osgeo import osr
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsGeometry
+
+try:
+    import numpy as np
+except ImportError:  # QGIS sin NumPy: se transforma geometría a geometría
+    np = None
+
+
+def _srs_desde_crs(crs):
+    """Convierte un QgsCoordinateReferenceSystem en osr.SpatialReference (orden de ejes x/y)."""
+    srs = osr.SpatialReference()
+    if srs.ImportFromWkt(crs.toWkt(QgsCoordinateReferenceSystem.WKT_PREFERRED)) != 0:
+        raise ValueError(f"CRS no reconocido por OSR: {crs.authid()}")
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+
+def _tramos_wkb(wkb, pos, tramos):
+    """
+    Recorre una geometría WKB (ISO) desde 'pos' y añade a 'tramos' un
+    (posición, nº de vértices, dimensiones, orden de bytes) por cada secuencia
+    de coordenadas. Retorna la posición siguiente a la geometría.
+    Lanza ValueError para tipos no soportados (curvas, superficies...).
+    """
+    orden = "<" if wkb[pos] == 1 else ">"
+    tipo = struct.unpack_from(orden + "I", wkb, pos + 1)[0]
+    pos += 5
+    base, variante = tipo % 1000, tipo // 1000
+    if tipo > 3999 or variante not in (0, 1, 2, 3):
+        raise ValueError(f"Tipo WKB no soportado: {tipo}")
+    dims = 4 if variante == 3 else (3 if variante else 2)
+
+    if base == 1:
+        tramos.append((pos, 1, dims, orden))
+        return pos + 8 * dims
+    if base == 2:
+        n = struct.unpack_from(orden + "I", wkb, pos)[0]
+        tramos.append((pos + 4, n, dims, orden))
+        return pos + 4 + 8 * dims * n
+    if base == 3:
+        anillos = struct.unpack_from(orden + "I", wkb, pos)[0]
+        pos += 4
+        for _ in range(anillos):
+            n = struct.unpack_from(orden + "I", wkb, pos)[0]
+            tramos.append((pos + 4, n, dims, orden))
+            pos += 4 + 8 * dims * n
+        return pos
+    if base in (4, 5, 6, 7):
+        partes = struct.unpack_from(orden + "I", wkb, pos)[0]
+        pos += 4
+        for _ in range(partes):
+            pos = _tramos_wkb(wkb, pos, tramos)
+        return pos
+    raise ValueError(f"Tipo WKB no soportado: {tipo}")
+
+
+class TransformadorLotes:
+    """
+    Reproyecta listas de geometrías con una única llamada a PROJ por lote:
+    extrae los vértices de todas las geometrías a un array de NumPy, los
+    transforma con osr.CoordinateTransformation.TransformPoints y reconstruye
+    las geometrías. Las geometrías no soportadas (o todo el lote, si NumPy no
+    está disponible) se transforman una a una con 'xform'.
+    OSR elige la misma operación de PROJ que QGIS por defecto; si el contexto de
+    transformación del proyecto fija otra operación para el par de CRS (p. ej. una
+    transformación de datum), todo se transforma con 'xform' para no mezclar operaciones.
+    """
+
+    def __init__(self, crs_origen, crs_destino, xform):
+        self.xform = xform
+        self.ct = None
+        if np is not None and not xform.coordinateOperation():
+            try:
+                self.ct = osr.CoordinateTransformation(_srs_desde_crs(crs_origen), _srs_desde_crs(crs_destino))
+            except Exception:
+                self.ct = None
+
+    @property
+    def vectorizado(self):
+        return self.ct is not None
+
+    def _transformar_puntos(self, xy):
+        try:
+            resultado = self.ct.TransformPoints(xy)
+        except TypeError:  # GDAL sin soporte de arrays de NumPy en TransformPoints
+            resultado = self.ct.TransformPoints(xy.tolist())
+        resultado = np.asarray(resultado, dtype="f8")[:, :2]
+        fallidos = ~np.isfinite(resultado).all(axis=1) & np.isfinite(xy).all(axis=1)
+        if fallidos.any():
+            raise Exception(f"No se pudieron transformar {int(fallidos.sum())} vértices")
+        return resultado
+
+    def transformar(self, geometrias):
+        """Retorna las geometrías de la lista reproyectadas (None y vacías se devuelven tal cual)."""
+        if not self.vectorizado:
+            for geom in geometrias:
+                if geom and not geom.isNull():
+                    geom.transform(self.xform)
+            return geometrias
+
+        resultado = list(geometrias)
+        buffers = {}
+        vistas = []
+        for i, geom in enumerate(geometrias):
+            if not geom or geom.isNull():
+                continue
+            wkb = bytearray(geom.asWkb())
+            tramos = []
+            try:
+                _tramos_wkb(wkb, 0, tramos)
+            except (ValueError, struct.error):
+                geom.transform(self.xform)
+                continue
+            buffers[i] = wkb
+            for pos, n, dims, orden in tramos:
+                if n:
+                    vistas.append(np.frombuffer(wkb, dtype=orden + "f8", count=n * dims, offset=pos).reshape(n, dims))
+
+        if vistas:
+            xy = np.concatenate([v[:, :2] for v in vistas])
+            transformados = self._transformar_puntos(xy)
+            inicio = 0
+            for v in vistas:
+                v[:, :2] = transformados[inicio:inicio + len(v)]
+                inicio += len(v)
+
+        for i, wkb in buffers.items():
+            geom = QgsGeometry()
+            geom.fromWkb(bytes(wkb))
+            resultado[i] = geom
+        return resultado
+
+
+class CacheTransformaciones:
+    """
+    Caché LRU (compartida por todas las herramientas del proceso) de CRS por EPSG y
+    QgsCoordinateTransform, con contadores de aciertos y fallos. Solo guarda objetos
+    que se entregan como copia y pueden usarse desde cualquier hilo; el TransformadorLotes
+    (OSR, no seguro entre hilos) lo conserva cada copia en su propio threading.local.
+    Las claves usan el authid del CRS (o su WKT si no tiene) de origen y destino.
+    """
+
+    def __init__(self, capacidad=128):
+        self.capacidad = capacidad
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave_crs(crs):
+        return crs.authid() or crs.toWkt(QgsCoordinateReferenceSystem.WKT_PREFERRED)
+
+    def _obtener(self, clave, crear):
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+            self.fallos += 1
+        valor = crear()
+        with self._lock:
+            self._entradas[clave] = valor
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+        return valor
+
+    def crs_epsg(self, epsg):
+        """QgsCoordinateReferenceSystem para un código EPSG."""
+        return QgsCoordinateReferenceSystem(
+            self._obtener(("crs", int(epsg)), lambda: QgsCoordinateReferenceSystem.fromEpsgId(int(epsg))))
+
+    def transformacion(self, crs_origen, crs_destino, contexto):
+        """QgsCoordinateTransform de 'crs_origen' a 'crs_destino' (copia, segura entre hilos)."""
+        clave = ("qgs", self._clave_crs(crs_origen), self._clave_crs(crs_destino))
+        return QgsCoordinateTransform(
+            self._obtener(clave, lambda: QgsCoordinateTransform(crs_origen, crs_destino, contexto)))
+
+    def transformador(self, crs_origen, crs_destino, contexto):
+        """
+        Nuevo TransformadorLotes de 'crs_origen' a 'crs_destino' a partir de la
+        transformación en caché. No se guarda en la caché (OSR no es seguro entre
+        hilos): quien lo pide lo conserva para un solo hilo durante la copia.
+        """
+        return TransformadorLotes(crs_origen, crs_destino, self.transformacion(crs_origen, crs_destino, contexto))
+
+    def contadores(self):
+        """(aciertos, fallos) acumulados; sirve de referencia para describir()."""
+        return self.aciertos, self.fallos
+
+    def describir(self, desde=(0, 0)):
+        """Texto con los aciertos y fallos desde los contadores 'desde', para el resumen."""
+        aciertos, fallos = self.aciertos - desde[0], self.fallos - desde[1]
+        return f"Caché de CRS/transformaciones: {aciertos} aciertos, {fallos} fallos"
+
+
+CACHE_TRANSFORMACIONES = CacheTransformaciones()
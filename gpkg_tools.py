@@ -9,9 +9,13 @@
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
-from . import resources
+from qgis.core import QgsMessageLog, Qgis
 
 import os.path
+import time
+
+# Inicio de la carga del complemento, para medir lo que tarda en arrancar
+_INICIO_CARGA = time.perf_counter()
 
 class GpkgTools:
     """QGIS Plugin Implementation."""
@@ -62,11 +66,23 @@ class GpkgTools:
         self.actions.append(action)
         return action
 
+    def icono(self, nombre):
+        """
+        Ruta del icono 'nombre': el PNG del directorio del plugin o, si no está,
+        el recurso compilado (resources.py solo se importa en ese caso).
+        """
+        ruta = os.path.join(self.plugin_dir, nombre)
+        if os.path.exists(ruta):
+            return ruta
+        from . import resources  # noqa: F401  (registra los recursos :/plugins/gpkg_tools)
+        return f":/plugins/gpkg_tools/{nombre}"
+
     def initGui(self):
         """Inicializa GUI del plugin con los 3 botones."""
+        inicio = time.perf_counter()
         # Botón SHP → GPKG
         self.add_action(
-            ":/plugins/gpkg_tools/icon_shp2gpkg.png",
+            self.icono("icon_shp2gpkg.png"),
             text=self.tr("SHP → GPKG"),
             callback=self.run_shp2gpkg,
             parent=self.iface.mainWindow(),
@@ -74,7 +90,7 @@ class GpkgTools:
 
         # Botón GPKG → SHP
         self.add_action(
-            ":/plugins/gpkg_tools/icon_gpkg2shp.png",
+            self.icono("icon_gpkg2shp.png"),
             text=self.tr("GPKG → SHP"),
             callback=self.run_gpkg2shp,
             parent=self.iface.mainWindow(),
@@ -82,12 +98,17 @@ class GpkgTools:
 
         # Botón Fusionar a GPKG
         self.add_action(
-            ":/plugins/gpkg_tools/icon_gpkg2fusion.png",
+            self.icono("icon_gpkg2fusion.png"),
             text=self.tr("Fusionar a GPKG"),
             callback=self.run_gpkg2fusion,
             parent=self.iface.mainWindow(),
         )
 
+        ahora = time.perf_counter()
+        QgsMessageLog.logMessage(
+            f"⏱️ Complemento cargado en {(ahora - _INICIO_CARGA) * 1000:.1f} ms "
+            f"(interfaz: {(ahora - inicio) * 1000:.1f} ms)", "GPKG Tools", Qgis.Info)
+
     def unload(self):
         """Quitar menú y toolbar al desinstalar plugin."""
         for action in self.actions:
@@ -95,7 +116,7 @@ class GpkgTools:
             self.iface.removeToolBarIcon(action)
         del self.toolbar
 
-    # ---- Callbacks para los diálogos ----
+    # ---- Callbacks para los diálogos (los módulos se importan al primer uso) ----
     def run_shp2gpkg(self):
         from .shp2gpkg_dialog import Shp2GpkgDialog
         dlg = Shp2GpkgDialog()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Etapas de tubería (productor/consumidor) para las herramientas de GPKG Tools:
+cada etapa corre en sus propios hilos y se comunica con la siguiente a través
+de colas acotadas, de modo que la búsqueda, la inspección y la escritura avanzan
+a la vez y la memoria queda limitada por el tamaño de las colas.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_FIN = object()
+
+
+def en_segundo_plano(iterable, maximo=256):
+    """
+    Consume 'iterable' en un hilo aparte y genera sus elementos a través de una
+    cola de como mucho 'maximo' elementos (el productor espera si la cola está llena).
+    Las excepciones del productor se relanzan en el consumidor. Si el consumidor
+    deja de leer (p. ej. al cancelar), el productor se detiene.
+    """
+    cola = queue.Queue(maxsize=max(1, maximo))
+    parar = threading.Event()
+
+    def poner(elemento):
+        while not parar.is_set():
+            try:
+                cola.put(elemento, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producir():
+        try:
+            for elemento in iterable:
+                if not poner((elemento, None)):
+                    break
+        except Exception as e:
+            poner((_FIN, e))
+            return
+        finally:
+            cerrar = getattr(iterable, "close", None)
+            if parar.is_set() and cerrar:
+                cerrar()
+        poner((_FIN, None))
+
+    hilo = threading.Thread(target=producir, name="gpkg_tools_productor", daemon=True)
+    hilo.start()
+    try:
+        while True:
+            elemento, error = cola.get()
+            if elemento is _FIN:
+                if error:
+                    raise error
+                return
+            yield elemento
+    finally:
+        parar.set()
+
+
+def etapa(funcion, entradas, hilos=1, maximo=None):
+    """
+    Aplica 'funcion' a cada elemento de 'entradas' en 'hilos' hilos y genera
+    (entrada, resultado, error) en el orden de 'entradas'. Como mucho 'maximo'
+    elementos (por defecto, dos por hilo) están en curso o esperando al consumidor.
+    """
+    maximo = max(1, maximo or 2 * hilos)
+    en_curso = deque()
+    pool = ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="gpkg_tools_etapa")
+    try:
+        for entrada in entradas:
+            en_curso.append((entrada, pool.submit(funcion, entrada)))
+            if len(en_curso) >= maximo:
+                yield _resultado(*en_curso.popleft())
+        while en_curso:
+            yield _resultado(*en_curso.popleft())
+    finally:
+        for _, futuro in en_curso:
+            futuro.cancel()
+        pool.shutdown(wait=True)
+
+
+def _resultado(entrada, futuro):
+    try:
+        return entrada, futuro.result(), None
+    except Exception as e:
+        return entrada, None, e
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Carga de los formularios .ui de los diálogos de GPKG Tools. Cada .ui se
+compila una sola vez a un módulo Python en caché (__pycache__/ui), que se
+reutiliza mientras el .ui no cambie, en lugar de analizar el XML con
+uic.loadUiType en cada sesión de QGIS.
+"""
+import importlib.util
+import os
+from qgis.PyQt import uic
+from qgis.PyQt.QtWidgets import QDialog
+
+DIR_PLUGIN = os.path.dirname(__file__)
+DIR_CACHE = os.path.join(DIR_PLUGIN, "__pycache__", "ui")
+
+
+def _compilar(ruta_ui, ruta_py):
+    """Compila 'ruta_ui' a 'ruta_py' (escritura atómica: otra sesión nunca ve un módulo a medias)."""
+    os.makedirs(os.path.dirname(ruta_py), exist_ok=True)
+    temporal = f"{ruta_py}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as salida:
+        uic.compileUi(ruta_ui, salida)
+    os.replace(temporal, ruta_py)
+
+
+def clase_formulario(nombre):
+    """
+    Devuelve (clase del formulario, clase base) del formulario 'nombre'.ui, como
+    uic.loadUiType, usando el módulo compilado en caché (se recompila si el .ui es
+    más reciente). Si la caché no se puede escribir o cargar, recurre a loadUiType.
+    """
+    ruta_ui = os.path.join(DIR_PLUGIN, f"{nombre}.ui")
+    ruta_py = os.path.join(DIR_CACHE, f"{nombre}_ui.py")
+    try:
+        if not os.path.exists(ruta_py) or os.path.getmtime(ruta_py) < os.path.getmtime(ruta_ui):
+            _compilar(ruta_ui, ruta_py)
+        spec = importlib.util.spec_from_file_location(f"{__package__}._ui_{nombre}", ruta_py)
+        modulo = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(modulo)
+        clase = next(getattr(modulo, n) for n in dir(modulo) if n.startswith("Ui_"))
+        return clase, QDialog
+    except Exception:
+        return uic.loadUiType(ruta_ui)
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""Utilidades compartidas por las herramientas de GPKG Tools."""
+import ctypes
+import gc
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from osgeo import gdal
+from .gpkg_perfiles import PERFILES_SQLITE, PERFIL_POR_DEFECTO
+
+try:
+    import psutil
+except ImportError:  # QGIS sin psutil: la RSS se lee de /proc o de la API de Windows
+    psutil = None
+
+
+def describir_perfil(nombre, lectura=False):
+    """Texto del perfil para el log y el resumen."""
+    nombre = nombre or PERFIL_POR_DEFECTO
+    perfil = PERFILES_SQLITE[nombre]
+    pragmas = perfil["lectura" if lectura else "escritura"]
+    return f"{nombre} ({', '.join(pragmas) or 'sin cambios'})"
+
+
+@contextmanager
+def aplicar_perfil_sqlite(nombre=None, lectura=False, cache_max_kb=None):
+    """
+    Aplica el perfil de PRAGMAs 'nombre' a los GeoPackages abiertos por GDAL
+    dentro del bloque (OGR_SQLITE_PRAGMA, solo en el hilo actual).
+    'cache_max_kb' limita la caché de páginas de SQLite (y desactiva mmap) de cada conexión.
+    """
+    if not nombre:
+        nombre = PERFIL_POR_DEFECTO
+    if nombre not in PERFILES_SQLITE:
+        raise ValueError(f"Perfil SQLite desconocido: {nombre}")
+
+    pragmas = PERFILES_SQLITE[nombre]["lectura" if lectura else "escritura"]
+    if cache_max_kb:
+        pragmas = [p for p in pragmas if not p.startswith(("cache_size=", "mmap_size="))]
+        pragmas += [f"cache_size=-{int(cache_max_kb)}", "mmap_size=0"]
+    anterior = gdal.GetThreadLocalConfigOption("OGR_SQLITE_PRAGMA", None)
+    if pragmas:
+        gdal.SetThreadLocalConfigOption("OGR_SQLITE_PRAGMA", ",".join(pragmas))
+    try:
+        yield PERFILES_SQLITE[nombre]
+    finally:
+        gdal.SetThreadLocalConfigOption("OGR_SQLITE_PRAGMA", anterior)
+
+
+def hash_archivo(ruta, bloque=1024 * 1024):
+    """Huella SHA-1 del contenido de un archivo, leído por bloques."""
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for datos in iter(lambda: f.read(bloque), b""):
+            h.update(datos)
+    return h.hexdigest()
+
+
+def _rss_windows():
+    class ContadoresMemoria(ctypes.Structure):
+        _fields_ = [("cb", ctypes.c_ulong), ("PageFaultCount", ctypes.c_ulong),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    contadores = ContadoresMemoria()
+    contadores.cb = ctypes.sizeof(contadores)
+    proceso = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(proceso, ctypes.byref(contadores), contadores.cb):
+        return None
+    return contadores.WorkingSetSize
+
+
+def memoria_rss():
+    """Memoria residente (RSS) actual del proceso en bytes, o None si no se puede medir."""
+    if psutil:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if os.name == "nt":
+        try:
+            return _rss_windows()
+        except (OSError, AttributeError):
+            return None
+    return None
+
+
+class PresupuestoMemoria:
+    """
+    Presupuesto de memoria de una ejecución (usar con 'with'): limita la caché de
+    bloques de GDAL (GDAL_CACHEMAX) y la caché de páginas de SQLite a una fracción
+    del límite, mide la RSS del proceso y guarda su pico. 'presion()' indica que
+    la RSS se acerca al límite y conviene vaciar cachés y confirmar escrituras.
+    """
+    FRACCION_GDAL = 0.25
+    FRACCION_SQLITE = 0.05
+    UMBRAL = 0.9
+
+    def __init__(self, limite_mb):
+        self.limite = int(limite_mb) * 1024 * 1024
+        self.pico = 0
+        self.vaciados = 0
+        self._cache_gdal = None
+
+    @property
+    def cache_sqlite_kb(self):
+        """Caché de páginas por conexión SQLite, en KiB."""
+        return max(2048, int(self.limite * self.FRACCION_SQLITE) // 1024)
+
+    def __enter__(self):
+        self._cache_gdal = gdal.GetCacheMax()
+        gdal.SetCacheMax(min(self._cache_gdal, int(self.limite * self.FRACCION_GDAL)))
+        self.medir()
+        return self
+
+    def __exit__(self, *exc):
+        gdal.SetCacheMax(self._cache_gdal)
+        return False
+
+    def medir(self):
+        """RSS actual en bytes (None si no se puede medir); actualiza el pico."""
+        rss = memoria_rss()
+        if rss:
+            self.pico = max(self.pico, rss)
+        return rss
+
+    def presion(self):
+        rss = self.medir()
+        return rss is not None and rss >= self.limite * self.UMBRAL
+
+    def vaciar(self, *datasets):
+        """Vacía las cachés de GDAL y SQLite de 'datasets' y recoge la basura de Python."""
+        for ds in datasets:
+            ds.FlushCache()
+            consultar_sql(ds, "PRAGMA shrink_memory")
+        gc.collect()
+        self.vaciados += 1
+        return self.medir()
+
+    def describir(self):
+        """Texto del presupuesto y del pico de RSS para el log y el resumen."""
+        texto = f"límite {self.limite // (1024 * 1024)} MB"
+        if not self.pico:
+            return texto + " (RSS no disponible en este sistema)"
+        return texto + f", pico de RSS {self.pico / (1024 * 1024):.0f} MB, {self.vaciados} vaciados de caché"
+
+
+class LineasEnDisco:
+    """
+    Lista de líneas de texto (p. ej. el detalle del resumen) que solo guarda en
+    memoria las añadidas desde el último 'volcar()', que las pasa a un archivo
+    temporal. Admite append, extend, len, cortes de las líneas aún en memoria e
+    iteración sobre todas.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self._archivo = None
+        self._volcadas = 0
+        self._lineas = []
+
+    def append(self, linea):
+        self._lineas.append(linea)
+
+    def extend(self, lineas):
+        self._lineas.extend(lineas)
+
+    def __len__(self):
+        return self._volcadas + len(self._lineas)
+
+    def __getitem__(self, corte):
+        inicio, fin, paso = corte.indices(len(self))
+        if inicio < self._volcadas:
+            raise IndexError("Las líneas pedidas ya se volcaron a disco")
+        return self._lineas[inicio - self._volcadas:fin - self._volcadas:paso]
+
+    def volcar(self):
+        if not self._lineas:
+            return
+        if self._archivo is None:
+            self._archivo = open(self.ruta, "w", encoding="utf-8")
+        self._archivo.writelines(linea.replace("\n", " ") + "\n" for linea in self._lineas)
+        self._archivo.flush()
+        self._volcadas += len(self._lineas)
+        self._lineas = []
+
+    def __iter__(self):
+        if self._archivo is not None:
+            self._archivo.flush()
+            with open(self.ruta, encoding="utf-8") as f:
+                for linea in f:
+                    yield linea.rstrip("\n")
+        yield from self._lineas
+
+    def cerrar(self):
+        """Cierra y elimina el archivo temporal."""
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+        if self.ruta.exists():
+            self.ruta.unlink()
+
+
+def consultar_sql(ds, sql):
+    """Filas de una consulta SQL sobre 'ds' (None si falla, sin mensajes de error de GDAL)."""
+    gdal.PushErrorHandler("CPLQuietErrorHandler")
+    try:
+        res = ds.ExecuteSQL(sql)
+    except RuntimeError:
+        res = None
+    finally:
+        gdal.PopErrorHandler()
+    if res is None:
+        return None
+    try:
+        return [[feat.GetField(i) for i in range(feat.GetFieldCount())] for feat in res]
+    finally:
+        ds.ReleaseResultSet(res)
+
+
+def ejecutar_sql(ds, sql):
+    """Ejecuta una sentencia SQL sin resultados sobre 'ds'; lanza RuntimeError si GDAL informa de un error."""
+    gdal.ErrorReset()
+    gdal.PushErrorHandler("CPLQuietErrorHandler")
+    try:
+        res = ds.ExecuteSQL(sql)
+        if res is not None:
+            ds.ReleaseResultSet(res)
+    finally:
+        gdal.PopErrorHandler()
+    if gdal.GetLastErrorType() >= gdal.CE_Failure:
+        raise RuntimeError(gdal.GetLastErrorMsg() or f"Error ejecutando: {sql}")
+
+
+def recuentos_gpkg(ds):
+    """
+    Recuento de entidades por tabla leído de gpkg_ogr_contents (una sola consulta
+    por archivo, sin recorrer las tablas). Retorna {tabla en minúsculas: entidades},
+    sin las tablas cuyo recuento no se conoce o puede estar desfasado: las que no
+    tienen los disparadores de recuento de OGR (p. ej. escritas sin GDAL).
+    """
+    filas = consultar_sql(ds, "SELECT c.table_name, o.feature_count FROM gpkg_contents c "
+                              "JOIN gpkg_ogr_contents o ON lower(o.table_name) = lower(c.table_name) "
+                              "WHERE o.feature_count IS NOT NULL")
+    disparadores = consultar_sql(ds, "SELECT lower(name) FROM sqlite_master WHERE type = 'trigger' "
+                                     "AND name LIKE 'trigger_insert_feature_count_%'")
+    con_disparador = {fila[0] for fila in disparadores or []}
+    return {str(tabla).lower(): int(entidades) for tabla, entidades in filas or []
+            if f"trigger_insert_feature_count_{str(tabla).lower()}" in con_disparador}
+
+
+def capa_vacia(ds, in_layer):
+    """True si la capa no tiene entidades, comprobado con SELECT 1 ... LIMIT 1 (sin recuento completo)."""
+    tabla = in_layer.GetName().replace('"', '""')
+    filas = consultar_sql(ds, f'SELECT 1 FROM "{tabla}" LIMIT 1')
+    if filas is not None:
+        return not filas
+    in_layer.ResetReading()
+    vacia = in_layer.GetNextFeature() is None
+    in_layer.ResetReading()
+    return vacia
+
+
+def capas_gpkg(ds):
+    """
+    Retorna [(capa, nombre, entidades), ...] de un GPKG abierto con OGR sin forzar
+    ningún recuento completo: 'entidades' sale de gpkg_ogr_contents y, si no se
+    conoce, es 0 para las capas vacías y None para las que tienen entidades.
+    Un recuento de 0 se comprueba siempre (capa_vacia): un 0 desfasado haría
+    ignorar una capa con entidades.
+    """
+    recuentos = recuentos_gpkg(ds)
+    capas = []
+    for i in range(ds.GetLayerCount()):
+        in_layer = ds.GetLayerByIndex(i)
+        nombre = in_layer.GetName()
+        entidades = recuentos.get(nombre.lower())
+        if not entidades:
+            entidades = 0 if capa_vacia(ds, in_layer) else None
+        capas.append((in_layer, nombre, entidades))
+    return capas
+
+
+class ManifiestoConversion:
+    """
+    Manifiesto JSON, junto a la salida, de las conversiones ya hechas: por cada
+    archivo de entrada guarda su tamaño, fecha y huella, el EPSG destino y las
+    salidas generadas, para omitir en la siguiente ejecución las entradas que
+    no han cambiado. La huella solo se calcula si cambian el tamaño o la fecha.
+    """
+    NOMBRE = "gpkg_tools_manifiesto.json"
+    VERSION = 1
+
+    def __init__(self, carpeta_entrada, carpeta_salida):
+        self.carpeta_entrada = Path(carpeta_entrada)
+        self.carpeta_salida = Path(carpeta_salida)
+        self.ruta = self.carpeta_salida / self.NOMBRE
+        self.entradas = {}
+        self.omitidos = 0  # lo incrementa quien omite la entrada
+        self._vistas = set()
+        self._firmas = {}
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            if datos.get("version") == self.VERSION:
+                self.entradas = datos.get("entradas", {})
+        except (OSError, ValueError, AttributeError):
+            self.entradas = {}
+
+    def _clave(self, ruta):
+        return Path(ruta).relative_to(self.carpeta_entrada).as_posix()
+
+    @staticmethod
+    def _firma(componentes):
+        """(tamaño total, fecha más reciente en ns) de los archivos 'componentes'."""
+        estados = [os.stat(c) for c in componentes]
+        return sum(e.st_size for e in estados), max(e.st_mtime_ns for e in estados)
+
+    @staticmethod
+    def _huella(componentes):
+        if len(componentes) == 1:
+            return hash_archivo(componentes[0])
+        return hashlib.sha1("".join(hash_archivo(c) for c in componentes).encode()).hexdigest()
+
+    def vigente(self, ruta, epsg, componentes=None):
+        """
+        Retorna la entrada del manifiesto de 'ruta' si sigue al día (mismo
+        contenido, mismo EPSG destino y salidas existentes); si no, None.
+        'componentes' son todos los archivos que forman la entrada (p. ej. .shp/.dbf/.shx).
+        Puede llamarse desde varios hilos, siempre que cada ruta la consulte uno solo.
+        """
+        clave = self._clave(ruta)
+        self._vistas.add(clave)
+        componentes = componentes or [ruta]
+        tamano, mtime = self._firma(componentes)
+        self._firmas[clave] = {"tamano": tamano, "mtime": mtime, "hash": None}
+
+        entrada = self.entradas.get(clave)
+        if not entrada or entrada.get("epsg") != epsg:
+            return None
+        if not all((self.carpeta_salida / s).exists() for s in entrada.get("salidas", [])):
+            return None
+        if entrada.get("tamano") != tamano:
+            return None
+        if entrada.get("mtime") != mtime:
+            huella = self._huella(componentes)
+            self._firmas[clave]["hash"] = huella
+            if huella != entrada.get("hash"):
+                return None
+            entrada["mtime"] = mtime
+        return entrada
+
+    def registrar(self, ruta, epsg, salidas, componentes=None, **extra):
+        """Anota que 'ruta' se convirtió correctamente en 'salidas' (rutas dentro de la carpeta de salida)."""
+        clave = self._clave(ruta)
+        componentes = componentes or [ruta]
+        firma = self._firmas.get(clave) or dict(zip(("tamano", "mtime"), self._firma(componentes)), hash=None)
+        self.entradas[clave] = dict(
+            firma, hash=firma["hash"] or self._huella(componentes), epsg=epsg,
+            salidas=[Path(s).as_posix() for s in salidas], **extra)
+
+    def guardar(self, completo=True):
+        """
+        Escribe el manifiesto. Con 'completo' (ejecución no cancelada) se olvidan
+        las entradas cuyo archivo ya no existe en la carpeta de entrada.
+        """
+        if completo:
+            self.entradas = {clave: e for clave, e in self.entradas.items() if clave in self._vistas}
+        temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entradas": self.entradas}, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+
+class DiarioReanudacion:
+    """
+    Diario de puntos de control (un pequeño SQLite junto a la salida) con los
+    elementos ya completados de una ejecución, de modo que tras una cancelación o un
+    cierre inesperado de QGIS la siguiente ejecución con 'reanudar' continúa desde el
+    último elemento confirmado. Las anotaciones se acumulan y se confirman juntas
+    (en 'confirmar', cada 'por_lote' elementos o cada 'intervalo' segundos), para no
+    pagar varios fsync por elemento en carpetas de red; un cierre inesperado solo
+    obliga a rehacer los elementos aún sin confirmar.
+    Si los 'parametros' de la ejecución no coinciden con los del diario, se descarta.
+    Si el diario no se puede abrir o escribir (p. ej. en una carpeta de red de solo
+    lectura), queda desactivado: 'error' guarda el motivo y la ejecución sigue sin él.
+    """
+
+    def __init__(self, ruta, parametros, reanudar=False, por_lote=100, intervalo=5.0):
+        self.ruta = Path(ruta)
+        self.parametros = json.dumps(parametros, sort_keys=True, default=str)
+        self.reanudado = False
+        self.error = None
+        self.con = None
+        self.por_lote = por_lote
+        self.intervalo = intervalo
+        self._pendientes = {}
+        self._ultima_confirmacion = time.monotonic()
+        try:
+            if not reanudar:
+                self._borrar()
+            # Diario de rollback por defecto (no WAL): WAL no funciona en sistemas de archivos de red
+            self.con = sqlite3.connect(str(self.ruta))
+            self.con.execute("CREATE TABLE IF NOT EXISTS parametros (valor TEXT)")
+            self.con.execute("CREATE TABLE IF NOT EXISTS completados (clave TEXT PRIMARY KEY, datos TEXT)")
+            fila = self.con.execute("SELECT valor FROM parametros").fetchone()
+            if fila and fila[0] == self.parametros:
+                self.reanudado = self.con.execute("SELECT COUNT(*) FROM completados").fetchone()[0] > 0
+            else:
+                self.con.execute("DELETE FROM parametros")
+                self.con.execute("DELETE FROM completados")
+                self.con.execute("INSERT INTO parametros (valor) VALUES (?)", (self.parametros,))
+            self.con.commit()
+        except (sqlite3.Error, OSError) as e:
+            self._desactivar(e)
+
+    def _desactivar(self, error):
+        self.error = error
+        self.reanudado = False
+        self._pendientes.clear()
+        if self.con is not None:
+            try:
+                self.con.close()
+            except sqlite3.Error:
+                pass
+        self.con = None
+
+    def _escribir(self, sql, parametros=()):
+        if self.con is None:
+            return
+        try:
+            self.con.execute(sql, parametros)
+            self.con.commit()
+        except sqlite3.Error as e:
+            self._desactivar(e)
+
+    def _borrar(self):
+        for sufijo in ("", "-journal", "-wal", "-shm"):
+            ruta = self.ruta.with_name(self.ruta.name + sufijo)
+            if ruta.exists():
+                ruta.unlink()
+
+    def completados(self):
+        """{clave: datos} de los elementos completados en la ejecución anterior."""
+        if self.con is None:
+            return {}
+        try:
+            return {clave: json.loads(datos)
+                    for clave, datos in self.con.execute("SELECT clave, datos FROM completados")}
+        except (sqlite3.Error, ValueError) as e:
+            self._desactivar(e)
+            return {}
+
+    def completado(self, clave, carpeta_salida=None):
+        """
+        Datos del elemento 'clave' si ya se completó en la ejecución anterior (y, si se
+        indica 'carpeta_salida', siguen existiendo sus 'salidas'); si no, None.
+        """
+        if self.con is None:
+            return None
+        try:
+            fila = self.con.execute("SELECT datos FROM completados WHERE clave = ?", (clave,)).fetchone()
+            datos = json.loads(fila[0]) if fila else None
+        except (sqlite3.Error, ValueError) as e:
+            self._desactivar(e)
+            return None
+        if not datos:
+            return None
+        if carpeta_salida and not all((Path(carpeta_salida) / s).exists() for s in datos.get("salidas", [])):
+            return None
+        return datos
+
+    def registrar(self, clave, **datos):
+        """Anota el elemento 'clave' como completado (se confirma con el lote siguiente)."""
+        if self.con is None:
+            return
+        self._pendientes[clave] = json.dumps(datos, ensure_ascii=False, default=str)
+        if (len(self._pendientes) >= self.por_lote
+                or time.monotonic() - self._ultima_confirmacion >= self.intervalo):
+            self.confirmar()
+
+    def confirmar(self):
+        """Confirma en una sola transacción las anotaciones acumuladas."""
+        self._ultima_confirmacion = time.monotonic()
+        if self.con is None or not self._pendientes:
+            return
+        try:
+            self.con.executemany("INSERT OR REPLACE INTO completados (clave, datos) VALUES (?, ?)",
+                                 list(self._pendientes.items()))
+            self.con.commit()
+        except sqlite3.Error as e:
+            self._desactivar(e)
+        self._pendientes.clear()
+
+    def vaciar(self):
+        """Olvida todos los elementos completados (p. ej. si la salida se ha regenerado)."""
+        self._pendientes.clear()
+        self._escribir("DELETE FROM completados")
+        self.reanudado = False
+
+    def olvidar(self, clave):
+        self._pendientes.pop(clave, None)
+        self._escribir("DELETE FROM completados WHERE clave = ?", (clave,))
+
+    def cerrar(self, terminado=False):
+        """Cierra el diario (confirmando lo pendiente); si la ejecución 'terminado' sin cancelarse, lo elimina."""
+        if self.con is None:
+            return
+        if not terminado:
+            self.confirmar()
+            if self.con is None:
+                return
+        self.con.close()
+        self.con = None
+        if terminado:
+            try:
+                self._borrar()
+            except OSError:
+                pass
@@ -1,15 +1,16 @@
 # -*- coding: utf-8 -*-
-from qgis.PyQt import uic
+import os
 from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QMessageBox
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsApplication
 from pathlib import Path
-import os
 
-from .shp2gpkg_tool import convertir_shapefiles
+from .gpkg_perfiles import PERFILES_SQLITE, PERFIL_POR_DEFECTO
+from .gpkg_escaneo import patrones_desde_texto
+from .gpkg_log import CanalLog
+from .gpkg_ui import clase_formulario
 
-# Cargar UI
-FORM_CLASS, _ = uic.loadUiType(os.path.join(
-    os.path.dirname(__file__), 'shp2gpkg_dialog.ui'))
+# Cargar el UI (compilado en caché)
+FORM_CLASS, _ = clase_formulario('shp2gpkg_dialog')
 
 
 class Shp2GpkgDialog(QDialog, FORM_CLASS):
@@ -25,9 +26,18 @@ class Shp2GpkgDialog(QDialog, FORM_CLASS):
 
         self.task = None
         self.task_active = False  # bandera de tarea activa
+        # Las tareas escriben el log desde su hilo; el canal lo vuelca al widget en el hilo GUI
+        self.canal_log = CanalLog(self.logTextEdit, etiqueta=self.progresoLabel)
+        self.canal_log.enlazar(self.filtroLogComboBox, self.buscarLogLineEdit)
+
+        # Perfiles SQLite disponibles
+        for clave, perfil in PERFILES_SQLITE.items():
+            self.perfilComboBox.addItem(perfil["etiqueta"], clave)
+        self.perfilComboBox.setCurrentIndex(self.perfilComboBox.findData(PERFIL_POR_DEFECTO))
+        self.procesosSpinBox.setValue(os.cpu_count() or 1)
 
         # Mensaje inicial en log
-        self.logTextEdit.append("🗂️ Reporte de capas convertidas de Shapefiles a GPKG")
+        self.canal_log.escribir("🗂️ Reporte de capas convertidas de Shapefiles a GPKG")
 
     # ----------------------------------------------------
     def select_input_folder(self):
@@ -73,34 +83,52 @@ class Shp2GpkgDialog(QDialog, FORM_CLASS):
         epsg = int(epsg_text) if epsg_text.isdigit() else None
 
         # Limpiar log
-        self.logTextEdit.clear()
-        self.logTextEdit.append("▶ Iniciando conversión de Shapefiles a GPKG...")
+        self.canal_log.limpiar()
+        self.canal_log.escribir("▶ Iniciando conversión de Shapefiles a GPKG...")
 
         # Crear tarea
-        self.task = ShpToGpkgTask(input_path, output_path, epsg, self.logTextEdit, self)
+        self.task = ShpToGpkgTask(input_path, output_path, epsg, self.canal_log, self,
+                                  opciones=self.leer_opciones())
         self.task_active = True
+        self.progressBar.setValue(0)
+        self.task.progressChanged.connect(lambda valor: self.progressBar.setValue(int(valor)))
         QgsApplication.taskManager().addTask(self.task)
 
         # Desactivar botón Run mientras se procesa
         self.runButton.setEnabled(False)
 
+    def leer_opciones(self):
+        """Devuelve las opciones del motor de conversión elegidas en el diálogo."""
+        return {
+            "perfil_sqlite": self.perfilComboBox.currentData(),
+            "paralelo": self.paraleloCheckBox.isChecked(),
+            "procesos": self.procesosSpinBox.value(),
+            "omitir_sin_cambios": self.omitirCheckBox.isChecked(),
+            "reanudar": self.reanudarCheckBox.isChecked(),
+            "escaneo": {
+                "excluir": patrones_desde_texto(self.excluirLineEdit.text()),
+                "profundidad_max": None if self.profundidadSpinBox.value() < 0 else self.profundidadSpinBox.value(),
+            },
+        }
+
     # ----------------------------------------------------
     def cancel_task(self):
         if getattr(self, "task_active", False) and self.task:
             self.task.cancel()
-            self.logTextEdit.append("⏹ Cancelando tarea...")
+            self.canal_log.escribir("⏹ Cancelando tarea...")
         else:
-            self.logTextEdit.append("⚠️ No hay tareas activas.")
+            self.canal_log.escribir("⚠️ No hay tareas activas.")
 
 
 # ----------------------------------------------------
 class ShpToGpkgTask(QgsTask):
-    def __init__(self, input_path, output_path, epsg, log_widget, dialog):
+    def __init__(self, input_path, output_path, epsg, canal_log, dialog, opciones=None):
         super().__init__("Convertir SHP a GPKG")
         self.input_path = input_path
         self.output_path = output_path
         self.epsg = epsg
-        self.log_widget = log_widget
+        self.opciones = opciones or {}
+        self.canal_log = canal_log
         self.dialog = dialog
         self.cancelled_flag = False
 
@@ -116,16 +144,26 @@ class ShpToGpkgTask(QgsTask):
         # Callback para logs
         def log_cb(msg):
             QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
-            if self.log_widget:
-                self.log_widget.append(msg)
+            if self.canal_log:
+                self.canal_log.escribir(msg)
+
+        # Callback de progreso: barra de la tarea y línea de estado del diálogo
+        def progreso_cb(progreso):
+            self.setProgress(progreso.porcentaje)
+            if self.canal_log:
+                self.canal_log.estado(progreso.describir())
 
         try:
+            # El motor se importa al lanzar la tarea, no al abrir el diálogo
+            from .shp2gpkg_tool import convertir_shapefiles
             convertir_shapefiles(
                 self.input_path,
                 self.output_path,
                 epsg_destino=self.epsg,
                 cancel_callback=cancel_cb,
-                log_callback=log_cb
+                log_callback=log_cb,
+                progreso_callback=progreso_cb,
+                **self.opciones
             )
         except Exception as e:
             log_cb(f"❌ Error inesperado: {e}")
@@ -137,9 +175,12 @@ class ShpToGpkgTask(QgsTask):
             self.dialog.task_active = False
 
         if self.cancelled_flag:
-            self.log_widget.append("⏹ Tarea cancelada por el usuario.")
+            self.canal_log.escribir("⏹ Tarea cancelada por el usuario.")
         else:
-            self.log_widget.append("✅ Tarea finalizada.")
+            self.canal_log.escribir("✅ Tarea finalizada.")
+            if self.dialog and hasattr(self.dialog, "progressBar"):
+                self.dialog.progressBar.setValue(100)
+        self.canal_log.volcar()
 
         if self.dialog and hasattr(self.dialog, "runButton"):
             self.dialog.runButton.setEnabled(True)
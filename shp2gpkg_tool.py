@@ -1,132 +1,271 @@
 # -*- coding: utf-8 -*-
+from concurrent.futures import FIRST_COMPLETED, wait
 from pathlib import Path
 from qgis.core import (
     Qgis,
     QgsMessageLog,
     QgsVectorLayer,
     QgsVectorFileWriter,
-    QgsCoordinateReferenceSystem,
-    QgsCoordinateTransform,
-    QgsFeature,
-    QgsWkbTypes,
     QgsProject
 )
+from .gpkg_utils import DiarioReanudacion, ManifiestoConversion, aplicar_perfil_sqlite, describir_perfil
+from .gpkg_paralelo import crear_pool, convertir_shapefile_ogr, esperar_resultados, numero_procesos
+from .gpkg_reproyeccion import CACHE_TRANSFORMACIONES
+from .gpkg_escaneo import escanear
+from .gpkg_tuberia import en_segundo_plano, etapa
+from .gpkg_progreso import Progreso
 
+NIVELES_LOG = {"info": Qgis.Info, "warning": Qgis.Warning, "critical": Qgis.Critical}
+EXTENSIONES_SHP = [".shp", ".shx", ".dbf", ".prj", ".cpg"]
 
-def convertir_shapefiles(carpeta_entrada, carpeta_salida, epsg_destino=None,
-                         cancel_callback=None, log_callback=None):
+
+def componentes_shapefile(ruta):
+    """Archivos existentes que forman el shapefile 'ruta' (.shp, .shx, .dbf, .prj, .cpg)."""
+    return [ruta.with_suffix(ext) for ext in EXTENSIONES_SHP if ruta.with_suffix(ext).exists()]
+
+
+def convertir_shapefile(ruta, carpeta_entrada, carpeta_salida, epsg_destino, transform_context,
+                        log_callback=None, perfil_sqlite=None):
     """
-    Convierte todos los shapefiles de una carpeta a GPKG usando PyQGIS,
-    respetando la estructura de subcarpetas de la carpeta de entrada.
-    Cada shapefile genera un GeoPackage independiente.
+    Convierte un shapefile a GPKG dentro de 'carpeta_salida', respetando su subcarpeta.
+    Retorna la línea del resumen correspondiente.
     """
+    try:
+        # Cargar shapefile
+        layer = QgsVectorLayer(str(ruta), ruta.stem, "ogr")
+        if not layer.isValid():
+            raise Exception("No se pudo cargar la capa.")
 
-    carpeta_entrada = Path(carpeta_entrada)
-    carpeta_salida = Path(carpeta_salida)
+        mensaje_extra = ""
 
-    shapefiles = list(carpeta_entrada.rglob("*.shp"))
-    resumen = []
+        # Determinar CRS destino
+        if epsg_destino:
+            crs_destino = CACHE_TRANSFORMACIONES.crs_epsg(epsg_destino)
+        elif layer.crs().isValid():
+            crs_destino = layer.crs()
+        else:
+            crs_destino = CACHE_TRANSFORMACIONES.crs_epsg(4326)
 
-    transform_context = QgsProject.instance().transformContext()
+        # Guardar en GeoPackage (la reproyección se hace al escribir, sin copiar a memoria)
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = ruta.stem
 
-    for ruta in shapefiles:
-        if cancel_callback and cancel_callback():
-            msg = "⏹ Conversión cancelada por el usuario."
+        # Advertencia si CRS original no válido: se asigna el CRS destino sin reproyectar
+        if not layer.crs().isValid():
+            mensaje_extra = f" (CRS indefinido → EPSG:{crs_destino.postgisSrid()})"
+            msg = f"⚠️ {ruta.stem}: CRS indefinido → EPSG:{crs_destino.postgisSrid()}"
+            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Warning)
             if log_callback:
                 log_callback(msg)
-            resumen.append("Cancelado por el usuario.")
-            break
-
-        try:
-            # Cargar shapefile
-            layer = QgsVectorLayer(str(ruta), ruta.stem, "ogr")
-            if not layer.isValid():
-                raise Exception("No se pudo cargar la capa.")
-
-            mensaje_extra = ""
-
-            # Determinar CRS destino
-            if epsg_destino:
-                crs_destino = QgsCoordinateReferenceSystem.fromEpsgId(epsg_destino)
-            elif layer.crs().isValid():
-                crs_destino = layer.crs()
-            else:
-                crs_destino = QgsCoordinateReferenceSystem.fromEpsgId(4326)
-
-            # Advertencia si CRS original no válido
-            if not layer.crs().isValid():
-                mensaje_extra = f" (CRS indefinido → EPSG:{crs_destino.postgisSrid()})"
-                msg = f"⚠️ {ruta.stem}: CRS indefinido → EPSG:{crs_destino.postgisSrid()}"
-                QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Warning)
-                if log_callback:
-                    log_callback(msg)
+            layer.setCrs(crs_destino)
+
+        # Reproyectar si EPSG destino es distinto
+        if layer.crs() != crs_destino:
+            options.ct = CACHE_TRANSFORMACIONES.transformacion(layer.crs(), crs_destino, QgsProject.instance())
+            mensaje_extra = f" (Reproyectado a EPSG:{crs_destino.postgisSrid()})"
 
-            # Reproyectar si EPSG destino es distinto
-            if layer.crs() != crs_destino:
-                transform = QgsCoordinateTransform(layer.crs(), crs_destino, QgsProject.instance())
-
-                # Detectar tipo de geometría original (Point, LineString, Polygon)
-                geom_type = QgsWkbTypes.displayString(layer.wkbType())
-                mem_layer_uri = "{}?crs={}".format(geom_type, crs_destino.authid())
-
-                mem_layer = QgsVectorLayer(mem_layer_uri, layer.name(), "memory")
-                mem_layer.startEditing()
-                mem_layer.dataProvider().addAttributes(layer.fields())
-                mem_layer.updateFields()
-
-                for feat in layer.getFeatures():
-                    new_feat = QgsFeature()
-                    new_feat.setFields(layer.fields())
-                    new_feat.setAttributes(feat.attributes())
-                    geom = feat.geometry()
-                    if geom:
-                        geom.transform(transform)
-                        new_feat.setGeometry(geom)
-                    mem_layer.addFeature(new_feat)
-
-                mem_layer.commitChanges()
-                export_layer = mem_layer
-                mensaje_extra = f" (Reproyectado a EPSG:{crs_destino.postgisSrid()})"
-            else:
-                export_layer = layer
-
-            # Construir ruta de salida respetando subcarpetas
-            ruta_relativa = ruta.relative_to(carpeta_entrada).parent
-            carpeta_salida_completa = carpeta_salida / ruta_relativa
-            carpeta_salida_completa.mkdir(parents=True, exist_ok=True)
-            ruta_salida = carpeta_salida_completa / (ruta.stem + ".gpkg")
-
-            # Si el GPKG existe, borrarlo antes de crear uno nuevo
-            if ruta_salida.exists():
-                ruta_salida.unlink()
-
-            # Guardar en GeoPackage
-            options = QgsVectorFileWriter.SaveVectorOptions()
-            options.driverName = "GPKG"
-            options.layerName = ruta.stem
+        # Construir ruta de salida respetando subcarpetas
+        ruta_relativa = ruta.relative_to(carpeta_entrada).parent
+        carpeta_salida_completa = carpeta_salida / ruta_relativa
+        carpeta_salida_completa.mkdir(parents=True, exist_ok=True)
+        ruta_salida = carpeta_salida_completa / (ruta.stem + ".gpkg")
 
+        # Si el GPKG existe, borrarlo antes de crear uno nuevo
+        if ruta_salida.exists():
+            ruta_salida.unlink()
+
+        with aplicar_perfil_sqlite(perfil_sqlite):
             result, error_message = QgsVectorFileWriter.writeAsVectorFormatV2(
-                export_layer,
+                layer,
                 str(ruta_salida),
                 transform_context,
                 options
             )
 
-            if result != QgsVectorFileWriter.NoError:
-                raise Exception(error_message)
+        if result != QgsVectorFileWriter.NoError:
+            raise Exception(error_message)
 
-            resumen.append(f"{ruta.stem}: convertido{mensaje_extra}")
-            msg = f"✅ {ruta.stem}: convertido{mensaje_extra}"
-            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
-            if log_callback:
-                log_callback(msg)
+        msg = f"✅ {ruta.stem}: convertido{mensaje_extra}"
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Info)
+        if log_callback:
+            log_callback(msg)
+        return f"{ruta.stem}: convertido{mensaje_extra}"
+
+    except Exception as e:
+        msg = f"❌ {ruta.stem}: fallido → {e}"
+        QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
+        if log_callback:
+            log_callback(msg)
+        return f"{ruta.stem}: fallido → {e}"
+
+
+def convertir_en_paralelo(shapefiles, carpeta_entrada, carpeta_salida, epsg_destino=None,
+                          cancel_callback=None, log_callback=None, perfil_sqlite=None, procesos=None,
+                          resultado_callback=None):
+    """
+    Reparte los shapefiles entre 'procesos' procesos que los convierten con OGR.
+    'shapefiles' puede ser un generador: cada shapefile se envía a los procesos en
+    cuanto llega, con como mucho cuatro por proceso en espera.
+    Los mensajes de los procesos se escriben en el log a medida que terminan y
+    las líneas del resumen se devuelven en el orden de 'shapefiles'.
+    'resultado_callback(ruta, linea)' se llama al terminar cada shapefile.
+    """
+    if log_callback:
+        log_callback(f"🚀 Conversión en paralelo con {numero_procesos(procesos)} procesos")
+
+    lineas = {}
+    en_curso = {}
+    maximo = numero_procesos(procesos) * 4
+
+    def recoger(futuros):
+        for futuro in futuros:
+            n, ruta = en_curso.pop(futuro)
+            if futuro.cancelled():
+                continue
+            try:
+                linea, mensajes = futuro.result()
+            except Exception as e:
+                linea, mensajes = f"{ruta.stem}: fallido → {e}", [("critical", f"❌ {ruta.stem}: fallido → {e}")]
+            lineas[n] = linea
+            if resultado_callback:
+                resultado_callback(ruta, linea)
+            for nivel, msg in mensajes:
+                QgsMessageLog.logMessage(msg, "GPKG Tools", NIVELES_LOG[nivel])
+                if log_callback:
+                    log_callback(msg)
 
-        except Exception as e:
-            resumen.append(f"{ruta.stem}: fallido → {e}")
-            msg = f"❌ {ruta.stem}: fallido → {e}"
-            QgsMessageLog.logMessage(msg, "GPKG Tools", Qgis.Critical)
+    with crear_pool(procesos) as pool:
+        for n, ruta in enumerate(shapefiles):
+            if cancel_callback and cancel_callback():
+                break
+            futuro = pool.submit(convertir_shapefile_ogr, str(ruta), str(carpeta_entrada), str(carpeta_salida),
+                                 epsg_destino, perfil_sqlite)
+            en_curso[futuro] = (n, ruta)
+            while len(en_curso) >= maximo and not (cancel_callback and cancel_callback()):
+                hechos, _ = wait(list(en_curso), timeout=0.5, return_when=FIRST_COMPLETED)
+                recoger(hechos)
+        recoger(esperar_resultados(list(en_curso), cancel_callback))
+
+    resumen = [lineas[n] for n in sorted(lineas)]
+    if cancel_callback and cancel_callback():
+        if log_callback:
+            log_callback("⏹ Conversión cancelada por el usuario.")
+        resumen.append("Cancelado por el usuario.")
+    return resumen
+
+
+def convertir_shapefiles(carpeta_entrada, carpeta_salida, epsg_destino=None,
+                         cancel_callback=None, log_callback=None, perfil_sqlite=None,
+                         paralelo=False, procesos=None, omitir_sin_cambios=False, reanudar=False,
+                         escaneo=None, progreso_callback=None):
+    """
+    Convierte todos los shapefiles de una carpeta a GPKG usando PyQGIS,
+    respetando la estructura de subcarpetas de la carpeta de entrada.
+    Cada shapefile genera un GeoPackage independiente.
+    'perfil_sqlite' elige el perfil de PRAGMAs de los GPKG creados.
+    Con 'paralelo' los shapefiles se convierten con OGR en 'procesos' procesos
+    (por defecto, uno por CPU).
+    Con 'omitir_sin_cambios' se omiten los shapefiles que no han cambiado desde
+    la última conversión al mismo EPSG (según el manifiesto de la carpeta de salida).
+    Los shapefiles convertidos se anotan en un diario de reanudación; con 'reanudar'
+    se omiten los que ya completó una ejecución anterior cancelada o interrumpida.
+    Los shapefiles se buscan con gpkg_escaneo.escanear ('escaneo' son sus opciones:
+    incluir, excluir, profundidad_max, enlaces, hilos). La búsqueda, la comprobación contra
+    el manifiesto y la conversión corren a la vez como etapas de una tubería con
+    colas acotadas, de modo que la conversión empieza en cuanto aparece el primer shapefile.
+    'progreso_callback(progreso)' recibe periódicamente el gpkg_progreso.Progreso de la ejecución.
+    """
+
+    carpeta_entrada = Path(carpeta_entrada)
+    carpeta_salida = Path(carpeta_salida)
+
+    resumen = [f"Perfil SQLite: {describir_perfil(perfil_sqlite)}"]
+    contadores_cache = CACHE_TRANSFORMACIONES.contadores()
+
+    transform_context = QgsProject.instance().transformContext()
+
+    carpeta_salida.mkdir(parents=True, exist_ok=True)
+    manifiesto = ManifiestoConversion(carpeta_entrada, carpeta_salida) if omitir_sin_cambios else None
+    diario = DiarioReanudacion(carpeta_salida / "gpkg_tools_reanudar.sqlite",
+                               {"herramienta": "shp2gpkg", "entrada": carpeta_entrada, "epsg": epsg_destino},
+                               reanudar)
+    if diario.error and log_callback:
+        log_callback(f"⚠️ No se pudo abrir el diario de reanudación ({diario.error}): se continúa sin él")
+    reanudados = 0
+    progreso = Progreso(progreso_callback)
+    if reanudar and log_callback:
+        log_callback("↩️ Reanudando la conversión anterior" if diario.reanudado else
+                     "⚠️ No hay una conversión anterior que reanudar: se convierten todos los shapefiles")
+
+    def inspeccionar(ruta):
+        """Etapa de inspección (en otro hilo): ¿sigue al día según el manifiesto?"""
+        return bool(manifiesto and manifiesto.vigente(ruta, epsg_destino, componentes_shapefile(ruta)))
+
+    def omitir(ruta, sin_cambios):
+        nonlocal reanudados
+        hecho = diario.reanudado and diario.completado(ruta.relative_to(carpeta_entrada).as_posix(), carpeta_salida)
+        if hecho:
+            reanudados += 1
+            resumen.append(hecho["linea"])
+            progreso.archivo_terminado(ruta, omitido=True)
             if log_callback:
-                log_callback(msg)
+                log_callback(f"↩️ {ruta.stem}: ya convertido en la ejecución anterior")
+            return True
+        if not sin_cambios:
+            return False
+        manifiesto.omitidos += 1
+        progreso.archivo_terminado(ruta, omitido=True)
+        resumen.append(f"{ruta.stem}: sin cambios (omitido)")
+        if log_callback:
+            log_callback(f"⏭️ {ruta.stem}: sin cambios, omitido")
+        return True
+
+    def registrar(ruta, linea):
+        progreso.archivo_terminado(ruta)
+        if not linea.startswith(f"{ruta.stem}: convertido"):
+            return
+        salida = ruta.relative_to(carpeta_entrada).parent / (ruta.stem + ".gpkg")
+        diario.registrar(ruta.relative_to(carpeta_entrada).as_posix(), linea=linea, salidas=[salida.as_posix()])
+        if manifiesto:
+            manifiesto.registrar(ruta, epsg_destino, [salida], componentes_shapefile(ruta))
+
+    # Tubería: búsqueda (hilo propio) → inspección (hilos) → conversión (este hilo o procesos)
+    shapefiles = progreso.encontrados(escanear(carpeta_entrada, tipos=("*.shp",), **(escaneo or {})),
+                                      lambda ruta: sum(c.stat().st_size for c in componentes_shapefile(ruta)))
+    inspeccionados = etapa(inspeccionar, en_segundo_plano(shapefiles), hilos=2)
+
+    if paralelo:
+        pendientes = (ruta for ruta, sin_cambios, _ in inspeccionados if not omitir(ruta, sin_cambios))
+        resumen.extend(convertir_en_paralelo(pendientes, carpeta_entrada, carpeta_salida, epsg_destino,
+                                             cancel_callback, log_callback, perfil_sqlite, procesos,
+                                             registrar))
+    else:
+        for ruta, sin_cambios, _ in inspeccionados:
+            if cancel_callback and cancel_callback():
+                msg = "⏹ Conversión cancelada por el usuario."
+                if log_callback:
+                    log_callback(msg)
+                resumen.append("Cancelado por el usuario.")
+                break
+
+            if omitir(ruta, sin_cambios):
+                continue
+            linea = convertir_shapefile(ruta, carpeta_entrada, carpeta_salida, epsg_destino,
+                                        transform_context, log_callback, perfil_sqlite)
+            resumen.append(linea)
+            registrar(ruta, linea)
+
+    inspeccionados.close()
+    progreso.terminar()
+    cancelado = bool(cancel_callback and cancel_callback())
+    diario.cerrar(terminado=not cancelado)
+    if manifiesto:
+        manifiesto.guardar(completo=not cancelado)
+        resumen.append(f"Shapefiles omitidos sin cambios: {manifiesto.omitidos}")
+    if reanudar:
+        resumen.append(f"Shapefiles ya convertidos en la ejecución anterior: {reanudados}")
+    resumen.append(CACHE_TRANSFORMACIONES.describir(contadores_cache))
 
     # Guardar resumen
     ruta_resumen = carpeta_salida / "resumen_conversion.txt"
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Banco de pruebas de rendimiento de los tres motores de GPKG Tools
+(fusionar_vectores, convertir_shapefiles y convertir_gpkg_a_shp).
+
+Genera árboles de entrada sintéticos y reproducibles (N archivos × M capas ×
+K entidades de puntos, líneas y polígonos, con el número de vértices y de campos
+elegidos), ejecuta cada motor sin interfaz en un QGIS headless y guarda en un
+JSON el tiempo real, el tiempo de CPU, el pico de RSS, las entidades por segundo
+y el tamaño de la salida de cada caso. Con --comparar se contrasta el resultado
+con un JSON anterior y se marcan las regresiones.
+
+Uso (desde el directorio del plugin, con el Python de QGIS):
+    python test/benchmark_motores.py --archivos 20 --capas 3 --entidades 5000 \\
+        --salida bench_resultados.json [--comparar bench_base.json]
+
+El pico de RSS es el del proceso principal: en los modos en paralelo no incluye
+los procesos de trabajo (su CPU sí se suma, cuando el sistema lo permite).
+"""
+import argparse
+import importlib
+import json
+import math
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from osgeo import gdal, ogr, osr
+
+DIR_PLUGIN = Path(__file__).resolve().parents[1]
+
+TIPOS_GEOMETRIA = {
+    "punto": ogr.wkbPoint,
+    "linea": ogr.wkbLineString,
+    "poligono": ogr.wkbPolygon,
+}
+
+# Motor: (módulo, función, formato de entrada)
+MOTORES = {
+    "fusion": ("gpkg2fusion_tool", "fusionar_vectores", "gpkg"),
+    "shp2gpkg": ("shp2gpkg_tool", "convertir_shapefiles", "shp"),
+    "gpkg2shp": ("gpkg2shp_tool", "convertir_gpkg_a_shp", "gpkg"),
+}
+
+
+# ----------------------------------------------------
+# Datos sintéticos
+# ----------------------------------------------------
+def _geometria(tipo, vertices, rng):
+    """Geometría aleatoria de 'tipo' con unos 'vertices' vértices, en un área de 10° × 10°."""
+    x, y = rng.uniform(-80, -70), rng.uniform(10, 20)
+    if tipo == "punto":
+        geom = ogr.Geometry(ogr.wkbPoint)
+        geom.AddPoint_2D(x, y)
+        return geom
+    if tipo == "linea":
+        geom = ogr.Geometry(ogr.wkbLineString)
+        for _ in range(max(vertices, 2)):
+            geom.AddPoint_2D(x, y)
+            x, y = x + rng.uniform(-0.01, 0.01), y + rng.uniform(-0.01, 0.01)
+        return geom
+    # Polígono estrellado (siempre válido) alrededor de (x, y)
+    anillo = ogr.Geometry(ogr.wkbLinearRing)
+    n = max(vertices, 3)
+    for i in range(n):
+        angulo = 2 * math.pi * i / n
+        radio = rng.uniform(0.005, 0.01)
+        anillo.AddPoint_2D(x + radio * math.cos(angulo), y + radio * math.sin(angulo))
+    anillo.CloseRings()
+    geom = ogr.Geometry(ogr.wkbPolygon)
+    geom.AddGeometry(anillo)
+    return geom
+
+
+def _crear_capa(ds, nombre, tipo, entidades, vertices, campos, srs, rng):
+    """Crea la capa 'nombre' con 'entidades' entidades y 'campos' campos (entero, real y texto alternados)."""
+    capa = ds.CreateLayer(nombre, srs, TIPOS_GEOMETRIA[tipo])
+    tipos_campo = [ogr.OFTInteger, ogr.OFTReal, ogr.OFTString]
+    for c in range(campos):
+        campo = ogr.FieldDefn(f"campo_{c}", tipos_campo[c % 3])
+        if tipos_campo[c % 3] == ogr.OFTString:
+            campo.SetWidth(32)
+        capa.CreateField(campo)
+
+    defn = capa.GetLayerDefn()
+    capa.StartTransaction()
+    for _ in range(entidades):
+        feat = ogr.Feature(defn)
+        for c in range(campos):
+            if c % 3 == 0:
+                feat.SetField(c, rng.randint(0, 1_000_000))
+            elif c % 3 == 1:
+                feat.SetField(c, rng.uniform(0, 1000))
+            else:
+                feat.SetField(c, "".join(rng.choice("abcdefghijklmnñopqrstuvwxyz ") for _ in range(24)))
+        feat.SetGeometry(_geometria(tipo, vertices, rng))
+        capa.CreateFeature(feat)
+    capa.CommitTransaction()
+
+
+def sintetizar(carpeta, formato, archivos, capas, entidades, geometrias, vertices, campos, semilla):
+    """
+    Genera en 'carpeta' 'archivos' GPKG de 'capas' capas (formato 'gpkg') o
+    'archivos' carpetas con 'capas' shapefiles (formato 'shp'), repartidos en tres
+    subcarpetas. Cada archivo va en su propia carpeta para que gpkg2shp, que escribe
+    <salida>/<subcarpeta>/<capa>.shp, no sobrescriba capas del mismo nombre.
+    Con la misma semilla, el contenido es siempre el mismo.
+    Retorna el número total de entidades.
+    """
+    rng = random.Random(semilla)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    carpeta = Path(carpeta)
+
+    for i in range(archivos):
+        subcarpeta = carpeta / f"sub_{i % 3}" / f"archivo_{i}"
+        subcarpeta.mkdir(parents=True, exist_ok=True)
+        if formato == "gpkg":
+            ds = ogr.GetDriverByName("GPKG").CreateDataSource(str(subcarpeta / f"archivo_{i}.gpkg"))
+        for j in range(capas):
+            tipo = geometrias[j % len(geometrias)]
+            nombre = f"capa_{j}_{tipo}"
+            if formato == "shp":
+                ds = ogr.GetDriverByName("ESRI Shapefile").CreateDataSource(str(subcarpeta / f"{nombre}.shp"))
+            _crear_capa(ds, nombre, tipo, entidades, vertices, campos, srs, rng)
+            if formato == "shp":
+                ds = None
+        ds = None
+    return archivos * capas * entidades
+
+
+# ----------------------------------------------------
+# Medición
+# ----------------------------------------------------
+class MedidorRss:
+    """Muestrea la RSS del proceso en un hilo (con 'with') y guarda el pico."""
+
+    def __init__(self, memoria_rss, intervalo=0.02):
+        self.memoria_rss = memoria_rss
+        self.intervalo = intervalo
+        self.pico = 0
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while True:
+            self.pico = max(self.pico, self.memoria_rss() or 0)
+            if self._fin.wait(self.intervalo):
+                return
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+        return False
+
+
+def _cpu():
+    """Tiempo de CPU del proceso y de sus procesos hijos terminados, en segundos."""
+    if resource is None:
+        return time.process_time()
+    propio = resource.getrusage(resource.RUSAGE_SELF)
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return propio.ru_utime + propio.ru_stime + hijos.ru_utime + hijos.ru_stime
+
+
+def _tamano(ruta):
+    ruta = Path(ruta)
+    if ruta.is_file():
+        return ruta.stat().st_size
+    return sum(f.stat().st_size for f in ruta.rglob("*") if f.is_file())
+
+
+def ejecutar_motor(paquete, motor, entrada, salida, opciones, entidades, memoria_rss):
+    """Ejecuta 'motor' una vez sobre 'entrada' y devuelve sus medidas."""
+    modulo, funcion, _ = MOTORES[motor]
+    ejecutar = getattr(importlib.import_module(f"{paquete}.{modulo}"), funcion)
+    errores = []
+
+    def log(msg):
+        if msg.startswith("❌"):
+            errores.append(msg)
+
+    argumentos = dict(opciones)
+    if motor == "fusion":
+        argumentos["log_cb"] = log
+    else:
+        argumentos["log_callback"] = log
+
+    cpu_inicio = _cpu()
+    with MedidorRss(memoria_rss) as medidor:
+        inicio = time.perf_counter()
+        ejecutar(str(entrada), str(salida), **argumentos)
+        segundos = time.perf_counter() - inicio
+    return {
+        "segundos": segundos,
+        "cpu_segundos": _cpu() - cpu_inicio,
+        "pico_rss_mb": medidor.pico / (1024 * 1024),
+        "entidades_s": entidades / segundos if segundos else None,
+        "tamano_salida": _tamano(salida),
+        "errores": len(errores),
+    }
+
+
+def resumir(repeticiones):
+    """Mediana de tiempos y caudal y máximo del pico de RSS de las repeticiones de un caso."""
+    return {
+        "segundos": statistics.median(r["segundos"] for r in repeticiones),
+        "cpu_segundos": statistics.median(r["cpu_segundos"] for r in repeticiones),
+        "pico_rss_mb": max(r["pico_rss_mb"] for r in repeticiones),
+        "entidades_s": statistics.median(r["entidades_s"] or 0 for r in repeticiones),
+        "tamano_salida": repeticiones[-1]["tamano_salida"],
+        "errores": max(r["errores"] for r in repeticiones),
+        "repeticiones": repeticiones,
+    }
+
+
+def comparar(resultados, base, umbral):
+    """
+    Compara los segundos (mediana) de cada caso con los de 'base' (mismo motor y
+    parámetros). Imprime la variación y retorna el número de regresiones (más de
+    'umbral' % más lento).
+    """
+    anteriores = {(r["motor"], json.dumps(r["parametros"], sort_keys=True)): r for r in base["resultados"]}
+    regresiones = 0
+    for r in resultados:
+        anterior = anteriores.get((r["motor"], json.dumps(r["parametros"], sort_keys=True)))
+        if not anterior:
+            print(f"➖ {r['motor']}: sin caso equivalente en la base")
+            continue
+        variacion = 100.0 * (r["segundos"] - anterior["segundos"]) / anterior["segundos"]
+        if variacion > umbral:
+            regresiones += 1
+            marca = "🐢 regresión"
+        elif variacion < -umbral:
+            marca = "🚀 mejora"
+        else:
+            marca = "✅ sin cambios"
+        print(f"{marca} {r['motor']}: {anterior['segundos']:.2f} s → {r['segundos']:.2f} s ({variacion:+.1f} %)")
+    return regresiones
+
+
+# ----------------------------------------------------
+def _argumentos():
+    p = argparse.ArgumentParser(description="Banco de pruebas de los motores de GPKG Tools")
+    p.add_argument("--motores", default="fusion,shp2gpkg,gpkg2shp",
+                   help="motores separados por comas (%(default)s)")
+    p.add_argument("--archivos", type=int, default=10, help="archivos de entrada (%(default)s)")
+    p.add_argument("--capas", type=int, default=3, help="capas por archivo (%(default)s)")
+    p.add_argument("--entidades", type=int, default=1000, help="entidades por capa (%(default)s)")
+    p.add_argument("--geometrias", default="punto,linea,poligono",
+                   help="tipos de geometría, repartidos entre las capas (%(default)s)")
+    p.add_argument("--vertices", type=int, default=16, help="vértices por línea o polígono (%(default)s)")
+    p.add_argument("--campos", type=int, default=6, help="campos por capa (%(default)s)")
+    p.add_argument("--repeticiones", type=int, default=3, help="ejecuciones por motor (%(default)s)")
+    p.add_argument("--semilla", type=int, default=42, help="semilla de los datos sintéticos (%(default)s)")
+    p.add_argument("--opciones", default="{}",
+                   help='JSON con opciones por motor, p. ej. \'{"fusion": {"modo_lote": true}}\'')
+    p.add_argument("--dir-trabajo", help="carpeta para los datos y salidas (por defecto, una temporal)")
+    p.add_argument("--salida", default="bench_resultados.json", help="JSON de resultados (%(default)s)")
+    p.add_argument("--comparar", help="JSON de una ejecución anterior con el que comparar")
+    p.add_argument("--umbral", type=float, default=10.0,
+                   help="variación en %% a partir de la cual se marca una regresión (%(default)s)")
+    return p.parse_args()
+
+
+def main():
+    args = _argumentos()
+    motores = [m.strip() for m in args.motores.split(",") if m.strip()]
+    geometrias = [g.strip() for g in args.geometrias.split(",") if g.strip()]
+    for nombre in motores:
+        if nombre not in MOTORES:
+            sys.exit(f"Motor desconocido: {nombre} (disponibles: {', '.join(MOTORES)})")
+    for nombre in geometrias:
+        if nombre not in TIPOS_GEOMETRIA:
+            sys.exit(f"Geometría desconocida: {nombre} (disponibles: {', '.join(TIPOS_GEOMETRIA)})")
+    opciones = json.loads(args.opciones)
+
+    # El plugin se importa como paquete (los motores usan importaciones relativas)
+    sys.path.insert(0, str(DIR_PLUGIN.parent))
+    paquete = DIR_PLUGIN.name
+    memoria_rss = importlib.import_module(f"{paquete}.gpkg_utils").memoria_rss
+
+    from qgis.core import QgsApplication, Qgis
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    dir_trabajo = Path(args.dir_trabajo or tempfile.mkdtemp(prefix="gpkgtools_bench_"))
+    parametros = {
+        "archivos": args.archivos, "capas": args.capas, "entidades": args.entidades,
+        "geometrias": geometrias, "vertices": args.vertices, "campos": args.campos, "semilla": args.semilla,
+    }
+    resultados = []
+    try:
+        entradas = {}
+        for nombre in motores:
+            formato = MOTORES[nombre][2]
+            if formato not in entradas:
+                carpeta = dir_trabajo / f"entrada_{formato}"
+                shutil.rmtree(carpeta, ignore_errors=True)
+                print(f"🧪 Generando entrada {formato}: {args.archivos} archivos × {args.capas} capas "
+                      f"× {args.entidades} entidades...")
+                total = sintetizar(carpeta, formato, args.archivos, args.capas, args.entidades, geometrias,
+                                   args.vertices, args.campos, args.semilla)
+                entradas[formato] = (carpeta, total)
+
+        for nombre in motores:
+            carpeta, total = entradas[MOTORES[nombre][2]]
+            opciones_motor = opciones.get(nombre, {})
+            repeticiones = []
+            for n in range(args.repeticiones):
+                salida = dir_trabajo / f"salida_{nombre}"
+                shutil.rmtree(salida, ignore_errors=True)
+                salida.mkdir(parents=True)
+                if nombre == "fusion":
+                    salida = salida / "fusion.gpkg"
+                medida = ejecutar_motor(paquete, nombre, carpeta, salida, opciones_motor, total, memoria_rss)
+                repeticiones.append(medida)
+                print(f"⏱️ {nombre} [{n + 1}/{args.repeticiones}]: {medida['segundos']:.2f} s, "
+                      f"{medida['entidades_s']:,.0f} entidades/s, pico RSS {medida['pico_rss_mb']:.0f} MB")
+            resultados.append(dict(motor=nombre, parametros=dict(parametros, opciones=opciones_motor),
+                                   entidades=total, **resumir(repeticiones)))
+    finally:
+        if not args.dir_trabajo:
+            shutil.rmtree(dir_trabajo, ignore_errors=True)
+        app.exitQgis()
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "sistema": platform.platform(),
+            "procesador": platform.processor() or platform.machine(),
+            "gdal": gdal.__version__,
+            "qgis": Qgis.QGIS_VERSION,
+        },
+        "resultados": resultados,
+    }
+    Path(args.salida).write_text(json.dumps(informe, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"📄 Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        base = json.loads(Path(args.comparar).read_text(encoding="utf-8"))
+        if comparar(resultados, base, args.umbral):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
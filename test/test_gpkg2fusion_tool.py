@@ -0,0 +1,197 @@
+# coding=utf-8
+"""Tests de la fusión incremental y la reanudación (gpkg2fusion_tool).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from osgeo import ogr
+
+from .utilities import get_plugin_module
+
+fusion = get_plugin_module('gpkg2fusion_tool')
+DiarioReanudacion = get_plugin_module('gpkg_utils').DiarioReanudacion
+
+
+def _crear_gpkg(ruta, capas):
+    """GPKG con una capa de puntos vacía por cada nombre de 'capas'; retorna el dataset abierto."""
+    ds = ogr.GetDriverByName("GPKG").CreateDataSource(str(ruta))
+    for nombre in capas:
+        ds.CreateLayer(nombre, geom_type=ogr.wkbPoint)
+    return ds
+
+
+def _capas(ds):
+    return {ds.GetLayerByIndex(i).GetName() for i in range(ds.GetLayerCount())}
+
+
+class ClasificarArchivosTest(unittest.TestCase):
+    """Comparación de los archivos de entrada con el manifiesto."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.carpeta = Path(self.tmp.name)
+        self.archivo = self.carpeta / "sub" / "a.gpkg"
+        self.archivo.parent.mkdir()
+        self.archivo.write_bytes(b"contenido")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manifiesto(self, **cambios):
+        """Manifiesto con 'archivo' tal como está ahora en disco, fusionado en la capa 'a'."""
+        st = self.archivo.stat()
+        entrada = {"tamano": st.st_size, "mtime": st.st_mtime,
+                   "hash": get_plugin_module('gpkg_utils').hash_archivo(self.archivo), "capas": ["a"]}
+        entrada.update(cambios)
+        return {"sub/a.gpkg": entrada}
+
+    def clasificar(self, manifiesto):
+        return fusion.clasificar_archivos(self.carpeta, [self.archivo], manifiesto)
+
+    def test_archivo_nuevo(self):
+        pendientes, cambiados, eliminados, entradas = self.clasificar({})
+        self.assertEqual(pendientes, [self.archivo])
+        self.assertEqual((cambiados, eliminados), ([], []))
+        self.assertEqual(entradas["sub/a.gpkg"]["capas"], [])
+
+    def test_sin_cambios(self):
+        self.assertEqual(self.clasificar(self.manifiesto()), ([], [], [], {}))
+
+    def test_cambia_solo_la_fecha(self):
+        """Con la misma huella se conservan las capas ya fusionadas."""
+        manifiesto = self.manifiesto(mtime=0.0)
+        pendientes, cambiados, eliminados, entradas = self.clasificar(manifiesto)
+        self.assertEqual((pendientes, cambiados, eliminados), ([], [], []))
+        self.assertEqual(entradas["sub/a.gpkg"]["capas"], ["a"])
+        self.assertEqual(entradas["sub/a.gpkg"]["mtime"], self.archivo.stat().st_mtime)
+
+    def test_archivo_modificado(self):
+        manifiesto = self.manifiesto()
+        self.archivo.write_bytes(b"otro contenido")
+        pendientes, cambiados, eliminados, entradas = self.clasificar(manifiesto)
+        self.assertEqual(pendientes, [self.archivo])
+        self.assertEqual(cambiados, ["sub/a.gpkg"])
+        self.assertEqual(entradas["sub/a.gpkg"]["capas"], [])
+
+    def test_archivo_eliminado(self):
+        manifiesto = self.manifiesto()
+        manifiesto["borrado.gpkg"] = dict(manifiesto["sub/a.gpkg"], capas=["b"])
+        self.assertEqual(self.clasificar(manifiesto)[2], ["borrado.gpkg"])
+
+
+class ManifiestoSalidaTest(unittest.TestCase):
+    """Manifiesto guardado en el GPKG de salida y capas de los archivos cambiados."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.carpeta = Path(self.tmp.name) / "entrada"
+        self.carpeta.mkdir()
+        self.archivo = self.carpeta / "a.gpkg"
+        self.archivo.write_bytes(b"contenido")
+        self.salida = Path(self.tmp.name) / "salida.gpkg"
+        self.out_ds = _crear_gpkg(self.salida, ["a", "otra"])
+        fusion.crear_manifiesto(self.out_ds)
+        st = self.archivo.stat()
+        fusion.guardar_manifiesto(self.out_ds, {"a.gpkg": {
+            "tamano": st.st_size, "mtime": st.st_mtime, "hash": "x", "capas": ["a"]}}, [])
+
+    def tearDown(self):
+        self.out_ds = None
+        self.tmp.cleanup()
+
+    def reabrir(self):
+        self.out_ds = None
+        self.out_ds = ogr.Open(str(self.salida), 1)
+        return fusion.leer_manifiesto(self.out_ds)
+
+    def test_leer_manifiesto(self):
+        manifiesto = self.reabrir()
+        self.assertEqual(list(manifiesto), ["a.gpkg"])
+        self.assertEqual(manifiesto["a.gpkg"]["capas"], ["a"])
+
+    def test_sin_manifiesto(self):
+        self.out_ds = None
+        self.out_ds = _crear_gpkg(Path(self.tmp.name) / "vacio.gpkg", [])
+        self.assertIsNone(fusion.leer_manifiesto(self.out_ds))
+
+    def test_archivo_cambiado_que_falla(self):
+        """
+        Si un archivo cambiado falla, su fila no sobrevive a sus capas: en la siguiente
+        ejecución es un archivo nuevo y no se borra la capa que otro haya tomado con su nombre.
+        """
+        manifiesto = self.reabrir()
+        self.archivo.write_bytes(b"otro contenido")
+        os.utime(self.archivo, (0, 0))
+        pendientes, cambiados, eliminados, _ = fusion.clasificar_archivos(self.carpeta, [self.archivo], manifiesto)
+        self.assertEqual(cambiados, ["a.gpkg"])
+        fusion.descartar_archivos(self.out_ds, manifiesto, cambiados + eliminados)
+        self.assertEqual(manifiesto, {})
+        self.assertEqual(_capas(self.out_ds) - {fusion.TABLA_MANIFIESTO}, {"otra"})
+        # La fusión del archivo falla: no se guarda su entrada; otro archivo toma el nombre 'a'
+        self.out_ds.CreateLayer("a", geom_type=ogr.wkbPoint)
+
+        manifiesto = self.reabrir()
+        self.assertEqual(manifiesto, {})
+        pendientes, cambiados, eliminados, _ = fusion.clasificar_archivos(self.carpeta, [self.archivo], manifiesto)
+        self.assertEqual((pendientes, cambiados, eliminados), ([self.archivo], [], []))
+        self.assertIn("a", _capas(self.out_ds))
+
+    def test_archivo_eliminado(self):
+        manifiesto = self.reabrir()
+        self.archivo.unlink()
+        _, cambiados, eliminados, _ = fusion.clasificar_archivos(self.carpeta, [], manifiesto)
+        self.assertEqual(eliminados, ["a.gpkg"])
+        fusion.descartar_archivos(self.out_ds, manifiesto, cambiados + eliminados)
+        self.assertEqual(_capas(self.out_ds) - {fusion.TABLA_MANIFIESTO}, {"otra"})
+        self.assertEqual(self.reabrir(), {})
+
+
+class RecuperarReanudacionTest(unittest.TestCase):
+    """Limpieza del GPKG de salida al reanudar una fusión interrumpida."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        carpeta = Path(self.tmp.name)
+        self.out_ds = _crear_gpkg(carpeta / "salida.gpkg", ["completa", "a_medias", "previa"])
+        self.diario = DiarioReanudacion(carpeta / "_reanudar.sqlite", {"p": 1})
+        self.diario.registrar("completo.gpkg", capas=["completa"])
+        self.diario.registrar("sin_confirmar.gpkg", capas=["no_confirmada"])
+        self.diario.cerrar()
+        self.diario = DiarioReanudacion(carpeta / "_reanudar.sqlite", {"p": 1}, reanudar=True)
+
+    def tearDown(self):
+        self.diario.cerrar()
+        self.out_ds = None
+        self.tmp.cleanup()
+
+    def test_recuperar(self):
+        mensajes = []
+        manifiesto = {"previo.gpkg": {"capas": ["previa"]}}
+        completados = fusion.recuperar_reanudacion(self.out_ds, self.diario, manifiesto, mensajes.append)
+        self.assertEqual(list(completados), ["completo.gpkg"])
+        # Las capas del archivo a medias se eliminan; las del diario y del manifiesto se conservan
+        self.assertEqual(_capas(self.out_ds), {"completa", "previa"})
+        self.assertEqual(len(mensajes), 1)
+        # El archivo cuyas capas no llegaron a confirmarse se olvida del diario
+        self.assertEqual(list(self.diario.completados()), ["completo.gpkg"])
+
+    def test_sin_manifiesto(self):
+        fusion.recuperar_reanudacion(self.out_ds, self.diario)
+        self.assertEqual(_capas(self.out_ds), {"completa"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# coding=utf-8
+"""Tests de la exploración de carpetas (gpkg_escaneo).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from .utilities import get_plugin_module
+
+gpkg_escaneo = get_plugin_module('gpkg_escaneo')
+escanear, patrones_desde_texto = gpkg_escaneo.escanear, gpkg_escaneo.patrones_desde_texto
+
+
+class EscaneoTest(unittest.TestCase):
+    """Orden, profundidad y exclusiones de escanear."""
+
+    def setUp(self):
+        """Árbol de 8 carpetas con 2 niveles y archivos del mismo nombre en cada una."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.raiz = Path(self.tmp.name)
+        (self.raiz / "raiz.gpkg").touch()
+        for carpeta in "hgfedcba":
+            for sub in ("y", "x"):
+                (self.raiz / carpeta / sub).mkdir(parents=True)
+                (self.raiz / carpeta / sub / "x.gpkg").touch()
+            (self.raiz / carpeta / "x.gpkg").touch()
+            (self.raiz / carpeta / "notas.txt").touch()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def relativas(self, **opciones):
+        return [p.relative_to(self.raiz).as_posix() for p in escanear(self.raiz, **opciones)]
+
+    def test_orden_en_profundidad(self):
+        """Los archivos de cada carpeta van antes que sus subcarpetas, todo por nombre."""
+        rutas = self.relativas(incluir=("*.gpkg",))
+        esperado = ["raiz.gpkg"]
+        for carpeta in "abcdefgh":
+            esperado += [f"{carpeta}/x.gpkg", f"{carpeta}/x/x.gpkg", f"{carpeta}/y/x.gpkg"]
+        self.assertEqual(rutas, esperado)
+
+    def test_orden_estable(self):
+        """El orden no depende de qué hilo termina antes."""
+        primero = self.relativas(hilos=8)
+        for _ in range(30):
+            self.assertEqual(self.relativas(hilos=8), primero)
+        self.assertEqual(self.relativas(hilos=1), primero)
+
+    def test_profundidad(self):
+        self.assertEqual(self.relativas(incluir=("*.gpkg",), profundidad_max=0), ["raiz.gpkg"])
+        rutas = self.relativas(incluir=("*.gpkg",), profundidad_max=1)
+        self.assertEqual(rutas, ["raiz.gpkg"] + [f"{c}/x.gpkg" for c in "abcdefgh"])
+
+    def test_excluir(self):
+        """Las carpetas excluidas no se recorren; los patrones valen para el nombre o la ruta relativa."""
+        rutas = self.relativas(incluir=("*.gpkg",), excluir=("b", "*/y", "C/X.GPKG"))
+        self.assertFalse([r for r in rutas if r.startswith("b/")])
+        self.assertFalse([r for r in rutas if "/y/" in r])
+        self.assertNotIn("c/x.gpkg", rutas)
+        self.assertIn("c/x/x.gpkg", rutas)
+
+    def test_incluir_con_tipos(self):
+        """El filtro 'incluir' del usuario se combina con el tipo de archivo de la herramienta."""
+        rutas = self.relativas(tipos=("*.gpkg",), incluir=("a/*", "*.txt"))
+        self.assertEqual(rutas, ["a/x.gpkg", "a/x/x.gpkg", "a/y/x.gpkg"])
+        self.assertEqual(self.relativas(tipos=("*.gpkg",), incluir=()), self.relativas(incluir=("*.gpkg",)))
+
+    def test_cerrar_generador(self):
+        rutas = escanear(self.raiz, incluir=("*.gpkg",))
+        self.assertEqual(next(rutas), self.raiz / "raiz.gpkg")
+        rutas.close()
+
+    def test_carpeta_ilegible(self):
+        errores = []
+        self.assertEqual(list(escanear(self.raiz / "no_existe", error_cb=lambda r, e: errores.append(r))), [])
+        self.assertEqual(errores, [self.raiz / "no_existe"])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "sin enlaces simbólicos")
+    def test_enlaces(self):
+        try:
+            os.symlink(self.raiz / "a", self.raiz / "enlace")
+        except OSError:
+            self.skipTest("no se pueden crear enlaces simbólicos")
+        os.symlink(self.raiz / "a", self.raiz / "a" / "ciclo")
+        self.assertFalse([r for r in self.relativas(enlaces="archivos") if r.startswith("enlace/")])
+        seguidas = self.relativas(enlaces="seguir", incluir=("*.gpkg",))
+        # Cada carpeta real se recorre una sola vez, aunque haya ciclos
+        self.assertEqual(len(seguidas), 1 + 8 * 3)
+        with self.assertRaises(ValueError):
+            list(escanear(self.raiz, enlaces="otro"))
+
+    def test_patrones_desde_texto(self):
+        self.assertEqual(patrones_desde_texto("a*.gpkg; tmp, */copias/* ;"), ["a*.gpkg", "tmp", "*/copias/*"])
+        self.assertEqual(patrones_desde_texto(None), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Tests del modelo de progreso (gpkg_progreso).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import unittest
+from unittest import mock
+
+from .utilities import get_plugin_module
+
+gpkg_progreso = get_plugin_module('gpkg_progreso')
+Progreso = gpkg_progreso.Progreso
+
+
+class Reloj:
+    """Sustituye a time.perf_counter con un tiempo que avanza a mano."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+class ProgresoTest(unittest.TestCase):
+    """Porcentaje ponderado por tamaño, caudal y ETA."""
+
+    def setUp(self):
+        self.reloj = Reloj()
+        parche = mock.patch.object(gpkg_progreso.time, "perf_counter", self.reloj)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def encontrar(self, progreso, tamanos):
+        """Anota los archivos {ruta: tamaño} como encontrados y termina la búsqueda."""
+        return list(progreso.encontrados(list(tamanos), tamanos.get))
+
+    def test_porcentaje_por_tamano(self):
+        progreso = Progreso()
+        self.encontrar(progreso, {"a": 300, "b": 100})
+        self.assertEqual(progreso.porcentaje, 0.0)
+        progreso.archivo_terminado("b")
+        self.assertAlmostEqual(progreso.porcentaje, 25.0)
+        progreso.archivo_terminado("b")  # ya terminado: no cuenta dos veces
+        self.assertAlmostEqual(progreso.porcentaje, 25.0)
+        progreso.archivo_terminado("a")
+        self.assertAlmostEqual(progreso.porcentaje, 100.0)
+        self.assertEqual(progreso.archivos, 2)
+
+    def test_capas_reparten_el_tamano(self):
+        progreso = Progreso()
+        self.encontrar(progreso, {"a": 400})
+        progreso.capas_encontradas("a", 4)
+        progreso.capa_terminada("a", entidades=10)
+        progreso.capa_terminada("a", entidades=5)
+        self.assertAlmostEqual(progreso.porcentaje, 50.0)
+        self.assertEqual((progreso.capas, progreso.capas_total, progreso.entidades), (2, 4, 15))
+        self.assertEqual(progreso.archivos, 0)
+        progreso.capa_terminada("a")
+        progreso.capa_terminada("a")
+        self.assertEqual(progreso.archivos, 1)
+        self.assertAlmostEqual(progreso.porcentaje, 100.0)
+
+    def test_archivo_sin_capas(self):
+        progreso = Progreso()
+        self.encontrar(progreso, {"a": 100})
+        progreso.capas_encontradas("a", 0)
+        self.assertEqual(progreso.archivos, 1)
+
+    def test_porcentaje_no_retrocede(self):
+        """Mientras la búsqueda sigue, el total crece pero el porcentaje no baja."""
+        progreso = Progreso()
+        rutas = progreso.encontrados(["a", "b"], {"a": 100, "b": 900}.get)
+        next(rutas)
+        progreso.archivo_terminado("a")
+        self.assertAlmostEqual(progreso.porcentaje, 100.0)
+        next(rutas)
+        self.assertAlmostEqual(progreso.porcentaje, 100.0)
+
+    def test_eta(self):
+        progreso = Progreso()
+        rutas = progreso.encontrados(["a", "b"], {"a": 100, "b": 300}.get)
+        next(rutas)
+        next(rutas)
+        self.reloj.ahora += 10
+        progreso.archivo_terminado("a")
+        self.assertIsNone(progreso.eta)  # la búsqueda no ha terminado
+        self.assertIn("ETA calculando", progreso.describir())
+        list(rutas)
+        self.assertAlmostEqual(progreso.caudal, 10.0)
+        self.assertAlmostEqual(progreso.eta, 30.0)
+        self.assertIn("ETA 0:00:30", progreso.describir())
+
+    def test_omitidos_no_cuentan_para_el_caudal(self):
+        progreso = Progreso()
+        self.encontrar(progreso, {"a": 100, "b": 100})
+        self.reloj.ahora += 10
+        progreso.archivo_terminado("a", omitido=True)
+        self.assertAlmostEqual(progreso.porcentaje, 50.0)
+        self.assertIsNone(progreso.caudal)
+        self.assertIsNone(progreso.eta)
+        progreso.omitir_pendientes()
+        self.assertAlmostEqual(progreso.porcentaje, 100.0)
+
+    def test_aviso_limitado_por_intervalo(self):
+        avisos = []
+        progreso = Progreso(avisos.append, intervalo=1.0)
+        self.encontrar(progreso, {"a": 100, "b": 100, "c": 100})
+        self.assertEqual(len(avisos), 1)
+        progreso.archivo_terminado("a")
+        self.assertEqual(len(avisos), 1)
+        self.reloj.ahora += 2
+        progreso.archivo_terminado("b")
+        progreso.archivo_terminado("c")
+        self.assertEqual(len(avisos), 2)
+        progreso.terminar()
+        self.assertEqual(len(avisos), 3)
+        self.assertIs(avisos[-1], progreso)
+
+
+if __name__ == "__main__":
+    unittest.main()
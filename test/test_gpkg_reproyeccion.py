@@ -0,0 +1,116 @@
+# coding=utf-8
+"""Tests de la lectura de WKB para la reproyección por lotes (gpkg_reproyeccion).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import struct
+import unittest
+
+from .utilities import get_plugin_module
+
+_tramos_wkb = get_plugin_module('gpkg_reproyeccion')._tramos_wkb
+
+
+def _cabecera(tipo, orden="<"):
+    return struct.pack(orden + "BI", 1 if orden == "<" else 0, tipo)
+
+
+def _punto(x, y, orden="<"):
+    return _cabecera(1, orden) + struct.pack(orden + "2d", x, y)
+
+
+def _linea(coords, tipo=2, orden="<"):
+    dims = len(coords[0])
+    datos = b"".join(struct.pack(orden + f"{dims}d", *c) for c in coords)
+    return _cabecera(tipo, orden) + struct.pack(orden + "I", len(coords)) + datos
+
+
+def _poligono(anillos, orden="<"):
+    datos = struct.pack(orden + "I", len(anillos))
+    for anillo in anillos:
+        datos += struct.pack(orden + "I", len(anillo))
+        datos += b"".join(struct.pack(orden + "2d", *c) for c in anillo)
+    return _cabecera(3, orden) + datos
+
+
+def _coleccion(tipo, partes, orden="<"):
+    return _cabecera(tipo, orden) + struct.pack(orden + "I", len(partes)) + b"".join(partes)
+
+
+class TramosWkbTest(unittest.TestCase):
+    """Secuencias de coordenadas de cada tipo de geometría WKB."""
+
+    def tramos(self, wkb):
+        tramos = []
+        fin = _tramos_wkb(wkb, 0, tramos)
+        self.assertEqual(fin, len(wkb))
+        return tramos
+
+    def coordenadas(self, wkb, tramo):
+        pos, n, dims, orden = tramo
+        return struct.unpack_from(orden + f"{n * dims}d", wkb, pos)
+
+    def test_punto(self):
+        wkb = _punto(1.5, 2.5)
+        tramos = self.tramos(wkb)
+        self.assertEqual(tramos, [(5, 1, 2, "<")])
+        self.assertEqual(self.coordenadas(wkb, tramos[0]), (1.5, 2.5))
+
+    def test_big_endian(self):
+        wkb = _punto(1.5, 2.5, ">")
+        tramos = self.tramos(wkb)
+        self.assertEqual(tramos[0][3], ">")
+        self.assertEqual(self.coordenadas(wkb, tramos[0]), (1.5, 2.5))
+
+    def test_linea(self):
+        wkb = _linea([(0, 0), (1, 1), (2, 0)])
+        tramos = self.tramos(wkb)
+        self.assertEqual(tramos, [(9, 3, 2, "<")])
+        self.assertEqual(self.coordenadas(wkb, tramos[0]), (0, 0, 1, 1, 2, 0))
+
+    def test_dimensiones(self):
+        """Las variantes Z (1000), M (2000) y ZM (3000) de ISO WKB."""
+        self.assertEqual(self.tramos(_linea([(0, 0, 1)] * 2, 1002))[0][2], 3)
+        self.assertEqual(self.tramos(_linea([(0, 0, 1)] * 2, 2002))[0][2], 3)
+        self.assertEqual(self.tramos(_linea([(0, 0, 1, 2)] * 2, 3002))[0][2], 4)
+
+    def test_poligono_con_hueco(self):
+        exterior = [(0, 0), (10, 0), (10, 10), (0, 0)]
+        hueco = [(2, 2), (3, 2), (3, 3), (2, 2)]
+        wkb = _poligono([exterior, hueco])
+        tramos = self.tramos(wkb)
+        self.assertEqual([t[1] for t in tramos], [4, 4])
+        self.assertEqual(self.coordenadas(wkb, tramos[1])[:2], (2, 2))
+
+    def test_colecciones(self):
+        multipunto = _coleccion(4, [_punto(0, 0), _punto(1, 1)])
+        self.assertEqual(len(self.tramos(multipunto)), 2)
+        coleccion = _coleccion(7, [_punto(0, 0), _linea([(0, 0), (1, 1)]),
+                                   _coleccion(6, [_poligono([[(0, 0), (1, 0), (1, 1), (0, 0)]])])])
+        self.assertEqual([t[1] for t in self.tramos(coleccion)], [1, 2, 4])
+
+    def test_linea_vacia(self):
+        self.assertEqual(self.tramos(_cabecera(2) + struct.pack("<I", 0)), [(9, 0, 2, "<")])
+
+    def test_tipos_no_soportados(self):
+        """Curvas y superficies (y tipos EWKB) se dejan para la transformación geometría a geometría."""
+        for tipo in (8, 9, 10, 15, 4002, 0x80000002):
+            with self.assertRaises(ValueError):
+                _tramos_wkb(_cabecera(tipo) + struct.pack("<I", 0), 0, [])
+
+    def test_wkb_truncado(self):
+        with self.assertRaises(struct.error):
+            _tramos_wkb(_cabecera(2) + struct.pack("<I", 5)[:2], 0, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+# coding=utf-8
+"""Tests de las etapas de tubería (gpkg_tuberia).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import threading
+import time
+import unittest
+
+from .utilities import get_plugin_module
+
+gpkg_tuberia = get_plugin_module('gpkg_tuberia')
+en_segundo_plano, etapa = gpkg_tuberia.en_segundo_plano, gpkg_tuberia.etapa
+
+
+class EnSegundoPlanoTest(unittest.TestCase):
+    """Productor en otro hilo con cola acotada."""
+
+    def test_elementos_en_orden(self):
+        self.assertEqual(list(en_segundo_plano(range(100), maximo=3)), list(range(100)))
+
+    def test_error_del_productor(self):
+        def productor():
+            yield 1
+            raise ValueError("fallo")
+
+        recibidos = []
+        with self.assertRaises(ValueError):
+            for elemento in en_segundo_plano(productor()):
+                recibidos.append(elemento)
+        self.assertEqual(recibidos, [1])
+
+    def test_cierre_anticipado(self):
+        """Si el consumidor deja de leer, el productor se detiene y cierra su generador."""
+        cerrado = threading.Event()
+
+        def productor():
+            try:
+                for i in range(10 ** 6):
+                    yield i
+            finally:
+                cerrado.set()
+
+        elementos = en_segundo_plano(productor(), maximo=2)
+        self.assertEqual(next(elementos), 0)
+        elementos.close()
+        self.assertTrue(cerrado.wait(5))
+
+
+class EtapaTest(unittest.TestCase):
+    """Etapa con varios hilos y resultados en orden."""
+
+    def test_orden_de_entrada(self):
+        def lento(n):
+            time.sleep(0.01 * (5 - n % 5))
+            return n * n
+
+        resultados = list(etapa(lento, range(20), hilos=4))
+        self.assertEqual([e for e, _, _ in resultados], list(range(20)))
+        self.assertEqual([r for _, r, _ in resultados], [n * n for n in range(20)])
+
+    def test_errores_por_elemento(self):
+        """El error de un elemento se entrega con él y no detiene los demás."""
+        def funcion(n):
+            if n == 2:
+                raise RuntimeError("dos")
+            return n
+
+        resultados = list(etapa(funcion, range(4), hilos=2))
+        self.assertEqual([r for _, r, _ in resultados], [0, 1, None, 3])
+        self.assertIsInstance(resultados[2][2], RuntimeError)
+        self.assertIsNone(resultados[3][2])
+
+    def test_maximo_en_curso(self):
+        """Como mucho 'maximo' elementos se piden a la entrada por delante del consumidor."""
+        leidos = []
+
+        def entradas():
+            for i in range(10):
+                leidos.append(i)
+                yield i
+
+        resultados = etapa(lambda n: n, entradas(), hilos=1, maximo=2)
+        next(resultados)
+        self.assertLessEqual(len(leidos), 2)
+        resultados.close()
+
+    def test_cierre_anticipado(self):
+        """Al cerrar la etapa no se procesan los elementos aún no pedidos."""
+        procesados = []
+
+        def funcion(n):
+            procesados.append(n)
+            return n
+
+        resultados = etapa(funcion, range(1000), hilos=2, maximo=4)
+        next(resultados)
+        resultados.close()
+        self.assertLess(len(procesados), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,286 @@
+# coding=utf-8
+"""Tests de las utilidades compartidas (gpkg_utils).
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'kevin.irias.47@gmail.com'
+__date__ = '2026-10-16'
+__copyright__ = 'Copyright 2025, Kevin Irias'
+
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from .utilities import get_plugin_module
+
+gpkg_utils = get_plugin_module('gpkg_utils')
+LineasEnDisco = gpkg_utils.LineasEnDisco
+ManifiestoConversion = gpkg_utils.ManifiestoConversion
+DiarioReanudacion = gpkg_utils.DiarioReanudacion
+
+
+class LineasEnDiscoTest(unittest.TestCase):
+    """Lista de líneas que vuelca a un archivo temporal."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ruta = Path(self.tmp.name) / "_resumen.tmp"
+        self.lineas = LineasEnDisco(self.ruta)
+
+    def tearDown(self):
+        self.lineas.cerrar()
+        self.tmp.cleanup()
+
+    def test_sin_volcar(self):
+        self.lineas.append("a")
+        self.lineas.extend(["b", "c"])
+        self.assertEqual(len(self.lineas), 3)
+        self.assertEqual(list(self.lineas), ["a", "b", "c"])
+        self.assertEqual(self.lineas[1:], ["b", "c"])
+        self.assertFalse(self.ruta.exists())
+
+    def test_volcar(self):
+        self.lineas.extend(["a", "b"])
+        self.lineas.volcar()
+        self.lineas.extend(["c", "d"])
+        self.assertTrue(self.ruta.exists())
+        self.assertEqual(len(self.lineas), 4)
+        self.assertEqual(list(self.lineas), ["a", "b", "c", "d"])
+        # Las líneas en memoria siguen accesibles con índices absolutos
+        self.assertEqual(self.lineas[2:], ["c", "d"])
+        self.assertEqual(self.lineas[-1:], ["d"])
+        with self.assertRaises(IndexError):
+            self.lineas[1:]
+
+    def test_saltos_de_linea(self):
+        """Una línea con saltos de línea sigue siendo una sola línea tras volcarla."""
+        self.lineas.append("uno\ndos")
+        self.lineas.volcar()
+        self.assertEqual(list(self.lineas), ["uno dos"])
+        self.assertEqual(len(self.lineas), 1)
+
+    def test_cerrar_elimina_el_archivo(self):
+        self.lineas.append("a")
+        self.lineas.volcar()
+        self.lineas.cerrar()
+        self.assertFalse(self.ruta.exists())
+        self.lineas.cerrar()
+
+
+class ManifiestoConversionTest(unittest.TestCase):
+    """Detección de entradas sin cambios entre ejecuciones."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.entrada = Path(self.tmp.name) / "entrada"
+        self.salida = Path(self.tmp.name) / "salida"
+        self.entrada.mkdir()
+        self.salida.mkdir()
+        self.archivo = self.entrada / "sub" / "capa.shp"
+        self.archivo.parent.mkdir()
+        self.archivo.write_bytes(b"contenido")
+        (self.salida / "capa.gpkg").touch()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def convertir(self, epsg=4326):
+        """Primera ejecución: registra la conversión de 'archivo' y guarda el manifiesto."""
+        manifiesto = ManifiestoConversion(self.entrada, self.salida)
+        self.assertIsNone(manifiesto.vigente(self.archivo, epsg))
+        manifiesto.registrar(self.archivo, epsg, ["capa.gpkg"])
+        manifiesto.guardar()
+
+    def vigente(self, epsg=4326):
+        return ManifiestoConversion(self.entrada, self.salida).vigente(self.archivo, epsg)
+
+    def tocar(self, segundos=10):
+        """Adelanta la fecha de modificación de 'archivo'."""
+        estado = self.archivo.stat()
+        os.utime(self.archivo, ns=(estado.st_atime_ns, estado.st_mtime_ns + segundos * 10 ** 9))
+
+    def test_sin_cambios(self):
+        self.convertir()
+        entrada = self.vigente()
+        self.assertEqual(entrada["salidas"], ["capa.gpkg"])
+        self.assertEqual(entrada["epsg"], 4326)
+
+    def test_cambia_el_tamano(self):
+        self.convertir()
+        self.archivo.write_bytes(b"contenido nuevo")
+        self.assertIsNone(self.vigente())
+
+    def test_cambia_solo_la_fecha(self):
+        """Con el mismo contenido la huella coincide y la entrada sigue vigente."""
+        self.convertir()
+        self.tocar()
+        entrada = self.vigente()
+        self.assertIsNotNone(entrada)
+        self.assertEqual(entrada["mtime"], self.archivo.stat().st_mtime_ns)
+
+    def test_cambia_el_contenido_con_el_mismo_tamano(self):
+        self.convertir()
+        self.archivo.write_bytes(b"CONTENIDO")
+        self.tocar()
+        self.assertIsNone(self.vigente())
+
+    def test_salida_eliminada(self):
+        self.convertir()
+        (self.salida / "capa.gpkg").unlink()
+        self.assertIsNone(self.vigente())
+
+    def test_cambia_el_epsg(self):
+        self.convertir(4326)
+        self.assertIsNone(self.vigente(3857))
+
+    def test_varios_componentes(self):
+        dbf = self.archivo.with_suffix(".dbf")
+        dbf.write_bytes(b"tabla")
+        manifiesto = ManifiestoConversion(self.entrada, self.salida)
+        manifiesto.vigente(self.archivo, 4326, [self.archivo, dbf])
+        manifiesto.registrar(self.archivo, 4326, ["capa.gpkg"], [self.archivo, dbf])
+        manifiesto.guardar()
+        dbf.write_bytes(b"tabla modificada")
+        manifiesto = ManifiestoConversion(self.entrada, self.salida)
+        self.assertIsNone(manifiesto.vigente(self.archivo, 4326, [self.archivo, dbf]))
+
+    def test_guardar_olvida_entradas_eliminadas(self):
+        self.convertir()
+        manifiesto = ManifiestoConversion(self.entrada, self.salida)
+        manifiesto.guardar(completo=False)
+        self.assertIn("sub/capa.shp", ManifiestoConversion(self.entrada, self.salida).entradas)
+        manifiesto.guardar()
+        self.assertEqual(ManifiestoConversion(self.entrada, self.salida).entradas, {})
+
+    def test_json_corrupto(self):
+        self.convertir()
+        ruta = self.salida / ManifiestoConversion.NOMBRE
+        ruta.write_text('{"version": 1, "entradas": {', encoding="utf-8")
+        self.assertEqual(ManifiestoConversion(self.entrada, self.salida).entradas, {})
+        ruta.write_text("[]", encoding="utf-8")
+        self.assertEqual(ManifiestoConversion(self.entrada, self.salida).entradas, {})
+        self.assertIsNone(self.vigente())
+
+    def test_version_anterior(self):
+        self.convertir()
+        ruta = self.salida / ManifiestoConversion.NOMBRE
+        datos = json.loads(ruta.read_text(encoding="utf-8"))
+        datos["version"] = ManifiestoConversion.VERSION - 1
+        ruta.write_text(json.dumps(datos), encoding="utf-8")
+        self.assertIsNone(self.vigente())
+
+
+class DiarioReanudacionTest(unittest.TestCase):
+    """Puntos de control para reanudar una ejecución interrumpida."""
+
+    PARAMETROS = {"salida": "x", "epsg": 4326}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.carpeta = Path(self.tmp.name)
+        self.ruta = self.carpeta / "_reanudar.sqlite"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def abrir(self, reanudar=True, parametros=None, **opciones):
+        diario = DiarioReanudacion(self.ruta, parametros or self.PARAMETROS, reanudar, **opciones)
+        self.addCleanup(diario.cerrar)
+        self.assertIsNone(diario.error)
+        return diario
+
+    def test_registrar_y_reanudar(self):
+        diario = self.abrir(reanudar=False)
+        self.assertFalse(diario.reanudado)
+        diario.registrar("a.shp", salidas=["a.gpkg"], entidades=3)
+        diario.cerrar()
+        diario = self.abrir()
+        self.assertTrue(diario.reanudado)
+        self.assertEqual(diario.completado("a.shp"), {"salidas": ["a.gpkg"], "entidades": 3})
+        self.assertIsNone(diario.completado("b.shp"))
+        self.assertEqual(list(diario.completados()), ["a.shp"])
+
+    def test_sin_reanudar_se_descarta(self):
+        diario = self.abrir(reanudar=False)
+        diario.registrar("a.shp")
+        diario.cerrar()
+        diario = self.abrir(reanudar=False)
+        self.assertFalse(diario.reanudado)
+        self.assertEqual(diario.completados(), {})
+
+    def test_otros_parametros_se_descarta(self):
+        diario = self.abrir(reanudar=False)
+        diario.registrar("a.shp")
+        diario.cerrar()
+        diario = self.abrir(parametros={"salida": "x", "epsg": 3857})
+        self.assertFalse(diario.reanudado)
+        self.assertIsNone(diario.completado("a.shp"))
+
+    def test_salida_eliminada(self):
+        (self.carpeta / "a.gpkg").touch()
+        diario = self.abrir(reanudar=False)
+        diario.registrar("a.shp", salidas=["a.gpkg"])
+        diario.registrar("b.shp", salidas=["b.gpkg"])
+        diario.cerrar()
+        diario = self.abrir()
+        self.assertIsNotNone(diario.completado("a.shp", self.carpeta))
+        self.assertIsNone(diario.completado("b.shp", self.carpeta))
+        self.assertIsNotNone(diario.completado("b.shp"))
+
+    def test_confirmacion_por_lotes(self):
+        """Las anotaciones se confirman cada 'por_lote' elementos, no una a una."""
+        diario = self.abrir(reanudar=False, por_lote=2, intervalo=3600)
+        diario.registrar("a.shp")
+        self.assertEqual(self.abrir().completados(), {})
+        diario.registrar("b.shp")
+        self.assertEqual(sorted(self.abrir().completados()), ["a.shp", "b.shp"])
+        diario.registrar("c.shp")
+        diario.confirmar()
+        self.assertIn("c.shp", self.abrir().completados())
+
+    def test_vaciar_y_olvidar(self):
+        diario = self.abrir(reanudar=False)
+        for clave in ("a.shp", "b.shp", "c.shp"):
+            diario.registrar(clave)
+        diario.cerrar()
+        diario = self.abrir()
+        diario.olvidar("a.shp")
+        self.assertEqual(sorted(diario.completados()), ["b.shp", "c.shp"])
+        diario.vaciar()
+        self.assertFalse(diario.reanudado)
+        self.assertEqual(diario.completados(), {})
+
+    def test_cerrar_terminado_elimina_el_diario(self):
+        diario = self.abrir(reanudar=False)
+        diario.registrar("a.shp")
+        diario.cerrar(terminado=True)
+        self.assertFalse(self.ruta.exists())
+        diario.cerrar(terminado=True)
+
+    def test_diario_inaccesible(self):
+        """Si el diario no se puede abrir queda desactivado y no interrumpe la ejecución."""
+        diario = DiarioReanudacion(self.carpeta / "no_existe" / "_reanudar.sqlite", self.PARAMETROS, True)
+        self.assertIsNotNone(diario.error)
+        diario.registrar("a.shp")
+        diario.confirmar()
+        self.assertEqual(diario.completados(), {})
+        self.assertIsNone(diario.completado("a.shp"))
+        diario.cerrar(terminado=True)
+
+    def test_error_de_lectura(self):
+        diario = self.abrir(reanudar=False)
+        diario.con.execute("DROP TABLE completados")
+        self.assertIsNone(diario.completado("a.shp"))
+        self.assertIsNotNone(diario.error)
+        self.assertEqual(diario.completados(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
 # coding=utf-8
 """Common functionality used by regression tests."""
 
+import importlib
+import os
 import sys
 import logging
 
@@ -12,6 +14,24 @@ PARENT = None
 IFACE = None
 
 
+def get_plugin_module(name):
+    """Import a module of this plugin as part of the plugin package.
+
+    The plugin modules use relative imports, so they cannot be imported as
+    top-level modules from the test folder.
+
+    :param name: Module name inside the plugin, e.g. 'gpkg_utils'.
+    :type name: str
+
+    :returns: The imported module.
+    """
+    plugin_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parent_dir = os.path.dirname(plugin_dir)
+    if parent_dir not in sys.path:
+        sys.path.insert(0, parent_dir)
+    return importlib.import_module('%s.%s' % (os.path.basename(plugin_dir), name))
+
+
 def get_qgis_app():
     """ Start one QGIS application to test against.
 